@@ -0,0 +1,486 @@
+"""
+EV Controller - Asyncio Runtime
+Protocol, controller and terminal UI driven by a single asyncio event loop
+"""
+
+import asyncio
+import time
+import sys
+from typing import AsyncIterator, Dict, List, Optional, Any, Union
+
+from ev_instrumentation import FrameTracer, LatencyHistogram, MetricsRegistry, MetricsServer, RxStats
+from ev_transport import WireCapture, open_transport
+from ev_protocol import MessageFraming, MessageType
+from ev_controller import ConfigManager, EVControllerBase
+from ev_terminal import TerminalInterface
+
+
+# ============================================================================
+# ASYNCIO RUNTIME
+# ============================================================================
+
+class AsyncPendingRequest:
+    """Outstanding command for AsyncEVProtocol, completed through a Future"""
+    
+    def __init__(self, request_id: int, command: str, future: asyncio.Future):
+        self.id = request_id
+        self.command = command
+        self.future = future
+        self.sent_ns = time.perf_counter_ns()
+
+
+class AsyncEVProtocol(MessageFraming):
+    """asyncio protocol handler: no receive thread, no queues between threads
+    
+    The port's file descriptor is registered with loop.add_reader(), so frames
+    are decoded and dispatched inside the event loop as soon as bytes arrive.
+    send_command() is awaited for its ACK/NACK and telemetry is consumed with
+    `async for msg in protocol.telemetry()`.
+    """
+    
+    TELEMETRY_QUEUE_SIZE = 64
+    
+    def __init__(self, port: Union[str, Any], baudrate: int = 115200,
+                 capture: Optional['WireCapture'] = None):
+        if isinstance(port, str):
+            self.serial = open_transport(port, baudrate, timeout=0)
+        else:
+            self.serial = port  # already-open serial.Serial, Transport or stand-in (e.g. ReplaySource)
+            self.serial.timeout = 0
+        self._init_framing()
+        self.decoder.binary = getattr(self.serial, 'binary_rx', False)
+        self.capture = capture
+        self.callbacks = {}
+        self.rx_stats = RxStats()
+        self.ack_latency = LatencyHistogram()
+        self.tracer: Optional[FrameTracer] = None  # see enable_tracing()
+        self.running = False
+        self._loop = None
+        self._reader_fd = None
+        self._reader_task = None
+        self._pending: Dict[int, AsyncPendingRequest] = {}
+        self._next_request_id = 1
+        self._telemetry_queues: List[asyncio.Queue] = []
+        self.metrics = MetricsRegistry()
+        self._register_link_metrics(self.metrics)
+    
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self.running = True
+        self.rx_stats = RxStats()
+        self.decoder.reset()
+        try:
+            fd = self.serial.fileno()
+            self._loop.add_reader(fd, self._on_readable)
+            self._reader_fd = fd
+        except (AttributeError, NotImplementedError, OSError, ValueError):
+            # Loop can't watch this port (e.g. Windows): blocking reads in a worker thread
+            self.serial.timeout = 0.1
+            self._reader_task = asyncio.create_task(self._threaded_reader())
+    
+    async def stop(self):
+        self.running = False
+        if self._reader_fd is not None:
+            self._loop.remove_reader(self._reader_fd)
+            self._reader_fd = None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        for pending in self._pending.values():
+            pending.future.cancel()
+        self._pending.clear()
+        self.serial.close()
+        if self.capture is not None:
+            self.capture.close()
+    
+    def _on_readable(self):
+        self.rx_stats.wakeups += 1
+        try:
+            data = self.serial.read(self.serial.in_waiting or 1)
+        except OSError as e:  # serial.SerialException included
+            print(f"Protocol RX Error: {e}")
+            return
+        if data:
+            self._feed(data)
+        else:
+            self.rx_stats.idle_wakeups += 1
+    
+    async def _threaded_reader(self):
+        while self.running:
+            data = await self._loop.run_in_executor(None, self.serial.read, 256)
+            self.rx_stats.wakeups += 1
+            if data:
+                self._feed(data)
+    
+    def _feed(self, data: bytes):
+        read_ns = time.perf_counter_ns()
+        self.rx_stats.bytes += len(data)
+        if self.capture is not None:
+            self.capture.record(WireCapture.RX, data)
+        frames = self.decoder.feed(data)
+        tracer = self.tracer
+        if tracer is not None:
+            framed_ns = time.perf_counter_ns()
+        for frame in frames:
+            parsed = self._parse_frame(frame)
+            if parsed:
+                if tracer is not None:
+                    tracer.begin(parsed, read_ns, framed_ns)
+                self._dispatch(parsed)
+                self.rx_stats.frames += 1
+                self.rx_stats.delivery_latency.record(time.perf_counter_ns() - read_ns)
+            else:
+                self.rx_stats.parse_errors += 1
+    
+    def _dispatch(self, parsed_msg: Dict[str, Any]):
+        msg_type = parsed_msg['type']
+        if self.tracer is not None and 'trace' in parsed_msg:
+            self.tracer.stamp(parsed_msg['trace'], FrameTracer.DISPATCHED)
+        if msg_type == 'ACK' or msg_type == 'NACK':
+            pending = self._pop_pending(parsed_msg)
+            if pending is not None and not pending.future.done():
+                self.ack_latency.record(time.perf_counter_ns() - pending.sent_ns)
+                pending.future.set_result(parsed_msg)
+        elif msg_type == 'DATA':
+            for telemetry_queue in self._telemetry_queues:
+                if telemetry_queue.full():
+                    telemetry_queue.get_nowait()  # slow consumer: keep the newest samples
+                telemetry_queue.put_nowait(parsed_msg)
+        
+        callback = self.callbacks.get(msg_type)
+        if callback:
+            try:
+                result = callback(parsed_msg)
+                if asyncio.iscoroutine(result):
+                    self._loop.create_task(result)
+            except Exception as e:
+                print(f"Callback error for {msg_type}: {e}")
+    
+    def register_callback(self, msg_type: str, callback):
+        """Plain functions run inline in the loop; coroutine functions are scheduled as tasks"""
+        self.callbacks[msg_type] = callback
+    
+    def enable_tracing(self, sample_every: int = 1) -> FrameTracer:
+        """Stamp received frames with per-stage times; 'dispatched' is the hand-off in the loop"""
+        if self.tracer is None:
+            self.tracer = FrameTracer(sample_every)
+        return self.tracer
+    
+    def disable_tracing(self):
+        self.tracer = None
+    
+    def send_message(self, msg_type: MessageType, params: Optional[Dict[str, Any]] = None) -> bool:
+        try:
+            data = self._encode_message(msg_type.value, params)
+            self.serial.write(data)
+            if self.capture is not None:
+                self.capture.record(WireCapture.TX, data)
+            return True
+        except Exception as e:
+            print(f"Protocol TX Error: {e}")
+            return False
+    
+    async def send_command(self, msg_type: MessageType, params: Optional[Dict[str, Any]] = None,
+                           timeout: float = 0.5) -> Optional[Dict[str, Any]]:
+        """Send a command and await its ACK/NACK message (None on timeout)
+        
+        Concurrent send_command() calls are pipelined; each is matched to its
+        response by request ID.
+        """
+        request_id = self._next_request_id
+        self._next_request_id = request_id % 0xFFFF + 1
+        pending = AsyncPendingRequest(request_id, msg_type.value, self._loop.create_future())
+        self._pending[request_id] = pending
+        
+        params = dict(params) if params else {}
+        params['ID'] = request_id
+        try:
+            if not self.send_message(msg_type, params):
+                return None
+            return await asyncio.wait_for(pending.future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._pending.pop(request_id, None)
+    
+    async def request(self, msg_type: MessageType, params: Optional[Dict[str, Any]] = None,
+                      timeout: float = 0.5) -> bool:
+        """True if the command was ACKed"""
+        response = await self.send_command(msg_type, params, timeout)
+        return response is not None and response['type'] == 'ACK'
+    
+    async def telemetry(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yield DATA messages as they arrive (oldest dropped if the consumer lags)"""
+        telemetry_queue = asyncio.Queue(maxsize=self.TELEMETRY_QUEUE_SIZE)
+        self._telemetry_queues.append(telemetry_queue)
+        try:
+            while True:
+                yield await telemetry_queue.get()
+        finally:
+            self._telemetry_queues.remove(telemetry_queue)
+    
+    async def negotiate_framing(self, binary: bool, timeout: float = 0.5) -> bool:
+        mode = 'BIN' if binary else 'ASCII'
+        was_binary = self.decoder.binary
+        self.decoder.binary = was_binary or binary
+        if await self.request(MessageType.SET_MODE, {'MODE': mode}, timeout=timeout):
+            self.tx_binary = self.decoder.binary = binary
+            return True
+        self.decoder.binary = was_binary
+        return False
+    
+    async def subscribe_telemetry(self, rate_hz: float, timeout: float = 0.5) -> Optional[bool]:
+        """True once ACKed, False if NACKed, None if no answer came back in time"""
+        response = await self.send_command(MessageType.SUBSCRIBE, {'RATE': rate_hz}, timeout)
+        if response is None:
+            return None
+        return response['type'] == 'ACK'
+    
+    async def unsubscribe_telemetry(self, timeout: float = 0.5) -> bool:
+        return await self.request(MessageType.UNSUBSCRIBE, timeout=timeout)
+    
+    def get_rx_stats(self) -> Dict[str, Any]:
+        stats = self.rx_stats.summary()
+        stats['rx_mode'] = 'asyncio-reader' if self._reader_fd is not None else 'asyncio-thread'
+        stats['decoder'] = self.decoder.stats()
+        stats['codec'] = self.codec.stats()
+        stats['tx_binary'] = self.tx_binary
+        stats['pending_requests'] = len(self._pending)
+        stats['ack_latency'] = self.ack_latency.summary()
+        return stats
+
+
+class AsyncEVController(EVControllerBase):
+    """EV controller driven entirely by one asyncio event loop"""
+    
+    def __init__(self, port: Union[str, Any], baudrate: int = 115200, capture: Optional[str] = None,
+                 config: Optional[ConfigManager] = None, log_dir: str = "logs"):
+        self.protocol = AsyncEVProtocol(port, baudrate, capture=WireCapture(capture) if capture else None)
+        super().__init__(config, log_dir)
+        self.running = False
+        self._tasks = []
+    
+    async def start(self):
+        self.protocol.register_callback('FAULT', self._handle_fault)
+        self.protocol.register_callback('ACK', self._handle_ack)
+        self.protocol.register_callback('NACK', self._handle_nack)
+        await self.protocol.start()
+        
+        if self.config.get('binary_framing'):
+            if await self.protocol.negotiate_framing(binary=True):
+                print("📦 Binary framing enabled")
+            else:
+                print("⚠️  STM32 declined binary framing, staying on ASCII")
+        
+        self.running = True
+        self._tasks = [
+            asyncio.create_task(self._telemetry_consumer()),
+            asyncio.create_task(self._telemetry_requester()),
+        ]
+        print("✅ EV Controller initialized (asyncio)")
+    
+    async def _telemetry_consumer(self):
+        async for msg in self.protocol.telemetry():
+            self._handle_telemetry(msg)
+    
+    async def _telemetry_requester(self):
+        """Subscribe to pushed telemetry, or poll if the STM32 can't stream"""
+        interval = self.config.get('telemetry_interval', 0.5)
+        rate = self.config.get('telemetry_rate_hz', 10.0)
+        stale_after = max(1.0, 5.0 / rate)
+        stream = bool(self.config.get('telemetry_stream', True))
+        streamed = False
+        backoff = retry_in = 0.0
+        
+        while self.running:
+            if stream and not self.subscribed and retry_in <= 0:
+                acked = await self.protocol.subscribe_telemetry(rate)
+                if acked:
+                    self.subscribed = streamed = True
+                    backoff = 0.0
+                    last_frames = -1
+                    print(f"📡 Telemetry streaming at {rate} Hz")
+                elif acked is False and not streamed:
+                    stream = False
+                    print("⚠️  STM32 declined telemetry streaming, polling instead")
+                else:
+                    backoff = retry_in = self._subscribe_backoff(backoff)
+                    print(f"⚠️  Telemetry subscribe failed, polling and retrying in {backoff:.0f}s")
+            
+            if self.subscribed:
+                # Counted on the receive path, so a slow handler can't look like a stall
+                frames = self.protocol.rx_stats.frames
+                if frames == last_frames:
+                    print("⚠️  Telemetry stream stalled, resubscribing")
+                    self.subscribed = False
+                    continue
+                last_frames = frames
+                await asyncio.sleep(stale_after)
+            else:
+                self.protocol.send_message(MessageType.GET_TELEMETRY)
+                await asyncio.sleep(interval)
+                retry_in -= interval
+    
+    async def set_max_throttle(self, max_throttle: int) -> bool:
+        """Set maximum throttle limit (0-100%) - safety override"""
+        max_throttle = max(0, min(100, max_throttle))
+        if await self.protocol.request(MessageType.SET_MAX_CURRENT, {'MAX_THROTTLE': max_throttle}, timeout=0.5):
+            self.config.set('max_throttle', max_throttle)
+            return True
+        return False
+    
+    async def set_current_limit(self, current: float) -> bool:
+        """Set current limit in Amps"""
+        if await self.protocol.request(MessageType.SET_CURRENT_LIMIT, {'LIMIT': current}, timeout=0.5):
+            self.config.set('current_limit', current)
+            return True
+        return False
+    
+    def emergency_stop(self) -> bool:
+        """Trigger emergency stop (written immediately, no ACK wait)"""
+        return self.protocol.send_message(MessageType.EMERGENCY_STOP)
+    
+    async def reset_faults(self) -> bool:
+        """Reset all faults"""
+        if await self.protocol.request(MessageType.RESET_FAULT, timeout=0.5):
+            self._clear_faults()
+            return True
+        return False
+    
+    async def shutdown(self):
+        """Clean shutdown"""
+        print("\n🔌 Shutting down controller...")
+        self.running = False
+        for task in self._tasks:
+            task.cancel()
+        if self.subscribed:
+            await self.protocol.unsubscribe_telemetry()
+            self.subscribed = False
+        self.emergency_stop()
+        await asyncio.sleep(0.5)
+        self.logger.close()
+        if self.blackbox:
+            self.blackbox.close()
+        self.config.save_config()
+        await self.protocol.stop()
+        print("👋 Shutdown complete")
+
+
+class AsyncTerminalInterface(TerminalInterface):
+    """Terminal UI on the controller's event loop (stdin watched with add_reader)"""
+    
+    lines: Optional[asyncio.Queue] = None  # stdin lines, set up by run()
+    
+    async def run(self):
+        """Main interface loop"""
+        loop = asyncio.get_running_loop()
+        self.clear_screen()
+        self.print_header()
+        self.print_menu()
+        
+        print("\n💡 Waiting for STM32 connection...")
+        
+        start = time.monotonic()
+        while not self.controller.connected and time.monotonic() - start < 10:
+            await asyncio.sleep(0.1)
+        
+        if not self.controller.connected:
+            print("⚠️  Warning: STM32 not responding. Check connection.")
+            print("   Continuing anyway - commands will be sent but may not be confirmed.")
+        else:
+            print("✅ Connected to STM32!")
+        
+        await asyncio.sleep(1)
+        self.refresh()
+        
+        self.lines = lines = asyncio.Queue()
+        loop.add_reader(sys.stdin.fileno(), lambda: lines.put_nowait(sys.stdin.readline()))
+        try:
+            while self.running:
+                print("\n> ", end='', flush=True)
+                line = await lines.get()
+                if not line:
+                    break  # EOF
+                
+                await self.handle_command_async(line.strip().lower())
+                
+                if self.running:
+                    await asyncio.sleep(0.5)
+                    self.refresh()
+        except asyncio.CancelledError:
+            print("\n\n⏹️  Interrupted by user")
+        finally:
+            loop.remove_reader(sys.stdin.fileno())
+            await self.controller.shutdown()
+    
+    def refresh(self):
+        self.clear_screen()
+        self.print_header()
+        self.print_status()
+        self.print_menu()
+    
+    async def handle_command_async(self, command: str):
+        """Commands that wait for an ACK are awaited; the rest reuse handle_command()"""
+        parts = command.split()
+        if not parts:
+            return
+        
+        cmd = parts[0]
+        try:
+            if cmd == 'm' and len(parts) >= 2:
+                max_throttle = int(parts[1])
+                if await self.controller.set_max_throttle(max_throttle):
+                    print(f"✅ Max throttle limit set to {max_throttle}%")
+                else:
+                    print("❌ Failed to set max throttle")
+            
+            elif cmd == 'c' and len(parts) >= 2:
+                current = float(parts[1])
+                if await self.controller.set_current_limit(current):
+                    print(f"✅ Current limit set to {current}A")
+                else:
+                    print("❌ Failed to set current limit")
+            
+            elif cmd == 'f':
+                if await self.controller.reset_faults():
+                    print("✅ Faults reset")
+                else:
+                    print("❌ Failed to reset faults")
+            
+            elif cmd == 't':
+                self.toggle_tracing()
+                print("\nPress Enter to continue...", end='', flush=True)
+                await self.lines.get()  # not input(): the loop keeps running meanwhile
+            
+            else:
+                self.handle_command(command)
+        
+        except ValueError:
+            print(f"❌ Invalid value. Check your input.")
+
+
+async def run_async(port: str, baudrate: int, capture: Optional[str] = None,
+                    metrics_listen: Optional[str] = None):
+    """Run controller and terminal UI on the current event loop"""
+    controller = AsyncEVController(port, baudrate, capture=capture)
+    metrics_server = start_metrics_server(controller, metrics_listen)
+    try:
+        await controller.start()
+        await AsyncTerminalInterface(controller).run()
+    finally:
+        if metrics_server:
+            metrics_server.stop()
+
+
+def start_metrics_server(controller: EVControllerBase, listen: Optional[str]) -> Optional[MetricsServer]:
+    """Serve the controller's metrics on --metrics / metrics_listen, if set"""
+    listen = listen or controller.config.get('metrics_listen')
+    if not listen:
+        return None
+    try:
+        server = MetricsServer(controller.metrics, str(listen))
+    except OSError as e:
+        print(f"⚠️  Metrics endpoint unavailable ({listen}): {e}")
+        return None
+    print(f"📈 Metrics at {server.address}")
+    return server
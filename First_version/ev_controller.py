@@ -0,0 +1,393 @@
+"""
+EV Controller - Controller
+Configuration and the threaded EV controller
+"""
+
+import abc
+import time
+import os
+import threading
+import json
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Optional, Any, Union
+
+from ev_instrumentation import FrameTracer, MetricsRegistry
+from ev_transport import VirtualClock, WireCapture
+from ev_protocol import EVProtocol, MessageType, SetpointCommander, SetpointHandle, TelemetrySample
+from ev_logging import BlackBoxRecorder, DataLogger
+from ev_safety import SafetyEngine
+
+
+# ============================================================================
+# CONFIGURATION MANAGER
+# ============================================================================
+
+class ConfigManager:
+    """Manages system configuration"""
+    
+    def __init__(self, config_file: str = "ev_config.json"):
+        self.config_file = config_file
+        self.config = self.load_config()
+    
+    def load_config(self) -> Dict[str, Any]:
+        """Load configuration from file"""
+        default_config = {
+            "max_current": 50.0,
+            "current_limit": 50.0,
+            "max_throttle": 100,
+            "telemetry_interval": 0.5,
+            "telemetry_stream": True,
+            "telemetry_rate_hz": 10.0,
+            "overheat_threshold": 80.0,
+            "low_battery_threshold": 15.0,
+            "emergency_stop_on_fault": True,
+            "fault_fast_path": True,
+            "setpoint_rate_hz": 10.0,
+            "binary_framing": False,
+            "log_batch_size": 64,
+            "log_flush_interval": 0.25,
+            "log_fsync_interval": 1.0,
+            "log_format": "csv",
+            "log_chunk_rows": 1024,
+            "log_rotate_mb": 64,
+            "log_rotate_minutes": 30,
+            "log_compression": "gzip",
+            "blackbox_enabled": True,
+            "blackbox_minutes": 5.0,
+            "blackbox_rate_hz": 10.0,
+            "metrics_listen": None,
+            "trace_frames": False,
+            "trace_sample_every": 1
+        }
+        
+        if os.path.exists(self.config_file):
+            try:
+                with open(self.config_file, 'r') as f:
+                    loaded = json.load(f)
+                    default_config.update(loaded)
+                    print(f"⚙️  Configuration loaded from {self.config_file}")
+            except Exception as e:
+                print(f"⚠️  Error loading config: {e}, using defaults")
+        else:
+            self.save_config(default_config)
+        
+        return default_config
+    
+    def save_config(self, config: Dict[str, Any] = None):
+        """Save configuration to file"""
+        if config:
+            self.config = config
+        
+        try:
+            with open(self.config_file, 'w') as f:
+                json.dump(self.config, f, indent=4)
+            print(f"⚙️  Configuration saved to {self.config_file}")
+        except Exception as e:
+            print(f"⚠️  Error saving config: {e}")
+    
+    def get(self, key: str, default=None):
+        return self.config.get(key, default)
+    
+    def view(self):
+        """Read-only live view of the configuration (no copy)"""
+        return MappingProxyType(self.config)
+    
+    def set(self, key: str, value: Any):
+        self.config[key] = value
+
+
+# ============================================================================
+# MAIN CONTROLLER
+# ============================================================================
+
+class EVControllerBase(abc.ABC):
+    """Controller state and message handlers shared by the threaded and asyncio controllers
+    
+    Subclasses own the protocol and provide emergency_stop(). config defaults
+    to ev_config.json in the working directory; session logs and the black
+    box go under log_dir.
+    """
+    
+    def __init__(self, config: Optional[ConfigManager] = None, log_dir: str = "logs"):
+        self.config = config if config is not None else ConfigManager()
+        self.logger = DataLogger.from_config(self.config, log_dir=log_dir)
+        self.blackbox = None
+        if self.config.get('blackbox_enabled', True):
+            self.blackbox = BlackBoxRecorder(
+                log_dir=log_dir,
+                minutes=self.config.get('blackbox_minutes', 5.0),
+                rate_hz=self.config.get('blackbox_rate_hz', 10.0)
+            )
+        
+        self.safety = SafetyEngine.from_config(self.config)
+        
+        # State
+        self.telemetry = TelemetrySample()  # latest immutable snapshot, shared with readers
+        # Latched faults: a frozenset replaced (never mutated) under _fault_lock, so
+        # readers on other threads can iterate whatever snapshot they picked up
+        self.faults: FrozenSet[str] = frozenset()
+        self._fault_lock = threading.Lock()  # also serialises safety.evaluate() / reset()
+        self.connected = False
+        self.last_telemetry_request = 0
+        self.subscribed = False  # STM32 is pushing telemetry, no GET_TELEM polling
+        
+        self.metrics = MetricsRegistry()
+        self.metrics.gauge('ev_connected', "1 once telemetry has been received", fn=lambda: int(self.connected))
+        self.metrics.gauge('ev_subscribed', "1 while the STM32 streams telemetry", fn=lambda: int(self.subscribed))
+        self.metrics.gauge('ev_faults_active', "Faults latched until reset", fn=lambda: len(self.faults))
+        self._samples_handled = self.metrics.counter('ev_telemetry_samples_total',
+                                                     "Telemetry messages handled by the controller")
+        self._safety_trips = self.metrics.counter('ev_safety_trips_total', "Safety rule trips")
+        self.metrics.include(self.protocol.metrics, self.logger.metrics)
+        self.tracer: Optional[FrameTracer] = None
+        if self.config.get('trace_frames'):
+            self.enable_tracing(self.config.get('trace_sample_every', 1))
+    
+    @abc.abstractmethod
+    def emergency_stop(self) -> bool:
+        """Send ESTOP now (no ACK wait); True if it was written"""
+    
+    # Telemetry resubscribe backoff after a failed SUBSCRIBE (polling meanwhile)
+    SUBSCRIBE_RETRY = 1.0
+    SUBSCRIBE_RETRY_MAX = 30.0
+    
+    def _subscribe_backoff(self, previous: float) -> float:
+        """Seconds to poll before the next SUBSCRIBE attempt (doubles up to SUBSCRIBE_RETRY_MAX)"""
+        return min(self.SUBSCRIBE_RETRY_MAX, max(self.SUBSCRIBE_RETRY, previous * 2))
+    
+    def enable_tracing(self, sample_every: int = 1) -> FrameTracer:
+        """Trace frames from the port read through handling and logging"""
+        if self.tracer is None:
+            self.tracer = self.protocol.enable_tracing(sample_every)
+            self.logger.tracer = self.tracer
+            self.tracer.register_metrics(self.metrics)
+        return self.tracer
+    
+    def _handle_telemetry(self, msg):
+        """Handle incoming telemetry data"""
+        data = msg['data']
+        if isinstance(data, TelemetrySample):
+            self.telemetry = data
+        else:
+            # Partial frame (e.g. GET_TEMP reply): fold into the previous snapshot
+            self.telemetry = self.telemetry.merge(data, msg['timestamp'])
+        self.connected = True
+        self._samples_handled.inc()
+        if self.blackbox:
+            self.blackbox.record(self.telemetry)
+        
+        trace = msg.get('trace') if self.tracer is not None else None
+        
+        # Log data if enabled
+        if self.logger.logging_enabled:
+            throttle = self.telemetry.get('THROTTLE', 0)
+            self.logger.log_data(self.telemetry, throttle, trace)
+        
+        # Check for critical conditions
+        self._check_safety_conditions()
+        if trace is not None:
+            self.tracer.stamp(trace, FrameTracer.HANDLED)
+    
+    def _handle_fault(self, msg):
+        """Handle fault messages"""
+        fault = msg['data'].get('FAULT', 'UNKNOWN')
+        if self._latch_fault(fault):
+            print(f"\n⚠️  FAULT DETECTED: {fault}")
+            if self.blackbox:
+                self.blackbox.freeze(fault)
+            
+            if self.config.get('emergency_stop_on_fault'):
+                if msg.get('estop_sent'):
+                    print("🛑 Emergency stop already sent by the fault fast path")
+                else:
+                    print("🛑 Auto emergency stop triggered!")
+                    self.emergency_stop()
+    
+    def _handle_ack(self, msg):
+        """Handle ACK messages"""
+        pass  # Already matched to its PendingRequest by the protocol
+    
+    def _handle_nack(self, msg):
+        """Handle NACK messages"""
+        cmd = msg['data'].get('CMD', 'UNKNOWN')
+        reason = msg['data'].get('REASON', 'UNKNOWN')
+        print(f"❌ NACK received: {cmd} - {reason}")
+    
+    def _latch_fault(self, name: str) -> bool:
+        """Add a fault; False if it was already latched"""
+        with self._fault_lock:
+            if name in self.faults:
+                return False
+            self.faults = self.faults | {name}
+            return True
+    
+    def _clear_faults(self):
+        """Forget latched faults and re-arm the safety rules (after the STM32 ACKs RESET_FAULT)"""
+        with self._fault_lock:
+            self.faults = frozenset()
+            self.safety.reset()
+    
+    def _check_safety_conditions(self):
+        """Check for dangerous conditions"""
+        with self._fault_lock:
+            tripped = self.safety.evaluate(self.telemetry)
+            if not tripped:
+                return
+            rules = self.safety.tripped_rules(tripped)
+            latched, warnings = self.faults, []
+            for rule in rules:
+                warnings.append(None if rule.name in latched else self.safety.describe(rule))
+                latched = latched | {rule.name}
+            self.faults = latched
+        for rule, warning in zip(rules, warnings):
+            self._safety_trips.inc()
+            if warning is not None:
+                print(f"\n⚠️  WARNING: {warning}")
+            if rule.estop:
+                print("🛑 Safety rule emergency stop triggered!")
+                self.emergency_stop()
+    
+    def get_telemetry(self) -> TelemetrySample:
+        """Get latest telemetry snapshot (immutable, safe to share)"""
+        return self.telemetry
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get complete system status"""
+        return {
+            'connected': self.connected,
+            'faults': tuple(sorted(self.faults)),
+            'telemetry': self.telemetry,
+            'config': self.config.view()
+        }
+
+
+class EVController(EVControllerBase):
+    """Main EV controller with all functionality"""
+    
+    def __init__(self, port: Union[str, Any], baudrate: int = 115200, capture: Optional[str] = None,
+                 clock: Optional[VirtualClock] = None, config: Optional[ConfigManager] = None,
+                 log_dir: str = "logs"):
+        self.clock = clock
+        self.protocol = EVProtocol(port, baudrate, capture=WireCapture(capture) if capture else None,
+                                   clock=clock)
+        super().__init__(config, log_dir)
+        self.protocol.estop_on_fault = bool(self.config.get('emergency_stop_on_fault') and
+                                            self.config.get('fault_fast_path', True))
+        
+        # Limit changes are coalesced and rate-limited per command type
+        setpoint_rate = self.config.get('setpoint_rate_hz', 10.0)
+        self.setpoints = SetpointCommander(self.protocol)
+        self.setpoints.add_channel('max_throttle', MessageType.SET_MAX_CURRENT, 'MAX_THROTTLE', setpoint_rate,
+                                   on_ack=lambda value: self.config.set('max_throttle', value))
+        self.setpoints.add_channel('current_limit', MessageType.SET_CURRENT_LIMIT, 'LIMIT', setpoint_rate,
+                                   on_ack=lambda value: self.config.set('current_limit', value))
+        self.setpoints.register_metrics(self.metrics)
+        
+        # Register callbacks
+        self.protocol.register_callback('DATA', self._handle_telemetry)
+        self.protocol.register_callback('FAULT', self._handle_fault)
+        self.protocol.register_callback('ACK', self._handle_ack)
+        self.protocol.register_callback('NACK', self._handle_nack)
+        
+        # Start protocol
+        self.protocol.start()
+        if self.config.get('binary_framing'):
+            if self.protocol.negotiate_framing(binary=True):
+                print("📦 Binary framing enabled")
+            else:
+                print("⚠️  STM32 declined binary framing, staying on ASCII")
+        
+        # Start telemetry request loop
+        self.running = True
+        self.telemetry_thread = threading.Thread(target=self._telemetry_loop, name='ev-telemetry', daemon=True)
+        self.telemetry_thread.start()
+        
+        print("✅ EV Controller initialized")
+    
+    def _telemetry_loop(self):
+        """Background thread: subscribe to pushed telemetry, or poll if the STM32 can't stream"""
+        interval = self.config.get('telemetry_interval', 0.5)
+        rate = self.config.get('telemetry_rate_hz', 10.0)
+        # Stream counts as lost after this long without any frame (e.g. STM32 reset)
+        stale_after = max(1.0, 5.0 / rate)
+        stream = bool(self.config.get('telemetry_stream', True))
+        streamed = False
+        backoff = retry_in = 0.0
+        
+        while self.running:
+            if stream and not self.subscribed and retry_in <= 0:
+                acked = self.protocol.subscribe_telemetry(rate)
+                if acked:
+                    self.subscribed = streamed = True
+                    backoff = 0.0
+                    last_frames = -1
+                    print(f"📡 Telemetry streaming at {rate} Hz")
+                elif acked is False and not streamed:
+                    stream = False
+                    print("⚠️  STM32 declined telemetry streaming, polling instead")
+                else:
+                    backoff = retry_in = self._subscribe_backoff(backoff)
+                    print(f"⚠️  Telemetry subscribe failed, polling and retrying in {backoff:.0f}s")
+            
+            if self.subscribed:
+                # Counted on the receive path, so a slow handler can't look like a stall
+                frames = self.protocol.rx_stats.frames
+                if frames == last_frames:
+                    print("⚠️  Telemetry stream stalled, resubscribing")
+                    self.subscribed = False
+                    continue
+                last_frames = frames
+                self._sleep(stale_after)
+            else:
+                self.protocol.send_message(MessageType.GET_TELEMETRY)
+                self._sleep(interval)
+                retry_in -= interval
+    
+    def _sleep(self, seconds: float):
+        """time.sleep(), or the same span of simulated time with a VirtualClock"""
+        if self.clock is None:
+            time.sleep(seconds)
+            return
+        wake = self.clock() + seconds
+        while self.running and not self.clock.wait_until(wake, timeout=0.1):
+            pass
+    
+    def set_max_throttle(self, max_throttle: int) -> SetpointHandle:
+        """Set maximum throttle limit (0-100%) - safety override
+        
+        Returns immediately; handle.wait() is True once the STM32 ACKs it.
+        """
+        max_throttle = max(0, min(100, max_throttle))
+        return self.setpoints.submit('max_throttle', max_throttle)
+    
+    def set_current_limit(self, current: float) -> SetpointHandle:
+        """Set current limit in Amps (non-blocking, see set_max_throttle)"""
+        return self.setpoints.submit('current_limit', current)
+    
+    def emergency_stop(self) -> bool:
+        """Trigger emergency stop"""
+        return self.protocol.send_message(MessageType.EMERGENCY_STOP)
+    
+    def reset_faults(self) -> bool:
+        """Reset all faults"""
+        if self.protocol.request(MessageType.RESET_FAULT, timeout=0.5):
+            self._clear_faults()
+            return True
+        return False
+    
+    def shutdown(self):
+        """Clean shutdown"""
+        print("\n🔌 Shutting down controller...")
+        self.running = False
+        self.setpoints.stop()
+        if self.subscribed:
+            self.protocol.unsubscribe_telemetry()
+            self.subscribed = False
+        self.emergency_stop()
+        time.sleep(0.5)
+        self.logger.close()
+        if self.blackbox:
+            self.blackbox.close()
+        self.config.save_config()
+        self.protocol.stop()
+        print("👋 Shutdown complete")
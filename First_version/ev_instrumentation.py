@@ -0,0 +1,470 @@
+"""
+EV Controller - Instrumentation
+Latency histograms, frame tracing, the metrics registry / Prometheus endpoint
+and the sampling profiler
+"""
+
+import time
+import sys
+import os
+import threading
+import http.server
+import socketserver
+from typing import Callable, Dict, List, Optional, Any, Tuple
+
+
+# ============================================================================
+# INSTRUMENTATION
+# ============================================================================
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram (HDR-style, ~12% resolution) in nanoseconds"""
+    
+    SUB_BITS = 4
+    SUB_COUNT = 1 << SUB_BITS
+    HALF_COUNT = SUB_COUNT >> 1
+    NUM_BUCKETS = 64 * HALF_COUNT
+    
+    def __init__(self):
+        self.counts = [0] * self.NUM_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+    
+    def _bucket_index(self, value: int) -> int:
+        if value < self.SUB_COUNT:
+            return value
+        shift = value.bit_length() - self.SUB_BITS
+        return (shift + 1) * self.HALF_COUNT + (value >> shift) - self.HALF_COUNT
+    
+    def _bucket_upper(self, index: int) -> int:
+        if index < self.SUB_COUNT:
+            return index
+        shift = index // self.HALF_COUNT - 1
+        top = index % self.HALF_COUNT + self.HALF_COUNT
+        return ((top + 1) << shift) - 1
+    
+    def record(self, value_ns: int):
+        """Record one latency sample"""
+        value = int(value_ns) if value_ns > 0 else 0
+        self.counts[self._bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+    
+    def percentile(self, pct: float) -> int:
+        """Upper bound (ns) of the bucket holding the given percentile"""
+        if self.count == 0:
+            return 0
+        target = max(1, int(round(self.count * pct / 100.0)))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return min(self._bucket_upper(index), self.max)
+        return self.max
+    
+    def reset(self):
+        self.counts = [0] * self.NUM_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+    
+    def summary(self) -> Dict[str, float]:
+        """Summary in microseconds"""
+        if self.count == 0:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'min_us': self.min / 1e3,
+            'mean_us': self.total / self.count / 1e3,
+            'p50_us': self.percentile(50) / 1e3,
+            'p90_us': self.percentile(90) / 1e3,
+            'p99_us': self.percentile(99) / 1e3,
+            'max_us': self.max / 1e3
+        }
+
+
+class RxStats:
+    """Receive path counters: wake-ups, bytes, frames and delivery latency"""
+    
+    def __init__(self):
+        self.started = time.monotonic()
+        self.wakeups = 0
+        self.idle_wakeups = 0
+        self.bytes = 0
+        self.frames = 0
+        self.parse_errors = 0
+        # Time from the read that completed a frame to its hand-off (rx queue + dispatch ring)
+        self.delivery_latency = LatencyHistogram()
+    
+    def summary(self) -> Dict[str, Any]:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            'elapsed_s': elapsed,
+            'wakeups': self.wakeups,
+            'idle_wakeups': self.idle_wakeups,
+            'wakeups_per_s': self.wakeups / elapsed,
+            'bytes': self.bytes,
+            'frames': self.frames,
+            'parse_errors': self.parse_errors,
+            'delivery_latency': self.delivery_latency.summary()
+        }
+
+
+class FrameTracer:
+    """Per-frame latency trace through the receive pipeline
+    
+    A traced message carries msg['trace'], a list with one perf_counter_ns
+    stamp per STAGE. Each stage is recorded twice: time since its parent
+    stage (where the time goes) and time since the read (what a consumer
+    sees). 'handled' is after the controller's handler, safety checks
+    included; 'logged' is after the DataLogger writer wrote the row.
+    With sample_every=N only every Nth frame is traced.
+    """
+    
+    STAGES = ('read', 'framed', 'parsed', 'dispatched', 'handled', 'logged')
+    READ, FRAMED, PARSED, DISPATCHED, HANDLED, LOGGED = range(6)
+    PARENTS = (0, 0, 1, 2, 3, 3)
+    
+    def __init__(self, sample_every: int = 1):
+        self.sample_every = max(1, int(sample_every))
+        self._countdown = 1
+        self.traced = 0
+        self.stage_latency = [LatencyHistogram() for _ in self.STAGES]
+        self.since_read = [LatencyHistogram() for _ in self.STAGES]
+    
+    def begin(self, parsed_msg: Dict[str, Any], read_ns: int, framed_ns: int):
+        """Attach a trace to a freshly parsed message (receive thread)"""
+        self._countdown -= 1
+        if self._countdown:
+            return
+        self._countdown = self.sample_every
+        trace = [read_ns, framed_ns, 0, 0, 0, 0]
+        parsed_msg['trace'] = trace
+        self.traced += 1
+        self.stage_latency[self.FRAMED].record(framed_ns - read_ns)
+        self.since_read[self.FRAMED].record(framed_ns - read_ns)
+        self.stamp(trace, self.PARSED)
+    
+    def stamp(self, trace: List[int], stage: int):
+        now = time.perf_counter_ns()
+        trace[stage] = now
+        self.stage_latency[stage].record(now - trace[self.PARENTS[stage]])
+        self.since_read[stage].record(now - trace[0])
+    
+    def reset(self):
+        self.traced = 0
+        for histogram in self.stage_latency + self.since_read:
+            histogram.reset()
+    
+    def register_metrics(self, metrics: 'MetricsRegistry'):
+        for stage, name in enumerate(self.STAGES[1:], 1):
+            labels = {'stage': name}
+            metrics.histogram('ev_trace_stage_seconds', "Traced frames: time since the previous stage", labels,
+                              fn=lambda s=stage: self.stage_latency[s])
+            metrics.histogram('ev_trace_since_read_seconds', "Traced frames: time since the port read", labels,
+                              fn=lambda s=stage: self.since_read[s])
+    
+    def stats(self) -> Dict[str, Any]:
+        return {name: {'stage': self.stage_latency[stage].summary(),
+                       'since_read': self.since_read[stage].summary()}
+                for stage, name in enumerate(self.STAGES) if stage}
+    
+    def dump(self) -> str:
+        """Per-stage latency table"""
+        lines = [f"Frame trace: {self.traced} frames (1 in {self.sample_every})",
+                 f"  {'stage':<12}{'count':>8}{'p50 us':>10}{'p99 us':>10}{'max us':>10}"
+                 f"{'read->p50':>12}{'read->p99':>12}"]
+        for stage, name in enumerate(self.STAGES):
+            if not stage:
+                continue
+            step = self.stage_latency[stage]
+            total = self.since_read[stage]
+            lines.append(f"  {name:<12}{step.count:>8}{step.percentile(50) / 1e3:>10.1f}"
+                         f"{step.percentile(99) / 1e3:>10.1f}{step.max / 1e3:>10.1f}"
+                         f"{total.percentile(50) / 1e3:>12.1f}{total.percentile(99) / 1e3:>12.1f}")
+        return '\n'.join(lines)
+
+
+class SamplingProfiler:
+    """Low-overhead wall-clock sampling profiler for every thread in the process
+    
+    A daemon thread snapshots sys._current_frames() every interval and counts
+    each thread's stack, rooted at the thread name (so name threads 'ev-*').
+    write() saves them as collapsed stacks ("thread;outer;...;inner count"),
+    the input format of flamegraph.pl, speedscope and inferno. Blocked
+    threads are sampled too, so idle time shows up as its wait frame.
+    """
+    
+    def __init__(self, path: str, rate_hz: float = 100.0):
+        self.path = path
+        self.interval = 1.0 / rate_hz
+        self.counts: Dict[Tuple[str, ...], int] = {}
+        self.samples = 0
+        self.sample_time = 0.0  # sampler thread CPU seconds (profiler overhead)
+        self._labels = {}
+        self._names = {}
+        self._dump = threading.Event()
+        self.running = False
+        self.thread = None
+    
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='ev-profiler', daemon=True)
+        self.thread.start()
+    
+    def stop(self) -> str:
+        """Stop sampling and write the profile"""
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+        return self.write()
+    
+    def request_dump(self, *_):
+        """Signal-safe: ask the sampler thread to write the profile so far"""
+        self._dump.set()
+    
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+    
+    def _sample(self):
+        own = threading.get_ident()
+        names = self._names
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if ident not in names:
+                self._names = names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            stack.reverse()
+            key = tuple(stack)
+            self.counts[key] = self.counts.get(key, 0) + 1
+        self.samples += 1
+    
+    def _run(self):
+        next_sample = time.perf_counter()
+        while self.running:
+            start = time.thread_time()
+            self._sample()
+            self.sample_time += time.thread_time() - start
+            if self._dump.is_set():
+                self._dump.clear()
+                self.write()
+            next_sample += self.interval
+            delay = next_sample - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_sample = time.perf_counter()  # fell behind: don't burst
+    
+    def write(self) -> str:
+        """Write collapsed stacks for everything sampled so far (replaces the file)"""
+        lines = [f"{';'.join(stack)} {count}\n" for stack, count in sorted(dict(self.counts).items())]
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.writelines(lines)
+        os.replace(tmp_path, self.path)
+        overhead = self.sample_time / max(self.samples, 1) * 1e6
+        print(f"🔥 Profile: {self.samples} samples, {len(lines)} stacks -> {self.path} "
+              f"({overhead:.0f} us CPU/sample)")
+        return self.path
+
+
+class Counter:
+    """Monotonic counter; inc() is a single attribute update"""
+    
+    __slots__ = ('value',)
+    
+    def __init__(self):
+        self.value = 0
+    
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+
+class Gauge:
+    """Value that can go up and down"""
+    
+    __slots__ = ('value',)
+    
+    def __init__(self):
+        self.value = 0
+    
+    def set(self, value: float):
+        self.value = value
+
+
+class MetricsRegistry:
+    """Counters, gauges and LatencyHistograms rendered in Prometheus text format
+    
+    Components register what they already count through fn= (read only at
+    scrape time, so the hot path pays nothing) and use Counter/Gauge objects
+    for anything new. Registries nest with include(), which is how the
+    controller exposes its protocol and logger metrics on one endpoint.
+    """
+    
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+    INF_BUCKET = 'le="+Inf"'
+    
+    def __init__(self):
+        self.families: Dict[str, List[Any]] = {}  # name -> [kind, help, [(labels, getter)]]
+        self.children: List['MetricsRegistry'] = []
+    
+    def _add(self, kind: str, name: str, help_text: str, labels: Optional[Dict[str, str]],
+             getter: Callable[[], Any]):
+        family = self.families.setdefault(name, [kind, help_text, []])
+        if family[0] != kind:
+            raise ValueError(f"Metric {name} already registered as a {family[0]}")
+        family[2].append((labels or {}, getter))
+    
+    def counter(self, name: str, help_text: str, labels: Optional[Dict[str, str]] = None,
+                fn: Optional[Callable[[], float]] = None) -> Optional[Counter]:
+        """Register a counter; with fn the value is read from fn() at scrape time"""
+        if fn is not None:
+            self._add('counter', name, help_text, labels, fn)
+            return None
+        counter = Counter()
+        self._add('counter', name, help_text, labels, lambda: counter.value)
+        return counter
+    
+    def gauge(self, name: str, help_text: str, labels: Optional[Dict[str, str]] = None,
+              fn: Optional[Callable[[], float]] = None) -> Optional[Gauge]:
+        if fn is not None:
+            self._add('gauge', name, help_text, labels, fn)
+            return None
+        gauge = Gauge()
+        self._add('gauge', name, help_text, labels, lambda: gauge.value)
+        return gauge
+    
+    def histogram(self, name: str, help_text: str, labels: Optional[Dict[str, str]] = None,
+                  fn: Optional[Callable[[], LatencyHistogram]] = None) -> Optional[LatencyHistogram]:
+        """Register a latency histogram (exported in seconds); fn returns the live histogram"""
+        if fn is not None:
+            self._add('histogram', name, help_text, labels, fn)
+            return None
+        histogram = LatencyHistogram()
+        self._add('histogram', name, help_text, labels, lambda: histogram)
+        return histogram
+    
+    def include(self, *registries: 'MetricsRegistry'):
+        self.children.extend(registries)
+    
+    @staticmethod
+    def _labels(labels: Dict[str, str], extra: str = '') -> str:
+        parts = []
+        for key, value in labels.items():
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            parts.append(f'{key}="{value}"')
+        if extra:
+            parts.append(extra)
+        return '{' + ','.join(parts) + '}' if parts else ''
+    
+    def _render_histogram(self, name: str, labels: Dict[str, str], histogram: LatencyHistogram,
+                          lines: List[str]):
+        counts = list(histogram.counts)  # copy: the owner may record while we render
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count:
+                cumulative += bucket_count
+                le = 'le="%.9g"' % ((histogram._bucket_upper(index) + 1) / 1e9)
+                lines.append(f"{name}_bucket{self._labels(labels, le)} {cumulative}")
+        lines.append(f"{name}_bucket{self._labels(labels, self.INF_BUCKET)} {cumulative}")
+        lines.append(f"{name}_sum{self._labels(labels)} {histogram.total / 1e9:.9g}")
+        lines.append(f"{name}_count{self._labels(labels)} {cumulative}")
+    
+    def render(self, lines: Optional[List[str]] = None) -> str:
+        """Prometheus text exposition (format 0.0.4) of this registry and its children"""
+        top = lines is None
+        if top:
+            lines = []
+        for name, (kind, help_text, samples) in self.families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, getter in samples:
+                try:
+                    value = getter()
+                except Exception:
+                    continue  # source not available right now (e.g. logging stopped)
+                if kind == 'histogram':
+                    self._render_histogram(name, labels, value, lines)
+                else:
+                    lines.append(f"{name}{self._labels(labels)} {float(value):.9g}")
+        for child in self.children:
+            child.render(lines)
+        return '\n'.join(lines) + '\n' if top else ''
+
+
+class MetricsServer:
+    """Serves a MetricsRegistry over HTTP on localhost or a Unix socket
+    
+    listen is a port ("9105"), "host:port", or a socket path (anything with a
+    '/'); scrape with curl http://127.0.0.1:9105/metrics or
+    curl --unix-socket PATH http://localhost/metrics.
+    """
+    
+    def __init__(self, registry: MetricsRegistry, listen: str):
+        self.registry = registry
+        self.socket_path = None
+        handler = self._make_handler(registry)
+        if '/' in listen:
+            self.socket_path = listen
+            if os.path.exists(listen):
+                os.unlink(listen)
+            self.server = _UnixHTTPServer(listen, handler)
+            self.address = f"unix:{listen}"
+        else:
+            host, _, port = listen.rpartition(':')
+            self.server = http.server.ThreadingHTTPServer((host or '127.0.0.1', int(port)), handler)
+            self.address = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}/metrics"
+        self.thread = threading.Thread(target=self.server.serve_forever, name='ev-metrics', daemon=True)
+        self.thread.start()
+    
+    @staticmethod
+    def _make_handler(registry: MetricsRegistry):
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', MetricsRegistry.CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass  # keep scrapes out of the terminal UI
+        
+        return MetricsHandler
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('unix', 0)  # BaseHTTPRequestHandler expects a (host, port) pair
@@ -0,0 +1,912 @@
+"""
+EV Controller - Data Logging
+Session logs (CSV / columnar, rotated and compressed), the black box ring
+and the wire capture decoder
+"""
+
+import array
+import time
+import sys
+import os
+import math
+import mmap
+import threading
+import json
+import re
+import struct
+import gzip
+import shutil
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Tuple
+import queue
+from collections import deque
+
+try:
+    import zstandard  # optional, for log_compression = "zstd"
+except ImportError:
+    zstandard = None
+
+from ev_instrumentation import FrameTracer, LatencyHistogram, MetricsRegistry
+from ev_transport import WireCapture
+from ev_protocol import BinaryCodec, FrameDecoder, MessageFraming, TelemetrySample
+
+
+# ============================================================================
+# DATA LOGGING
+# ============================================================================
+
+class CsvLogBackend:
+    """Text CSV log: one row per sample with a formatted wall-clock timestamp"""
+    
+    EXTENSION = '.csv'
+    CSV_HEADER = "timestamp,rpm,temperature,current,voltage,battery_soc,throttle\n"
+    
+    def __init__(self):
+        self.file = None
+        self.bytes_written = 0
+        self._wall_offset_ns = 0
+        self._ts_second = None
+        self._ts_prefix = ""
+    
+    def open(self, filepath: str, start_wall_ns: int, start_mono_ns: int):
+        self.file = open(filepath, 'w')
+        self.bytes_written = self.file.write(self.CSV_HEADER)
+        self._wall_offset_ns = start_wall_ns - start_mono_ns
+    
+    def _format_timestamp(self, wall_time: float) -> str:
+        """'%Y-%m-%d %H:%M:%S.mmm', with the strftime part cached per second"""
+        second = int(wall_time)
+        if second != self._ts_second:
+            self._ts_second = second
+            self._ts_prefix = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+        return f"{self._ts_prefix}.{int((wall_time - second) * 1000):03d}"
+    
+    def format_row(self, mono_ns: int, rpm, temp, current, voltage, soc, throttle) -> str:
+        wall_time = (mono_ns + self._wall_offset_ns) / 1e9
+        return f"{self._format_timestamp(wall_time)},{rpm},{temp},{current},{voltage},{soc},{throttle}\n"
+    
+    def write(self, rows: List[Tuple[int, TelemetrySample, int]]):
+        self.bytes_written += self.file.write(''.join(
+            self.format_row(mono_ns, telemetry.get('RPM', 0), telemetry.get('TEMP', 0),
+                            telemetry.get('CURRENT', 0), telemetry.get('VOLTAGE', 0),
+                            telemetry.get('SOC', 0), throttle)
+            for mono_ns, telemetry, throttle in rows))
+    
+    def flush(self):
+        self.file.flush()
+    
+    def size(self) -> int:
+        return self.bytes_written
+    
+    def fileno(self) -> int:
+        return self.file.fileno()
+    
+    def close(self, fsync: bool = False):
+        self.file.flush()
+        if fsync:
+            os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+
+
+class ColumnarLogBackend:
+    """Typed column log written in fixed-size chunks, for long sessions
+    
+    File layout (little-endian):
+        header   HEADER struct (magic, version, chunk_rows, start wall/monotonic ns)
+                 followed by the column spec 'name:typecode,...'
+        chunks   CHUNK_HEADER (magic, rows), then each column's array.array
+                 bytes back to back, each padded to 8 bytes
+        footer   one INDEX_ENTRY per chunk (offset, rows, first/last t_ns),
+                 then TRAILER (index offset, chunk count, magic)
+    
+    Samples are appended to in-memory columns and a chunk is only written once
+    chunk_rows samples have accumulated (the last one at close may be short), so
+    the hot path is a handful of array appends. Missing floats are NaN and a
+    missing throttle is -1. A file without a footer (crash) is still readable
+    chunk by chunk up to the last complete chunk.
+    """
+    
+    EXTENSION = '.evlog'
+    MAGIC = b'EVLC'
+    VERSION = 1
+    HEADER = struct.Struct('<4sHHIqqH')  # magic, version, columns, chunk_rows, wall ns, mono ns, spec len
+    CHUNK_HEADER = struct.Struct('<4sI')
+    CHUNK_MAGIC = b'CHNK'
+    INDEX_ENTRY = struct.Struct('<QIqq')
+    TRAILER = struct.Struct('<QI4s')
+    TRAILER_MAGIC = b'EVLI'
+    
+    # (column name, array typecode)
+    COLUMNS = (
+        ('t_ns', 'q'),
+        ('rpm', 'f'),
+        ('temperature', 'f'),
+        ('current', 'f'),
+        ('voltage', 'f'),
+        ('battery_soc', 'f'),
+        ('throttle', 'h'),
+    )
+    
+    def __init__(self, chunk_rows: int = 1024):
+        self.chunk_rows = chunk_rows
+        self.file = None
+        self.index = []
+        self._columns = None
+    
+    def _new_columns(self):
+        return [array.array(code) for _, code in self.COLUMNS]
+    
+    def open(self, filepath: str, start_wall_ns: int, start_mono_ns: int):
+        self.file = open(filepath, 'wb')
+        spec = ','.join(f"{name}:{code}" for name, code in self.COLUMNS).encode('ascii')
+        self.file.write(self.HEADER.pack(self.MAGIC, self.VERSION, len(self.COLUMNS), self.chunk_rows,
+                                         start_wall_ns, start_mono_ns, len(spec)))
+        self.file.write(spec)
+        self.file.write(b'\0' * (-self.file.tell() % 8))
+        self.index = []
+        self._columns = self._new_columns()
+    
+    def write(self, rows: List[Tuple[int, TelemetrySample, int]]):
+        nan = math.nan
+        t_ns, rpm, temp, current, voltage, soc, throttle = self._columns
+        for mono_ns, telemetry, throttle_value in rows:
+            t_ns.append(mono_ns)
+            rpm.append(nan if telemetry.rpm is None else telemetry.rpm)
+            temp.append(nan if telemetry.temp is None else telemetry.temp)
+            current.append(nan if telemetry.current is None else telemetry.current)
+            voltage.append(nan if telemetry.voltage is None else telemetry.voltage)
+            soc.append(nan if telemetry.soc is None else telemetry.soc)
+            throttle.append(-1 if throttle_value is None else int(throttle_value))
+            if len(t_ns) >= self.chunk_rows:
+                self._write_chunk()
+                t_ns, rpm, temp, current, voltage, soc, throttle = self._columns
+    
+    def _write_chunk(self):
+        columns = self._columns
+        rows = len(columns[0])
+        if not rows:
+            return
+        offset = self.file.tell()
+        self.file.write(self.CHUNK_HEADER.pack(self.CHUNK_MAGIC, rows))
+        for column in columns:
+            if sys.byteorder == 'big':
+                column.byteswap()
+            data = column.tobytes()
+            self.file.write(data)
+            self.file.write(b'\0' * (-len(data) % 8))
+        self.index.append((offset, rows, columns[0][0], columns[0][-1]))
+        self._columns = self._new_columns()
+    
+    def flush(self):
+        # Partial chunks stay in memory until full; only completed chunks hit the file
+        self.file.flush()
+    
+    def size(self) -> int:
+        return self.file.tell()
+    
+    def fileno(self) -> int:
+        return self.file.fileno()
+    
+    def close(self, fsync: bool = False):
+        self._write_chunk()
+        index_offset = self.file.tell()
+        for entry in self.index:
+            self.file.write(self.INDEX_ENTRY.pack(*entry))
+        self.file.write(self.TRAILER.pack(index_offset, len(self.index), self.TRAILER_MAGIC))
+        self.file.flush()
+        if fsync:
+            os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+
+
+LOG_BACKENDS = {
+    'csv': CsvLogBackend,
+    'columnar': ColumnarLogBackend,
+}
+
+
+class ColumnarLogReader:
+    """Memory-mapped reader for ColumnarLogBackend files
+    
+    chunk() returns zero-copy memoryviews into the mapping; release them (or let
+    them go out of scope) before close(). column() and rows() copy out.
+    Compressed segments (.gz/.zst, see LogCompressor) are decompressed into
+    memory instead of mapped.
+    """
+    
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._file = None
+        if filepath.endswith(tuple(LogCompressor.EXTENSIONS.values())):
+            self._mmap = LogCompressor.read(filepath)
+        else:
+            self._file = open(filepath, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        header = ColumnarLogBackend.HEADER
+        (magic, version, n_columns, self.chunk_rows, self.start_wall_ns,
+         self.start_mono_ns, spec_len) = header.unpack_from(self._mmap, 0)
+        if magic != ColumnarLogBackend.MAGIC or version != ColumnarLogBackend.VERSION:
+            raise ValueError(f"{filepath}: not a columnar EV log (v{ColumnarLogBackend.VERSION})")
+        spec = bytes(self._mmap[header.size:header.size + spec_len]).decode('ascii')
+        self.columns = tuple(tuple(item.split(':')) for item in spec.split(','))
+        self._data_start = header.size + spec_len
+        self._data_start += -self._data_start % 8
+        self.index = self._read_index()
+    
+    def _read_index(self) -> List[Tuple[int, int, int, int]]:
+        trailer = ColumnarLogBackend.TRAILER
+        if len(self._mmap) >= self._data_start + trailer.size:
+            index_offset, chunks, magic = trailer.unpack_from(self._mmap, len(self._mmap) - trailer.size)
+            if magic == ColumnarLogBackend.TRAILER_MAGIC:
+                entry = ColumnarLogBackend.INDEX_ENTRY
+                return [entry.unpack_from(self._mmap, index_offset + i * entry.size) for i in range(chunks)]
+        return self._scan_chunks()
+    
+    def _scan_chunks(self) -> List[Tuple[int, int, int, int]]:
+        """Rebuild the index from chunk headers (file without a footer)"""
+        chunk_header = ColumnarLogBackend.CHUNK_HEADER
+        index = []
+        offset = self._data_start
+        while offset + chunk_header.size <= len(self._mmap):
+            magic, rows = chunk_header.unpack_from(self._mmap, offset)
+            if magic != ColumnarLogBackend.CHUNK_MAGIC:
+                break
+            size = self._chunk_size(rows)
+            if offset + size > len(self._mmap):
+                break
+            t_ns = self._view(offset, rows, 0)
+            index.append((offset, rows, t_ns[0], t_ns[-1]))
+            t_ns.release()
+            offset += size
+        return index
+    
+    def _chunk_size(self, rows: int) -> int:
+        size = ColumnarLogBackend.CHUNK_HEADER.size
+        for _, code in self.columns:
+            nbytes = rows * array.array(code).itemsize
+            size += nbytes + (-nbytes % 8)
+        return size
+    
+    def _raw(self, offset: int, rows: int, column: int) -> memoryview:
+        """Byte view of one column inside a chunk"""
+        pos = offset + ColumnarLogBackend.CHUNK_HEADER.size
+        for _, code in self.columns[:column]:
+            nbytes = rows * array.array(code).itemsize
+            pos += nbytes + (-nbytes % 8)
+        nbytes = rows * array.array(self.columns[column][1]).itemsize
+        return memoryview(self._mmap)[pos:pos + nbytes]
+    
+    def _view(self, offset: int, rows: int, column: int) -> memoryview:
+        return self._raw(offset, rows, column).cast(self.columns[column][1])
+    
+    def __len__(self) -> int:
+        return sum(rows for _, rows, _, _ in self.index)
+    
+    def chunk(self, i: int) -> Dict[str, memoryview]:
+        """Zero-copy typed views of every column in chunk i"""
+        offset, rows, _, _ = self.index[i]
+        return {name: self._view(offset, rows, c) for c, (name, _) in enumerate(self.columns)}
+    
+    def column(self, name: str) -> array.array:
+        """Whole column across all chunks, copied into an array.array"""
+        c = [n for n, _ in self.columns].index(name)
+        out = array.array(self.columns[c][1])
+        for offset, rows, _, _ in self.index:
+            raw = self._raw(offset, rows, c)
+            out.frombytes(raw)
+            raw.release()
+        if sys.byteorder == 'big':
+            out.byteswap()
+        return out
+    
+    def rows(self):
+        """Yield one tuple per sample, in column order"""
+        for i in range(len(self.index)):
+            views = self.chunk(i)
+            try:
+                yield from zip(*(view.tolist() for view in views.values()))
+            finally:
+                for view in views.values():
+                    view.release()
+    
+    def close(self):
+        if self._file:
+            self._mmap.close()
+            self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_csv(log_path: str, csv_path: Optional[str] = None) -> str:
+    """Convert a columnar log to the CSV format DataLogger writes in 'csv' mode"""
+    if csv_path is None:
+        base = log_path
+        for extension in LogCompressor.EXTENSIONS.values():
+            if base.endswith(extension):
+                base = base[:-len(extension)]
+        csv_path = os.path.splitext(base)[0] + CsvLogBackend.EXTENSION
+    
+    def fmt(value):
+        # float32 -> shortest text that round-trips; missing values as the CSV logger writes them
+        return 0 if value != value else f"{value:.7g}"
+    
+    csv_backend = CsvLogBackend()
+    with ColumnarLogReader(log_path) as reader:
+        csv_backend.open(csv_path, reader.start_wall_ns, reader.start_mono_ns)
+        lines = []
+        for t_ns, rpm, temp, current, voltage, soc, throttle in reader.rows():
+            lines.append(csv_backend.format_row(t_ns, fmt(rpm), fmt(temp), fmt(current), fmt(voltage),
+                                                fmt(soc), 0 if throttle < 0 else throttle))
+            if len(lines) >= 4096:
+                csv_backend.file.write(''.join(lines))
+                lines = []
+        csv_backend.file.write(''.join(lines))
+        csv_backend.close()
+    return csv_path
+
+
+class LogManifest:
+    """JSON index of a logging session's segments
+    
+    Each entry maps a wall-clock time range to a segment file, so tools can
+    open only the segments they need. Rewritten atomically (tmp + rename)
+    whenever a segment is closed or compressed.
+    """
+    
+    def __init__(self, path: str, session: str, log_format: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {'session': session, 'format': log_format, 'segments': []}
+    
+    def add(self, segment: Dict[str, Any]):
+        with self.lock:
+            self.data['segments'].append(segment)
+            self._save()
+    
+    def update(self, filename: str, **changes):
+        with self.lock:
+            for segment in self.data['segments']:
+                if segment['file'] == filename:
+                    segment.update(changes)
+            self._save()
+    
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, indent=4)
+        os.replace(tmp_path, self.path)
+    
+    @staticmethod
+    def segments_between(manifest_path: str, start: float, end: float) -> List[str]:
+        """Paths of the segments overlapping [start, end] (epoch seconds)"""
+        with open(manifest_path) as f:
+            data = json.load(f)
+        log_dir = os.path.dirname(manifest_path)
+        return [os.path.join(log_dir, segment['file']) for segment in data['segments']
+                if segment['start'] <= end and segment['end'] >= start]
+
+
+class LogCompressor:
+    """Background worker that compresses closed log segments
+    
+    gzip is always available; 'zstd' needs the optional zstandard package.
+    Output goes to a temporary file that is renamed into place, and the source
+    segment is only removed afterwards, so an interrupted run never leaves a
+    truncated segment behind.
+    """
+    
+    EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+    _STOP = object()
+    
+    def __init__(self, method: str = 'gzip'):
+        if method not in self.EXTENSIONS:
+            raise ValueError(f"Unknown compression: {method}")
+        if method == 'zstd' and zstandard is None:
+            print("⚠️  zstandard not installed, compressing logs with gzip")
+            method = 'gzip'
+        self.method = method
+        self.queue = queue.Queue()
+        self.thread = None
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+    
+    def submit(self, path: str, manifest: Optional[LogManifest] = None):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='ev-log-compress', daemon=True)
+            self.thread.start()
+        self.queue.put((path, manifest))
+    
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is self._STOP:
+                self.queue.task_done()
+                break
+            path, manifest = item
+            try:
+                out_path = self._compress(path)
+                if manifest:
+                    manifest.update(os.path.basename(path), file=os.path.basename(out_path),
+                                    compression=self.method, compressed_bytes=os.path.getsize(out_path))
+            except OSError as e:
+                print(f"⚠️  Log compression error ({path}): {e}")
+            finally:
+                self.queue.task_done()
+    
+    def _compress(self, path: str) -> str:
+        out_path = path + self.EXTENSIONS[self.method]
+        tmp_path = out_path + '.tmp'
+        with open(path, 'rb') as src, open(tmp_path, 'wb') as raw:
+            if self.method == 'zstd':
+                zstandard.ZstdCompressor(level=3).copy_stream(src, raw)
+            else:
+                with gzip.GzipFile(filename=os.path.basename(path), mode='wb', fileobj=raw,
+                                   compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, 1 << 16)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, out_path)
+        self.bytes_in += os.path.getsize(path)
+        self.bytes_out += os.path.getsize(out_path)
+        os.remove(path)
+        self.compressed += 1
+        return out_path
+    
+    def wait(self):
+        """Block until every submitted segment has been compressed"""
+        if self.thread is not None:
+            self.queue.join()
+    
+    def stop(self):
+        if self.thread is not None:
+            self.queue.put(self._STOP)
+            self.thread.join()
+            self.thread = None
+    
+    @classmethod
+    def read(cls, path: str) -> bytes:
+        """Whole decompressed contents of a .gz/.zst segment"""
+        if path.endswith(cls.EXTENSIONS['zstd']):
+            if zstandard is None:
+                raise RuntimeError("zstandard package required to read .zst logs")
+            with open(path, 'rb') as f:
+                return zstandard.ZstdDecompressor().stream_reader(f).read()
+        with gzip.open(path, 'rb') as f:
+            return f.read()
+
+
+class DataLogger:
+    """Handles logging of telemetry data to disk
+    
+    log_data() only stamps the sample and puts it on a bounded queue, so it is
+    safe to call from the telemetry path. A background writer thread hands rows
+    to the log backend ('csv' or 'columnar', see LOG_BACKENDS) in batches,
+    flushing once batch_size rows are pending or flush_interval seconds have
+    passed. Durability policy: the file is fsync'ed at most every fsync_interval
+    seconds (None leaves it to the OS). If the writer falls behind and the queue
+    fills, rows are dropped and counted rather than blocking the caller.
+    
+    A session is split into segments (<session>_NNN.csv/.evlog), rotated once a
+    segment reaches rotate_bytes or rotate_seconds. Closed segments are listed
+    in <session>.manifest.json and, if compression is set, handed to a
+    LogCompressor so the writer thread never compresses inline.
+    """
+    
+    _STOP = object()
+    
+    def __init__(self, log_dir: str = "logs", queue_size: int = 4096, batch_size: int = 64,
+                 flush_interval: float = 0.25, fsync_interval: Optional[float] = 1.0,
+                 log_format: str = 'csv', chunk_rows: int = 1024,
+                 rotate_bytes: Optional[int] = None, rotate_seconds: Optional[float] = None,
+                 compression: Optional[str] = None):
+        if log_format not in LOG_BACKENDS:
+            raise ValueError(f"Unknown log format: {log_format}")
+        self.log_dir = log_dir
+        self.log_format = log_format
+        self.chunk_rows = chunk_rows
+        self.log_path = None
+        self.backend = None
+        self.logging_enabled = False
+        
+        # Segmenting
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compressor = LogCompressor(compression) if compression else None
+        self.session = None
+        self.manifest = None
+        self.segments = 0
+        self._segment_rows = 0
+        self._segment_first_ns = None
+        self._segment_last_ns = None
+        self._segment_opened_ns = 0
+        self._wall_offset_ns = 0
+        
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.writer_thread = None
+        
+        # Writer statistics
+        self.dropped_rows = 0
+        self.rows_written = 0
+        self.batches = 0
+        self.fsyncs = 0
+        self.write_latency = LatencyHistogram()
+        # Age of the oldest row in each batch when it reaches the file
+        self.write_lag = LatencyHistogram()
+        # (queued ns, trace) of traced rows not yet written; see FrameTracer
+        self.tracer: Optional[FrameTracer] = None
+        self._traces = deque()
+        self.metrics = MetricsRegistry()
+        self._register_metrics()
+        
+        # Create logs directory
+        os.makedirs(log_dir, exist_ok=True)
+    
+    @classmethod
+    def from_config(cls, config: 'ConfigManager', log_dir: str = "logs") -> 'DataLogger':
+        """Logger with the log_* settings from the config"""
+        rotate_mb = config.get('log_rotate_mb')
+        rotate_minutes = config.get('log_rotate_minutes')
+        return cls(
+            log_dir=log_dir,
+            batch_size=config.get('log_batch_size', 64),
+            flush_interval=config.get('log_flush_interval', 0.25),
+            fsync_interval=config.get('log_fsync_interval', 1.0),
+            log_format=config.get('log_format', 'csv'),
+            chunk_rows=config.get('log_chunk_rows', 1024),
+            rotate_bytes=int(rotate_mb * 1024 * 1024) if rotate_mb else None,
+            rotate_seconds=rotate_minutes * 60 if rotate_minutes else None,
+            compression=config.get('log_compression')
+        )
+    
+    def _register_metrics(self):
+        metrics = self.metrics
+        metrics.gauge('ev_log_enabled', "1 while a logging session is open", fn=lambda: int(self.logging_enabled))
+        metrics.gauge('ev_log_queue_depth', "Rows waiting for the writer thread", fn=self.queue.qsize)
+        metrics.counter('ev_log_rows_written_total', "Rows written to log segments", fn=lambda: self.rows_written)
+        metrics.counter('ev_log_rows_dropped_total', "Rows dropped from the full log queue",
+                        fn=lambda: self.dropped_rows)
+        metrics.counter('ev_log_batches_total', "Batched log writes", fn=lambda: self.batches)
+        metrics.counter('ev_log_fsyncs_total', "fsync() calls on the log segment", fn=lambda: self.fsyncs)
+        metrics.counter('ev_log_segments_total', "Log segments opened this session", fn=lambda: self.segments)
+        metrics.histogram('ev_log_write_latency_seconds', "Time to write and flush one batch",
+                          fn=lambda: self.write_latency)
+        metrics.histogram('ev_log_lag_seconds', "log_data() to row written, oldest row per batch",
+                          fn=lambda: self.write_lag)
+    
+    def _new_backend(self):
+        if self.log_format == 'columnar':
+            return ColumnarLogBackend(self.chunk_rows)
+        return CsvLogBackend()
+    
+    def start_logging(self):
+        """Start a new logging session"""
+        if self.logging_enabled:
+            return
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.session = f"ev_log_{timestamp}"
+        self.manifest = LogManifest(os.path.join(self.log_dir, f"{self.session}.manifest.json"),
+                                    self.session, self.log_format)
+        self.segments = 0
+        self._start_wall_ns = time.time_ns()
+        self._start_mono_ns = time.monotonic_ns()
+        self._wall_offset_ns = self._start_wall_ns - self._start_mono_ns
+        self._open_segment()
+        
+        self.writer_thread = threading.Thread(target=self._writer_loop, name='ev-logger', daemon=True)
+        self.writer_thread.start()
+        self.logging_enabled = True
+        print(f"📝 Logging started: {self.log_path}")
+    
+    def _open_segment(self):
+        self.backend = self._new_backend()
+        filename = f"{self.session}_{self.segments:03d}{self.backend.EXTENSION}"
+        self.log_path = os.path.join(self.log_dir, filename)
+        self.backend.open(self.log_path, self._start_wall_ns, self._start_mono_ns)
+        self.segments += 1
+        self._segment_rows = 0
+        self._segment_first_ns = None
+        self._segment_opened_ns = time.monotonic_ns()
+    
+    def _close_segment(self):
+        """Close the current segment, index it and queue it for compression"""
+        self.backend.close(fsync=self.fsync_interval is not None)
+        self.backend = None
+        if not self._segment_rows:
+            os.remove(self.log_path)
+            return
+        self.manifest.add({
+            'file': os.path.basename(self.log_path),
+            'start': (self._segment_first_ns + self._wall_offset_ns) / 1e9,
+            'end': (self._segment_last_ns + self._wall_offset_ns) / 1e9,
+            'rows': self._segment_rows,
+            'bytes': os.path.getsize(self.log_path)
+        })
+        if self.compressor:
+            self.compressor.submit(self.log_path, self.manifest)
+    
+    def _should_rotate(self) -> bool:
+        if self.rotate_bytes is not None and self.backend.size() >= self.rotate_bytes:
+            return True
+        return (self.rotate_seconds is not None and
+                self._segment_last_ns - self._segment_opened_ns >= self.rotate_seconds * 1e9)
+    
+    def log_data(self, telemetry: TelemetrySample, throttle: int, trace: Optional[List[int]] = None):
+        """Queue a data point (never blocks)"""
+        if self.logging_enabled:
+            mono_ns = time.monotonic_ns()
+            if trace is not None:
+                self._traces.append((mono_ns, trace))
+            try:
+                self.queue.put_nowait((mono_ns, telemetry, throttle))
+            except queue.Full:
+                self.dropped_rows += 1
+                if trace is not None:
+                    self._traces.pop()
+    
+    def _write_batch(self, rows: List[Tuple[int, TelemetrySample, int]]):
+        start_ns = time.perf_counter_ns()
+        self.backend.write(rows)
+        self.backend.flush()
+        now = time.monotonic()
+        if self.fsync_interval is not None and now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self.backend.fileno())
+            self._last_fsync = now
+            self.fsyncs += 1
+        self.write_latency.record(time.perf_counter_ns() - start_ns)
+        self.write_lag.record(time.monotonic_ns() - rows[0][0])
+        self.rows_written += len(rows)
+        if self._traces:
+            last_ns = rows[-1][0]
+            while self._traces and self._traces[0][0] <= last_ns:
+                self.tracer.stamp(self._traces.popleft()[1], FrameTracer.LOGGED)
+        self.batches += 1
+        
+        if self._segment_first_ns is None:
+            self._segment_first_ns = rows[0][0]
+        self._segment_last_ns = rows[-1][0]
+        self._segment_rows += len(rows)
+        if self._should_rotate():
+            self._close_segment()
+            self._open_segment()
+            self._last_fsync = time.monotonic()
+            print(f"📝 Log rotated: {self.log_path}")
+    
+    def _writer_loop(self):
+        """Background thread: drain the queue into batched writes"""
+        rows = []
+        last_flush = self._last_fsync = time.monotonic()
+        stopping = False
+        while not stopping:
+            timeout = max(0.0, last_flush + self.flush_interval - time.monotonic()) if rows else None
+            try:
+                item = self.queue.get(timeout=timeout)
+                while True:
+                    if item is self._STOP:
+                        stopping = True
+                        break
+                    rows.append(item)
+                    if len(rows) >= self.batch_size:
+                        break
+                    item = self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            
+            if rows and (stopping or len(rows) >= self.batch_size or
+                         time.monotonic() - last_flush >= self.flush_interval):
+                try:
+                    self._write_batch(rows)
+                except OSError as e:
+                    print(f"⚠️  Log write error: {e}")
+                rows = []
+                last_flush = time.monotonic()
+    
+    def stop_logging(self):
+        """Stop logging, write out queued rows and close file"""
+        if self.backend:
+            self.logging_enabled = False
+            self.queue.put(self._STOP)
+            self.writer_thread.join()
+            self.writer_thread = None
+            try:
+                self._close_segment()
+            except OSError as e:
+                print(f"⚠️  Log close error: {e}")
+            self.backend = None
+            print("📝 Logging stopped")
+    
+    def close(self):
+        """Stop logging and wait for pending segment compression"""
+        self.stop_logging()
+        if self.compressor:
+            self.compressor.stop()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'logging': self.logging_enabled,
+            'format': self.log_format,
+            'queue_depth': self.queue.qsize(),
+            'dropped_rows': self.dropped_rows,
+            'rows_written': self.rows_written,
+            'batches': self.batches,
+            'fsyncs': self.fsyncs,
+            'segments': self.segments,
+            'compressed': self.compressor.compressed if self.compressor else 0,
+            'write_latency': self.write_latency.summary(),
+            'write_lag': self.write_lag.summary()
+        }
+
+
+class BlackBoxRecorder:
+    """Always-on ring buffer of the last few minutes of telemetry ("black box")
+    
+    The ring is a fixed-size file mapped with mmap: record() packs one 32-byte
+    RECORD into the next slot, with no syscalls and no allocation beyond the
+    packed values, then bumps the records-written count in the header. Records
+    carry their sample's own timestamp (the protocol clock, which may be a
+    VirtualClock starting at 0), so readers take the first min(written,
+    capacity) slots and order them by t_ns. The kernel writes
+    dirty pages back on its own schedule, so the ring also survives a crash of
+    this process; the previous session's ring is kept as *_prev.ring on start.
+    freeze() copies the ring out in time order and writes it as a snapshot file
+    in the same format on a background thread.
+    
+    capacity = minutes * rate_hz samples; a faster telemetry stream covers
+    proportionally less time.
+    """
+    
+    MAGIC = b'EVBB'
+    VERSION = 2
+    HEADER = struct.Struct('<4sHHIqqq')  # magic, version, record size, capacity, wall ns, mono ns, written
+    HEADER_V1 = struct.Struct('<4sHHIqq')  # no written count: unused slots are told apart by t_ns 0
+    WRITTEN = struct.Struct('<q')
+    WRITTEN_OFFSET = HEADER_V1.size
+    DATA_OFFSET = 64
+    RECORD = struct.Struct('<q5fhxx')  # t_ns, rpm, temp, current, voltage, soc, throttle
+    FIELDS = ('t_ns', 'rpm', 'temperature', 'current', 'voltage', 'battery_soc', 'throttle')
+    
+    def __init__(self, log_dir: str = "logs", minutes: float = 5.0, rate_hz: float = 10.0,
+                 name: str = "blackbox"):
+        self.log_dir = log_dir
+        self.capacity = max(1, int(minutes * 60 * rate_hz))
+        self.path = os.path.join(log_dir, f"{name}.ring")
+        self.head = 0
+        self.snapshots = 0
+        os.makedirs(log_dir, exist_ok=True)
+        
+        if os.path.exists(self.path):
+            os.replace(self.path, os.path.join(log_dir, f"{name}_prev.ring"))
+        size = self.DATA_OFFSET + self.capacity * self.RECORD.size
+        self._file = open(self.path, 'w+b')
+        self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        self.HEADER.pack_into(self._mmap, 0, self.MAGIC, self.VERSION, self.RECORD.size, self.capacity,
+                              time.time_ns(), time.monotonic_ns(), 0)
+    
+    def record(self, sample: TelemetrySample):
+        """Append one sample, overwriting the oldest once the ring is full"""
+        nan = math.nan
+        rpm, temp, current, voltage, soc, throttle, timestamp = sample
+        self.RECORD.pack_into(
+            self._mmap, self.DATA_OFFSET + (self.head % self.capacity) * self.RECORD.size,
+            time.monotonic_ns() if timestamp is None else int(timestamp * 1e9),
+            nan if rpm is None else rpm, nan if temp is None else temp,
+            nan if current is None else current, nan if voltage is None else voltage,
+            nan if soc is None else soc, -1 if throttle is None else int(throttle))
+        self.head += 1
+        self.WRITTEN.pack_into(self._mmap, self.WRITTEN_OFFSET, self.head)
+    
+    def snapshot(self) -> bytes:
+        """Ring contents as a standalone black box file, oldest sample first"""
+        count = min(self.head, self.capacity)
+        start = self.head % self.capacity if self.head > self.capacity else 0
+        data_start = self.DATA_OFFSET
+        split = data_start + start * self.RECORD.size
+        data_end = data_start + self.capacity * self.RECORD.size
+        records = self._mmap[split:data_end] + self._mmap[data_start:split]
+        header = bytearray(self.DATA_OFFSET)
+        _, _, _, _, wall_ns, mono_ns, _ = self.HEADER.unpack_from(self._mmap, 0)
+        self.HEADER.pack_into(header, 0, self.MAGIC, self.VERSION, self.RECORD.size, count,
+                              wall_ns, mono_ns, count)
+        return bytes(header) + records[:count * self.RECORD.size]
+    
+    def freeze(self, reason: str) -> str:
+        """Copy the ring now and write it to logs/ in the background; returns the file path"""
+        data = self.snapshot()
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        label = re.sub(r'[^A-Za-z0-9_-]', '_', reason)
+        path = os.path.join(self.log_dir, f"blackbox_{timestamp}_{label}_{self.snapshots}.bin")
+        self.snapshots += 1
+        threading.Thread(target=self._write_snapshot, args=(path, data),
+                         name='ev-blackbox', daemon=True).start()
+        return path
+    
+    @staticmethod
+    def _write_snapshot(path: str, data: bytes):
+        try:
+            with open(path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            print(f"🗃️  Black box saved: {path}")
+        except OSError as e:
+            print(f"⚠️  Black box write error: {e}")
+    
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.flush()
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+    
+    @classmethod
+    def load(cls, path: str) -> Tuple[Dict[str, Any], List[Tuple]]:
+        """Read a ring or snapshot file: (header info, records oldest first)"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, record_size, capacity, wall_ns, mono_ns = cls.HEADER_V1.unpack_from(data, 0)
+        if magic != cls.MAGIC or version not in (1, cls.VERSION) or record_size != cls.RECORD.size:
+            raise ValueError(f"{path}: not a black box file (v1-v{cls.VERSION})")
+        if version == 1:
+            body = data[cls.DATA_OFFSET:cls.DATA_OFFSET + capacity * record_size]
+            # Unused slots are all zero (t_ns 0)
+            records = sorted(record for record in cls.RECORD.iter_unpack(body) if record[0])
+        else:
+            written = min(capacity, cls.WRITTEN.unpack_from(data, cls.WRITTEN_OFFSET)[0])
+            body = data[cls.DATA_OFFSET:cls.DATA_OFFSET + written * record_size]
+            records = sorted(cls.RECORD.iter_unpack(body))
+        info = {'capacity': capacity, 'samples': len(records),
+                'start_wall_ns': wall_ns, 'start_mono_ns': mono_ns}
+        return info, records
+
+
+def dump_blackbox(path: str):
+    """Print a black box ring or snapshot as CSV, with time relative to the last sample"""
+    info, records = BlackBoxRecorder.load(path)
+    print(f"# {path}: {info['samples']} samples (capacity {info['capacity']})")
+    if not records:
+        return
+    last_ns = records[-1][0]
+    wall_offset_ns = info['start_wall_ns'] - info['start_mono_ns']
+    end = datetime.fromtimestamp((last_ns + wall_offset_ns) / 1e9)
+    print(f"# last sample at {end.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}")
+    print("t_rel_s,rpm,temperature,current,voltage,battery_soc,throttle")
+    for t_ns, rpm, temp, current, voltage, soc, throttle in records:
+        print(f"{(t_ns - last_ns) / 1e9:.3f},{rpm:.7g},{temp:.7g},{current:.7g},{voltage:.7g},{soc:.7g},{throttle}")
+
+
+def decode_capture(path: str):
+    """Print a wire capture: every chunk, then the frames it completed"""
+    info, records = WireCapture.load(path)
+    print(f"# {path}: {len(records)} chunks")
+    if not records:
+        return
+    t0 = records[0][1]
+    start = datetime.fromtimestamp((t0 + info['start_wall_ns'] - info['start_mono_ns']) / 1e9)
+    print(f"# first chunk at {start.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}")
+    decoders = (FrameDecoder(binary=True), FrameDecoder(binary=True))
+    framing = MessageFraming()
+    framing._init_framing()
+    for direction, t_ns, data in records:
+        print(f"{(t_ns - t0) / 1e9:12.6f}  {WireCapture.DIRECTIONS[direction]}  {len(data):4d}  {data!r}")
+        for frame in decoders[direction].feed(data):
+            if frame[0] == BinaryCodec.SYNC:
+                parsed = framing._parse_frame(frame)
+                text = f"[binary {frame.hex()}] -> {parsed['type'] if parsed else 'unparsed'}"
+            else:
+                text = frame.decode('utf-8', errors='replace')
+            print(f"{'':20}  => {text}")
+    for name, decoder in zip(WireCapture.DIRECTIONS, decoders):
+        stats = decoder.stats()
+        if stats['dropped_bytes'] or stats['crc_errors'] or stats['resyncs']:
+            print(f"# {name} framing problems: {stats}")
@@ -0,0 +1,1519 @@
+"""
+EV Controller - Protocol Layer
+Framing (ASCII and binary), message parsing, request/ACK correlation,
+callback dispatch, TX scheduling and coalesced setpoints
+"""
+
+import time
+import os
+import select
+import threading
+import re
+import struct
+import binascii
+from enum import Enum
+from typing import Callable, Dict, List, NamedTuple, Optional, Any, Sequence, Tuple, Union
+import queue
+from collections import deque
+
+from ev_instrumentation import FrameTracer, LatencyHistogram, MetricsRegistry, RxStats
+from ev_transport import VirtualClock, WireCapture, open_transport
+
+
+# ============================================================================
+# PROTOCOL LAYER
+# ============================================================================
+
+class MessageType(Enum):
+    """Message types for communication protocol"""
+    # Commands (Pi -> STM32)
+    SET_MAX_CURRENT = "SET_MAX_CURRENT"
+    SET_CURRENT_LIMIT = "SET_CURRENT_LIMIT"
+    EMERGENCY_STOP = "ESTOP"
+    RESET_FAULT = "RESET_FAULT"
+    
+    # Queries (Pi -> STM32)
+    GET_TELEMETRY = "GET_TELEM"
+    GET_TEMP = "GET_TEMP"
+    GET_STATUS = "GET_STATUS"
+    GET_FAULTS = "GET_FAULTS"
+    
+    # Link negotiation (Pi -> STM32)
+    SET_MODE = "SET_MODE"
+    SUBSCRIBE = "SUBSCRIBE"
+    UNSUBSCRIBE = "UNSUBSCRIBE"
+    
+    # Test hooks (STM32 simulator only)
+    INJECT_FAULT = "INJECT_FAULT"
+    BURST = "BURST"
+    
+    # Responses (STM32 -> Pi)
+    DATA = "DATA"
+    ACK = "ACK"
+    NACK = "NACK"
+    FAULT = "FAULT"
+
+
+class BinaryCodec:
+    """Binary framing mode (negotiated with SET_MODE:MODE=BIN)
+    
+    Frame: SYNC(0xA5) LEN SEQ TYPE PAYLOAD[LEN] CRC16
+    LEN is the payload length, SEQ a per-sender rolling counter and CRC16 is
+    CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF, little-endian on the wire)
+    over LEN..PAYLOAD. Telemetry is a fixed struct; every other message is
+    carried as its ASCII '<...>' text in a TEXT frame, so command handling is
+    identical in both modes.
+    """
+    
+    SYNC = 0xA5
+    HEADER = struct.Struct('<BBBB')
+    CRC = struct.Struct('<H')
+    OVERHEAD = HEADER.size + CRC.size
+    
+    TYPE_TELEMETRY = 0x01
+    TYPE_TEXT = 0x02
+    
+    # RPM, TEMP, CURRENT, VOLTAGE, SOC as float32; THROTTLE int16 (-1 = not reported)
+    TELEMETRY = struct.Struct('<5fh')
+    NO_THROTTLE = -1
+    
+    def __init__(self):
+        self.tx_seq = 0
+        self.rx_seq = None
+        self.seq_gaps = 0
+        self.clock: Callable[[], float] = time.monotonic  # stamps decoded telemetry
+    
+    @staticmethod
+    def crc16(data) -> int:
+        return binascii.crc_hqx(data, 0xFFFF)
+    
+    def encode(self, frame_type: int, payload: bytes) -> bytes:
+        if len(payload) > 255:
+            raise ValueError(f"Binary payload too long: {len(payload)} bytes")
+        body = self.HEADER.pack(self.SYNC, len(payload), self.tx_seq, frame_type) + payload
+        self.tx_seq = (self.tx_seq + 1) & 0xFF
+        return body + self.CRC.pack(self.crc16(body[1:]))
+    
+    def encode_text(self, message: str) -> bytes:
+        return self.encode(self.TYPE_TEXT, message.encode('utf-8'))
+    
+    def encode_telemetry(self, rpm: float, temp: float, current: float, voltage: float,
+                         soc: float, throttle: Optional[int] = None) -> bytes:
+        throttle = self.NO_THROTTLE if throttle is None else throttle
+        return self.encode(self.TYPE_TELEMETRY,
+                           self.TELEMETRY.pack(rpm, temp, current, voltage, soc, throttle))
+    
+    def decode(self, frame: bytes, parse_text: Callable[[str], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """Parse a CRC-checked frame from FrameDecoder; TEXT payloads go to parse_text"""
+        _, length, seq, frame_type = self.HEADER.unpack_from(frame)
+        if self.rx_seq is not None and seq != (self.rx_seq + 1) & 0xFF:
+            self.seq_gaps += 1
+        self.rx_seq = seq
+        
+        payload = frame[self.HEADER.size:self.HEADER.size + length]
+        if frame_type == self.TYPE_TELEMETRY and length == self.TELEMETRY.size:
+            rpm, temp, current, voltage, soc, throttle = self.TELEMETRY.unpack(payload)
+            now = self.clock()
+            sample = TelemetrySample(rpm, temp, current, voltage, soc,
+                                     None if throttle == self.NO_THROTTLE else throttle, now)
+            return {'type': 'DATA', 'data': sample, 'timestamp': now}
+        if frame_type == self.TYPE_TEXT:
+            return parse_text(payload.decode('utf-8', errors='ignore'))
+        return None
+    
+    def stats(self) -> Dict[str, int]:
+        return {'tx_seq': self.tx_seq, 'seq_gaps': self.seq_gaps}
+
+
+class FrameDecoder:
+    """Incremental frame extractor for '<TYPE:K=V;...>' and binary frames
+    
+    Bytes are appended to a bytearray and scanned once: the decoder remembers how
+    far it has searched inside an unfinished frame, so a burst of telemetry is
+    framed in linear time. Junk outside frames is discarded, a new start inside a
+    frame resyncs to it, and a frame longer than max_frame_size is dropped, which
+    also bounds the buffer to one partial frame.
+    
+    Binary frames (BinaryCodec) are only recognised once `binary` is set (after
+    SET_MODE:MODE=BIN has been negotiated); until then a stray sync byte is
+    junk like any other. They are delimited by their length prefix; one
+    with an unknown type or failing its CRC costs a single byte of resync,
+    and a sync byte still waiting for its length's worth of bytes is given
+    up as soon as a complete ASCII frame follows it, so line noise can't
+    hold back the frames behind it. Frames are returned as bytes, so
+    callers dispatch on frame[0].
+    """
+    
+    START_BYTE = b'<'
+    END_BYTE = b'>'
+    SYNC_BYTE = bytes([BinaryCodec.SYNC])
+    # Complete ASCII frame: '<', a type letter, printable bytes without '<' / '>', '>'
+    ASCII_FRAME = re.compile(rb'<[A-Z][\x20-\x3b\x3d\x3f-\x7e]*>')
+    BINARY_TYPES = (BinaryCodec.TYPE_TELEMETRY, BinaryCodec.TYPE_TEXT)
+    
+    def __init__(self, max_frame_size: int = 512, binary: bool = False):
+        self.max_frame_size = max_frame_size
+        self.binary = binary
+        self.buffer = bytearray()
+        self._scan = 0  # offset already searched for END_BYTE in the pending frame
+        self.frames = 0
+        self.binary_frames = 0
+        self.dropped_bytes = 0
+        self.resyncs = 0
+        self.overflows = 0
+        self.crc_errors = 0
+    
+    def _find_start(self, buf: bytearray, pos: int, stop: int) -> int:
+        """First ASCII start (or sync byte, in binary mode) in buf[pos:stop], or -1"""
+        ascii_start = buf.find(self.START_BYTE, pos, stop)
+        if not self.binary:
+            return ascii_start
+        sync = buf.find(self.SYNC_BYTE, pos, ascii_start if ascii_start >= 0 else stop)
+        return sync if sync >= 0 else ascii_start
+    
+    def feed(self, data: bytes) -> List[bytes]:
+        """Add received bytes and return the complete frames they finish"""
+        buf = self.buffer
+        buf += data
+        frames = []
+        pos = 0
+        size = len(buf)
+        start_char = self.START_BYTE[0]
+        sync_char = BinaryCodec.SYNC if self.binary else -1
+        
+        while pos < size:
+            lead = buf[pos]
+            if lead != start_char and lead != sync_char:
+                start = self._find_start(buf, pos, size)
+                if start < 0:
+                    self.dropped_bytes += size - pos
+                    pos = size
+                    break
+                self.dropped_bytes += start - pos
+                pos = start
+                lead = buf[pos]
+                self._scan = 0
+            
+            if lead == sync_char:
+                if size - pos >= BinaryCodec.HEADER.size:
+                    frame_type = buf[pos + 3]
+                    if frame_type not in self.BINARY_TYPES or (
+                            frame_type == BinaryCodec.TYPE_TELEMETRY and buf[pos + 1] != BinaryCodec.TELEMETRY.size):
+                        self.dropped_bytes += 1
+                        pos += 1
+                        continue
+                total = BinaryCodec.OVERHEAD + buf[pos + 1] if size - pos >= 2 else None
+                if total is None or size - pos < total:
+                    # Incomplete: keep waiting, unless a whole ASCII frame has arrived behind it
+                    ascii_frame = self.ASCII_FRAME.search(buf, pos + 1)
+                    if ascii_frame is not None and ascii_frame.start() == pos + BinaryCodec.HEADER.size \
+                            and ascii_frame.end() == pos + total - BinaryCodec.CRC.size:
+                        # A TEXT frame's own '<...>' payload, only its CRC still to come
+                        ascii_frame = self.ASCII_FRAME.search(buf, ascii_frame.end())
+                    if ascii_frame is None:
+                        break
+                    self.dropped_bytes += ascii_frame.start() - pos
+                    self.resyncs += 1
+                    pos = ascii_frame.start()
+                    self._scan = 0
+                    continue
+                crc_at = pos + total - BinaryCodec.CRC.size
+                if BinaryCodec.crc16(buf[pos + 1:crc_at]) != BinaryCodec.CRC.unpack_from(buf, crc_at)[0]:
+                    # Not a real frame (or a corrupt one): skip the sync byte and rescan
+                    self.dropped_bytes += 1
+                    self.crc_errors += 1
+                    pos += 1
+                    continue
+                frames.append(bytes(buf[pos:pos + total]))
+                self.frames += 1
+                self.binary_frames += 1
+                pos += total
+                continue
+            
+            search_from = max(self._scan, pos + 1)
+            end = buf.find(self.END_BYTE, search_from)
+            restart = self._find_start(buf, search_from, end if end >= 0 else size)
+            
+            if restart >= 0:
+                # A new start inside an unfinished frame: the old one is corrupt
+                self.dropped_bytes += restart - pos
+                self.resyncs += 1
+                pos = restart
+                self._scan = 0
+                continue
+            
+            if end < 0:
+                if size - pos > self.max_frame_size:
+                    self.dropped_bytes += size - pos
+                    self.overflows += 1
+                    pos = size
+                else:
+                    self._scan = size
+                break
+            
+            frames.append(bytes(buf[pos:end + 1]))
+            self.frames += 1
+            pos = end + 1
+            self._scan = 0
+        
+        if pos:
+            del buf[:pos]
+            self._scan = max(0, self._scan - pos)
+        return frames
+    
+    def reset(self):
+        self.buffer.clear()
+        self._scan = 0
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            'frames': self.frames,
+            'binary_frames': self.binary_frames,
+            'dropped_bytes': self.dropped_bytes,
+            'resyncs': self.resyncs,
+            'overflows': self.overflows,
+            'crc_errors': self.crc_errors,
+            'buffered': len(self.buffer)
+        }
+
+
+class TelemetrySample(NamedTuple):
+    """Immutable telemetry snapshot
+    
+    Tuple-backed with no per-instance __dict__ (__slots__ = ()), so a sample is
+    one small allocation and the controller's latest sample can be handed to any
+    reader without copying. Fields the STM32 hasn't reported are None.
+    timestamp is time.monotonic() at parse time (or the protocol's VirtualClock).
+    """
+    rpm: Optional[float] = None
+    temp: Optional[float] = None
+    current: Optional[float] = None
+    voltage: Optional[float] = None
+    soc: Optional[float] = None
+    throttle: Optional[int] = None
+    timestamp: float = 0.0
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        """Read a field by its wire key ('RPM', 'TEMP', ...), like the old telemetry dict"""
+        index = TELEMETRY_KEYS.get(key)
+        if index is None:
+            return default
+        value = self[index]
+        return default if value is None else value
+    
+    def merge(self, data: Dict[str, Any], timestamp: float) -> 'TelemetrySample':
+        """New sample with the wire-keyed values in data applied (unknown keys ignored)"""
+        values = list(self)
+        for key, value in data.items():
+            index = TELEMETRY_KEYS.get(key)
+            if index is not None:
+                values[index] = value
+        values[-1] = timestamp
+        return TelemetrySample(*values)
+
+
+# Wire key -> TelemetrySample field index
+TELEMETRY_KEYS = {'RPM': 0, 'TEMP': 1, 'CURRENT': 2, 'VOLTAGE': 3, 'SOC': 4, 'THROTTLE': 5}
+
+
+class MessageSchema:
+    """Compiled parser for a message type whose fields always arrive in the same order
+    
+    The frame is matched with one precompiled regex and each captured value
+    is converted by its field's declared type, in layout order, instead of
+    splitting into a generic dict and guessing types.
+    Optional fields may only trail the required ones.
+    
+    With a record type the parser builds record(*values, timestamp) directly
+    (missing optional fields passed as None) instead of a dict; timestamp is
+    parse()'s second argument and defaults to time.monotonic().
+    
+    prefix is the frame start up to the first value ('<DATA:RPM='): a frame
+    without it can't match, so MessageParser skips the regex for it.
+    """
+    
+    def __init__(self, msg_type: str, fields: Sequence[Tuple[str, Callable]],
+                 optional: Sequence[Tuple[str, Callable]] = (), record: Optional[Callable] = None):
+        self.msg_type = msg_type
+        self.fields = tuple(fields)
+        self.optional = tuple(optional)
+        self.record = record
+        self.prefix = f"<{msg_type}:{self.fields[0][0]}=" if self.fields else f"<{msg_type}:"
+        
+        value = r'([^;>]*)'
+        pattern = re.escape(f"<{msg_type}:") + ';'.join(
+            re.escape(f"{key}=") + value for key, _ in self.fields)
+        for key, _ in self.optional:
+            pattern += '(?:' + re.escape(f";{key}=") + value + ')?'
+        pattern += re.escape('>')
+        self.regex = re.compile(pattern)
+        self.parse = self._compile()
+    
+    def _compile(self) -> Callable[[str], Any]:
+        """Build parse(frame, timestamp=None) -> typed fields, or None if the frame doesn't fit"""
+        match = self.regex.fullmatch
+        now = time.monotonic
+        required = tuple(self.fields)
+        optional = tuple(self.optional)
+        split = len(required)
+        record = self.record
+        
+        if record is None:
+            def parse(frame, timestamp=None):
+                found = match(frame)
+                if found is None:
+                    return None
+                groups = found.groups()
+                try:
+                    data = {key: conv(text) for (key, conv), text in zip(required, groups)}
+                    for (key, conv), text in zip(optional, groups[split:]):
+                        if text is not None:
+                            data[key] = conv(text)
+                except ValueError:
+                    return None
+                return data
+            return parse
+        
+        convs = tuple(conv for _, conv in required)
+        optional_convs = tuple(conv for _, conv in optional)
+        # Required fields that share one type (all of DATA's) convert with a single map()
+        uniform = convs[0] if convs and all(conv is convs[0] for conv in convs) else None
+        if isinstance(record, type) and issubclass(record, tuple):
+            # NamedTuple: build the tuple directly, skipping its keyword-default __new__
+            tuple_new = tuple.__new__
+            make = lambda values: tuple_new(record, values)
+        else:
+            make = lambda values: record(*values)
+        
+        def parse(frame, timestamp=None):
+            found = match(frame)
+            if found is None:
+                return None
+            groups = found.groups()
+            try:
+                if uniform is not None:
+                    values = list(map(uniform, groups[:split]))
+                else:
+                    values = [conv(text) for conv, text in zip(convs, groups)]
+                for conv, text in zip(optional_convs, groups[split:]):
+                    values.append(None if text is None else conv(text))
+            except ValueError:
+                return None
+            values.append(now() if timestamp is None else timestamp)
+            return make(values)
+        return parse
+
+
+# Full telemetry frame sent by the STM32 (THROTTLE only once the pedal is wired)
+TELEMETRY_SCHEMA = MessageSchema(
+    'DATA',
+    [('RPM', float), ('TEMP', float), ('CURRENT', float), ('VOLTAGE', float), ('SOC', float)],
+    optional=[('THROTTLE', int)],
+    record=TelemetrySample
+)
+
+
+class MessageParser:
+    """Frame parser with a per-message-type schema registry
+    
+    Frames that start with a registered schema's prefix take the compiled
+    fast path; anything else (other types, partial frames, or a frame that
+    doesn't match its schema) goes through the generic key/value parser.
+    All prefixes are tested with one startswith() call, so an ACK costs a
+    single C-level miss on top of the generic parse; a hit is dispatched on
+    the character after '<'. The clock is read once per frame.
+    """
+    
+    START_CHAR = '<'
+    END_CHAR = '>'
+    SEPARATOR = ':'
+    PARAM_SEP = ';'
+    VALUE_SEP = '='
+    
+    def __init__(self, schemas: Sequence[MessageSchema] = (TELEMETRY_SCHEMA,)):
+        self.clock: Callable[[], float] = time.monotonic  # message timestamps
+        self.schemas = {}
+        self._prefixes: Tuple[str, ...] = ()
+        self._by_lead: Dict[str, Tuple[MessageSchema, ...]] = {}  # first type letter -> schemas
+        for schema in schemas:
+            self.register_schema(schema)
+    
+    def register_schema(self, schema: MessageSchema):
+        self.schemas[schema.msg_type] = schema
+        self._prefixes = tuple(s.prefix for s in self.schemas.values())
+        lead = schema.msg_type[0]
+        self._by_lead[lead] = tuple(s for s in self.schemas.values() if s.msg_type[0] == lead)
+    
+    def parse(self, message: str) -> Optional[Dict[str, Any]]:
+        if not message.startswith(self._prefixes):
+            return self.parse_generic(message)
+        timestamp = self.clock()
+        for schema in self._by_lead[message[1]]:
+            if message.startswith(schema.prefix):
+                data = schema.parse(message, timestamp)
+                if data is not None:
+                    return {'type': schema.msg_type, 'data': data, 'timestamp': timestamp}
+        return self.parse_generic(message, timestamp)
+    
+    def parse_generic(self, message: str, timestamp: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        try:
+            message = message.strip().lstrip(self.START_CHAR).rstrip(self.END_CHAR)
+            
+            if self.SEPARATOR in message:
+                msg_type, data_str = message.split(self.SEPARATOR, 1)
+            else:
+                msg_type = message
+                data_str = ""
+            
+            data = {}
+            if data_str:
+                params = data_str.split(self.PARAM_SEP)
+                for param in params:
+                    if self.VALUE_SEP in param:
+                        key, value = param.split(self.VALUE_SEP, 1)
+                        try:
+                            if '.' in value:
+                                data[key] = float(value)
+                            else:
+                                data[key] = int(value)
+                        except ValueError:
+                            data[key] = value
+                    else:
+                        data[param] = True
+            
+            return {'type': msg_type, 'data': data,
+                    'timestamp': self.clock() if timestamp is None else timestamp}
+        except Exception as e:
+            return None
+
+
+class PendingRequest:
+    """Completion handle for a command waiting on its ACK/NACK
+    
+    The receive thread completes it directly when the matching response
+    arrives, so waiters never have to scan the shared rx queue.
+    """
+    
+    def __init__(self, request_id: int, command: str):
+        self.id = request_id
+        self.command = command
+        self.sent_ns = time.perf_counter_ns()
+        self.response = None
+        self.acked = False
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+    
+    def complete(self, response: Optional[Dict[str, Any]], acked: bool):
+        self.response = response
+        self.acked = acked
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+    
+    def add_done_callback(self, callback: Callable[['PendingRequest'], None]):
+        """Call callback(pending) once complete (immediately if it already is)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+    
+    def done(self) -> bool:
+        return self._event.is_set()
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """True once ACKed; False on NACK or timeout"""
+        return self._event.wait(timeout) and self.acked
+
+
+class CallbackDispatcher:
+    """Runs message callbacks on a worker thread so slow handlers never stall reception
+    
+    Each message type maps to a priority with its own bounded ring buffer.
+    The worker always drains the highest non-empty priority first, so a FAULT
+    is handled ahead of any DATA backlog. A full ring overwrites its oldest
+    entry; overflows are counted per priority.
+    """
+    
+    PRIORITY_NAMES = ('fault', 'response', 'telemetry')
+    PRIORITIES = {'FAULT': 0, 'ACK': 1, 'NACK': 1, 'DATA': 2}
+    DEFAULT_PRIORITY = 1
+    RING_SIZES = (64, 64, 256)
+    
+    def __init__(self, callbacks: Dict[str, Callable]):
+        self.callbacks = callbacks
+        self.rings = [deque(maxlen=size) for size in self.RING_SIZES]
+        self._cond = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.submitted = [0] * len(self.rings)
+        self.dispatched = [0] * len(self.rings)
+        self.overflows = [0] * len(self.rings)
+        self.errors = 0
+        self.queue_latency = [LatencyHistogram() for _ in self.rings]
+        self.tracer: Optional[FrameTracer] = None
+        self._active = False  # a callback is running
+        self.on_idle: Optional[Callable[[], None]] = None  # called, no lock held, when the rings run dry
+    
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='ev-dispatch', daemon=True)
+        self.thread.start()
+    
+    def stop(self, timeout: float = 1.0):
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+        if self.thread:
+            self.thread.join(timeout=timeout)
+    
+    def submit(self, parsed_msg: Dict[str, Any]):
+        """Queue a message for its callback (called on the receive thread)"""
+        if parsed_msg['type'] not in self.callbacks:
+            return
+        priority = self.PRIORITIES.get(parsed_msg['type'], self.DEFAULT_PRIORITY)
+        ring = self.rings[priority]
+        with self._cond:
+            if len(ring) == ring.maxlen:
+                self.overflows[priority] += 1
+            ring.append((parsed_msg, time.perf_counter_ns()))
+            self.submitted[priority] += 1
+            self._cond.notify()
+    
+    def _next(self):
+        if self.on_idle is not None:
+            with self._cond:
+                self._active = False
+                idle = not any(self.rings)
+            if idle:
+                self.on_idle()
+        with self._cond:
+            self._active = False
+            while self.running:
+                for priority, ring in enumerate(self.rings):
+                    if ring:
+                        self._active = True
+                        return priority, ring.popleft()
+                self._cond.wait()
+        return None
+    
+    def _run(self):
+        while True:
+            item = self._next()
+            if item is None:
+                break
+            priority, (parsed_msg, queued_ns) = item
+            self.queue_latency[priority].record(time.perf_counter_ns() - queued_ns)
+            if self.tracer is not None and 'trace' in parsed_msg:
+                self.tracer.stamp(parsed_msg['trace'], FrameTracer.DISPATCHED)
+            msg_type = parsed_msg['type']
+            callback = self.callbacks.get(msg_type)
+            if callback is None:
+                continue
+            try:
+                callback(parsed_msg)
+            except Exception as e:
+                self.errors += 1
+                print(f"Callback error for {msg_type}: {e}")
+            self.dispatched[priority] += 1
+    
+    def backlog(self) -> int:
+        """Messages queued but not yet dispatched"""
+        return sum(len(ring) for ring in self.rings)
+    
+    def idle(self) -> bool:
+        """Nothing queued and no callback running"""
+        with self._cond:
+            return not self._active and not any(self.rings)
+    
+    def stats(self) -> Dict[str, Any]:
+        stats = {'errors': self.errors}
+        for priority, name in enumerate(self.PRIORITY_NAMES):
+            stats[name] = {
+                'depth': len(self.rings[priority]),
+                'submitted': self.submitted[priority],
+                'dispatched': self.dispatched[priority],
+                'overflows': self.overflows[priority],
+                'queue_latency': self.queue_latency[priority].summary()
+            }
+        return stats
+
+
+class TxScheduler:
+    """Single writer thread for everything EVProtocol sends
+    
+    Messages are queued per priority (ESTOP > commands > queries) and the
+    writer always drains the highest non-empty priority first, encoding each
+    message at write time (so binary sequence numbers follow wire order).
+    With a drain callable (a real UART: pyserial's flush(), i.e. tcdrain)
+    the writer sends up to DRAIN_BATCH messages in one write() and then
+    blocks in drain() until they have left the wire, so ordering is decided
+    here rather than behind kilobytes already handed to the UART, without
+    polling the driver. Otherwise up to MAX_BATCH pending messages go out
+    in one write() and the driver queues them. A parameterless query that
+    is already queued (e.g. GET_TELEM from a polling loop that got ahead of
+    the link) is coalesced instead of queued twice.
+    """
+    
+    PRIORITY_NAMES = ('estop', 'command', 'query')
+    ESTOP_TYPES = {MessageType.EMERGENCY_STOP.value}
+    MAX_BATCH = 32
+    # Messages per write when draining: bounds an ESTOP's wait to a few frames on the wire
+    DRAIN_BATCH = 4
+    
+    def __init__(self, write: Callable[[List[Tuple[str, Optional[Dict[str, Any]]]]], None],
+                 drain: Optional[Callable[[], None]] = None):
+        self.write = write
+        self.drain = drain
+        self.queues = [deque() for _ in self.PRIORITY_NAMES]
+        self._queued_queries = set()
+        self._cond = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.submitted = [0] * len(self.queues)
+        self.written = [0] * len(self.queues)
+        self.coalesced = 0
+        self.batches = 0
+        self.errors = 0
+        self.queue_latency = [LatencyHistogram() for _ in self.queues]
+        self._writing = False  # a taken batch hasn't been written yet
+        self.on_idle: Optional[Callable[[], None]] = None  # called, no lock held, when the queues run dry
+    
+    @classmethod
+    def priority(cls, msg_type: str) -> int:
+        if msg_type in cls.ESTOP_TYPES:
+            return 0
+        return 2 if msg_type.startswith('GET_') else 1
+    
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='ev-tx', daemon=True)
+        self.thread.start()
+    
+    def stop(self, timeout: float = 1.0):
+        """Write whatever is still queued, then stop the writer"""
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+        if self.thread:
+            self.thread.join(timeout=timeout)
+    
+    def submit(self, msg_type: str, params: Optional[Dict[str, Any]] = None) -> bool:
+        """Queue a message; False if an identical query is already waiting"""
+        priority = self.priority(msg_type)
+        with self._cond:
+            if priority == 2 and not params:
+                if msg_type in self._queued_queries:
+                    self.coalesced += 1
+                    return False
+                self._queued_queries.add(msg_type)
+            self.queues[priority].append((msg_type, params, time.perf_counter_ns()))
+            self.submitted[priority] += 1
+            self._cond.notify()
+        return True
+    
+    def _take_batch(self):
+        limit = self.DRAIN_BATCH if self.drain is not None else self.MAX_BATCH
+        if self.on_idle is not None:
+            with self._cond:
+                self._writing = False
+                idle = not any(self.queues)
+            if idle:
+                self.on_idle()
+        with self._cond:
+            self._writing = False
+            while self.running and not any(self.queues):
+                self._cond.wait()
+            batch = []
+            for priority, pending in enumerate(self.queues):
+                while pending and len(batch) < limit:
+                    msg_type, params, queued_ns = pending.popleft()
+                    if priority == 2 and not params:
+                        self._queued_queries.discard(msg_type)
+                    batch.append((priority, msg_type, params, queued_ns))
+            self._writing = bool(batch)
+            return batch
+    
+    def _wait_for_driver(self):
+        """Block until the driver has sent everything written so far"""
+        if self.drain is None:
+            return
+        try:
+            self.drain()
+        except Exception:
+            self.drain = None  # port can't drain: let the driver queue instead
+    
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                if not self.running:
+                    break
+                continue
+            try:
+                self.write([(msg_type, params) for _, msg_type, params, _ in batch])
+            except Exception as e:
+                self.errors += 1
+                print(f"Protocol TX Error: {e}")
+                continue
+            done_ns = time.perf_counter_ns()
+            self._wait_for_driver()
+            self.batches += 1
+            for priority, _, _, queued_ns in batch:
+                self.written[priority] += 1
+                self.queue_latency[priority].record(done_ns - queued_ns)
+    
+    def backlog(self) -> int:
+        return sum(len(pending) for pending in self.queues)
+    
+    def idle(self) -> bool:
+        """Nothing queued and nothing being written"""
+        with self._cond:
+            return not self._writing and not any(self.queues)
+    
+    def stats(self) -> Dict[str, Any]:
+        stats = {'batches': self.batches, 'coalesced': self.coalesced, 'errors': self.errors}
+        for priority, name in enumerate(self.PRIORITY_NAMES):
+            stats[name] = {
+                'depth': len(self.queues[priority]),
+                'submitted': self.submitted[priority],
+                'written': self.written[priority],
+                'queue_latency': self.queue_latency[priority].summary()
+            }
+        return stats
+
+
+class MessageFraming:
+    """Encode/parse helpers shared by the threaded and asyncio protocol handlers"""
+    
+    START_CHAR = MessageParser.START_CHAR
+    END_CHAR = MessageParser.END_CHAR
+    SEPARATOR = MessageParser.SEPARATOR
+    PARAM_SEP = MessageParser.PARAM_SEP
+    VALUE_SEP = MessageParser.VALUE_SEP
+    
+    # Raw-frame prefixes of a FAULT message (checked before any parsing)
+    FAULT_PREFIXES = (b'<FAULT:', b'<FAULT>')
+    
+    def _init_framing(self):
+        self.decoder = FrameDecoder()
+        self.parser = MessageParser()
+        self.codec = BinaryCodec()
+        self.tx_binary = False  # RX accepts binary frames only once decoder.binary is set
+        self.capture = None  # optional WireCapture tap on every rx/tx chunk
+        self.estop_on_fault = False  # FAULT fast path (EVProtocol)
+        self.clock: Callable[[], float] = time.monotonic
+    
+    def set_clock(self, clock: Callable[[], float]):
+        """Stamp parsed messages with clock() instead of time.monotonic() (e.g. a VirtualClock)"""
+        self.clock = self.parser.clock = self.codec.clock = clock
+    
+    def _register_link_metrics(self, metrics: 'MetricsRegistry'):
+        """Receive path, framing and request metrics common to both protocol handlers"""
+        metrics.counter('ev_rx_bytes_total', "Bytes read from the serial port", fn=lambda: self.rx_stats.bytes)
+        metrics.counter('ev_rx_frames_total', "Frames parsed and delivered", fn=lambda: self.rx_stats.frames)
+        metrics.counter('ev_rx_parse_errors_total', "Frames that failed to parse",
+                        fn=lambda: self.rx_stats.parse_errors)
+        metrics.counter('ev_rx_wakeups_total', "Receive loop wake-ups", fn=lambda: self.rx_stats.wakeups)
+        metrics.counter('ev_rx_idle_wakeups_total', "Receive loop wake-ups without data",
+                        fn=lambda: self.rx_stats.idle_wakeups)
+        metrics.histogram('ev_rx_delivery_latency_seconds', "Read to hand-off of a received frame",
+                          fn=lambda: self.rx_stats.delivery_latency)
+        metrics.counter('ev_decoder_dropped_bytes_total', "Bytes discarded between frames",
+                        fn=lambda: self.decoder.dropped_bytes)
+        metrics.counter('ev_decoder_resyncs_total', "Frame decoder resynchronisations",
+                        fn=lambda: self.decoder.resyncs)
+        metrics.counter('ev_decoder_crc_errors_total', "Binary frames with a bad CRC",
+                        fn=lambda: self.decoder.crc_errors)
+        metrics.counter('ev_decoder_overflows_total', "Frame buffer overflows", fn=lambda: self.decoder.overflows)
+        metrics.counter('ev_codec_seq_gaps_total', "Gaps in binary frame sequence numbers",
+                        fn=lambda: self.codec.seq_gaps)
+        metrics.gauge('ev_pending_requests', "Commands waiting for their ACK/NACK", fn=lambda: len(self._pending))
+        metrics.histogram('ev_ack_latency_seconds', "Command send to ACK/NACK", fn=lambda: self.ack_latency)
+    
+    def _is_fault_frame(self, frame: bytes) -> bool:
+        if frame[0] == BinaryCodec.SYNC:
+            return (frame[3] == BinaryCodec.TYPE_TEXT and
+                    frame.startswith(self.FAULT_PREFIXES, BinaryCodec.HEADER.size))
+        return frame.startswith(self.FAULT_PREFIXES)
+    
+    def _parse_message(self, message: str) -> Optional[Dict[str, Any]]:
+        return self.parser.parse(message)
+    
+    def _parse_frame(self, frame: bytes) -> Optional[Dict[str, Any]]:
+        if frame[0] == BinaryCodec.SYNC:
+            return self.codec.decode(frame, self._parse_message)
+        return self._parse_message(frame.decode('utf-8', errors='ignore'))
+    
+    def _build_message(self, msg_type: str, params: Optional[Dict[str, Any]] = None) -> str:
+        message = self.START_CHAR + msg_type
+        
+        if params:
+            param_strs = [f"{k}{self.VALUE_SEP}{v}" for k, v in params.items()]
+            message += self.SEPARATOR + self.PARAM_SEP.join(param_strs)
+        
+        message += self.END_CHAR
+        return message
+    
+    def _encode_message(self, msg_type: str, params: Optional[Dict[str, Any]] = None) -> bytes:
+        """Wire bytes for a message in the negotiated framing"""
+        message = self._build_message(msg_type, params)
+        if self.tx_binary:
+            return self.codec.encode_text(message)
+        return message.encode('utf-8')
+    
+    def _pop_pending(self, parsed_msg: Dict[str, Any]):
+        """Remove and return the outstanding request an ACK/NACK answers, if any"""
+        data = parsed_msg['data']
+        pending = self._pending.pop(data.get('ID'), None)
+        if pending is None:
+            # Firmware that doesn't echo IDs: oldest request for the same command
+            command = data.get('ACK') if parsed_msg['type'] == 'ACK' else data.get('CMD')
+            for request_id, candidate in self._pending.items():
+                if candidate.command == command:
+                    return self._pending.pop(request_id)
+        return pending
+
+
+class EVProtocol(MessageFraming):
+    """Message protocol handler"""
+    
+    # Receive engines: 'event' blocks on the port's file descriptor, 'poll' is the
+    # original in_waiting/sleep(10 ms) loop kept for comparison benchmarks
+    RX_MODES = ('event', 'poll')
+    POLL_INTERVAL = 0.01
+    # Transmit: 'scheduled' hands messages to the TxScheduler writer thread,
+    # 'direct' is the original synchronous write + flush kept for comparison
+    TX_MODES = ('scheduled', 'direct')
+    
+    # Messages kept for get_message() consumers (from the first call on); the
+    # oldest is dropped when full
+    RX_QUEUE_SIZE = 256
+    # Requests nobody waited out are expired beyond this many in flight
+    MAX_PENDING = 64
+    # FAULT fast path: FAULT frames within this window share one ESTOP
+    ESTOP_HOLDOFF = 0.05
+    
+    def __init__(self, port: Union[str, Any], baudrate: int = 115200, timeout: float = 0.1,
+                 rx_mode: str = 'event', capture: Optional['WireCapture'] = None,
+                 tx_mode: str = 'scheduled', clock: Optional[Callable[[], float]] = None):
+        if rx_mode not in self.RX_MODES:
+            raise ValueError(f"Unknown rx_mode: {rx_mode}")
+        if tx_mode not in self.TX_MODES:
+            raise ValueError(f"Unknown tx_mode: {tx_mode}")
+        if isinstance(port, str):
+            self.serial = open_transport(port, baudrate, timeout)
+        else:
+            self.serial = port  # already-open serial.Serial, Transport or stand-in (e.g. ReplaySource)
+        self.rx_queue: Optional[queue.Queue] = None  # created by the first get_message()
+        self.rx_queue_drops = 0
+        self.running = False
+        self.rx_thread = None
+        self.callbacks = {}
+        self.dispatcher = CallbackDispatcher(self.callbacks)
+        self.rx_mode = rx_mode
+        self.rx_stats = RxStats()
+        self._init_framing()
+        self.decoder.binary = getattr(self.serial, 'binary_rx', False)  # e.g. replay of a binary session
+        if clock is not None:
+            self.set_clock(clock)
+        self.capture = capture
+        
+        # FAULT fast path: with estop_on_fault the receive thread writes a
+        # pre-built ESTOP as soon as a FAULT frame is framed, ahead of parsing
+        # and dispatch; _tx_lock serialises it with every other write
+        self._tx_lock = threading.Lock()
+        self._estop_message = self._build_message(MessageType.EMERGENCY_STOP.value)
+        self._estop_bytes = self._estop_message.encode('utf-8')
+        self._last_fast_estop = 0.0
+        self.fast_estops = 0
+        self.fault_latency = LatencyHistogram()
+        self.tx_mode = tx_mode
+        self.tracer: Optional[FrameTracer] = None  # see enable_tracing()
+        self.tx_scheduler = None
+        if tx_mode == 'scheduled':
+            # Only a real UART has a transmit queue worth draining (pyserial: flush() = tcdrain)
+            drain = self.serial.flush if hasattr(self.serial, 'out_waiting') else None
+            self.tx_scheduler = TxScheduler(self._write_messages, drain)
+        
+        # Virtual time: each stage tells the clock when it has finished its work, so a
+        # lockstep simulator (STM32Simulator.sync_with) can block instead of polling
+        self.on_idle: Optional[Callable[[], None]] = None
+        if isinstance(clock, VirtualClock):
+            self.on_idle = self.dispatcher.on_idle = clock.notify
+            if self.tx_scheduler is not None:
+                self.tx_scheduler.on_idle = clock.notify
+        
+        # Outstanding commands by request ID (echoed back as ID= in ACK/NACK)
+        self._pending: Dict[int, PendingRequest] = {}
+        self._pending_lock = threading.Lock()
+        self._next_request_id = 1
+        self.ack_latency = LatencyHistogram()
+        
+        self.metrics = MetricsRegistry()
+        self._register_metrics()
+        
+        # Self-pipe so stop() can wake a receive thread blocked in select()
+        self._rx_fd = self._port_fileno() if rx_mode == 'event' else None
+        # Transports that return everything buffered in one call (see Transport.read_available)
+        self._read_any = getattr(self.serial, 'read_available', None)
+        self._wake_r = self._wake_w = None
+        if self._rx_fd is not None:
+            self._wake_r, self._wake_w = os.pipe()
+    
+    def _register_metrics(self):
+        metrics = self.metrics
+        self._register_link_metrics(metrics)
+        metrics.counter('ev_rx_queue_drops_total', "Messages dropped from the full rx queue",
+                        fn=lambda: self.rx_queue_drops)
+        metrics.gauge('ev_rx_queue_depth', "Messages waiting in the rx queue",
+                      fn=lambda: self.rx_queue.qsize() if self.rx_queue is not None else 0)
+        dispatcher = self.dispatcher
+        for priority, name in enumerate(dispatcher.PRIORITY_NAMES):
+            labels = {'priority': name}
+            metrics.gauge('ev_dispatch_depth', "Messages waiting for their callback", labels,
+                          fn=lambda p=priority: len(dispatcher.rings[p]))
+            metrics.counter('ev_dispatch_submitted_total', "Messages handed to the dispatcher", labels,
+                            fn=lambda p=priority: dispatcher.submitted[p])
+            metrics.counter('ev_dispatch_overflows_total', "Messages dropped from a full dispatch ring", labels,
+                            fn=lambda p=priority: dispatcher.overflows[p])
+            metrics.histogram('ev_dispatch_queue_latency_seconds', "Hand-off to callback start", labels,
+                              fn=lambda p=priority: dispatcher.queue_latency[p])
+        metrics.counter('ev_callback_errors_total', "Exceptions raised by callbacks", fn=lambda: dispatcher.errors)
+        scheduler = self.tx_scheduler
+        if scheduler is not None:
+            for priority, name in enumerate(scheduler.PRIORITY_NAMES):
+                labels = {'priority': name}
+                metrics.gauge('ev_tx_depth', "Messages waiting for the writer thread", labels,
+                              fn=lambda p=priority: len(scheduler.queues[p]))
+                metrics.counter('ev_tx_written_total', "Messages written to the port", labels,
+                                fn=lambda p=priority: scheduler.written[p])
+                metrics.histogram('ev_tx_queue_latency_seconds', "Submit to write of an outgoing message", labels,
+                                  fn=lambda p=priority: scheduler.queue_latency[p])
+            metrics.counter('ev_tx_coalesced_total', "Duplicate queries merged into a queued one",
+                            fn=lambda: scheduler.coalesced)
+            metrics.counter('ev_tx_errors_total', "Failed port writes", fn=lambda: scheduler.errors)
+        metrics.counter('ev_fast_estops_total', "ESTOPs written by the FAULT fast path",
+                        fn=lambda: self.fast_estops)
+        metrics.histogram('ev_fault_estop_latency_seconds', "FAULT frame read to fast-path ESTOP written",
+                          fn=lambda: self.fault_latency)
+    
+    def enable_tracing(self, sample_every: int = 1) -> FrameTracer:
+        """Start stamping received frames with per-stage times (see FrameTracer)"""
+        if self.tracer is None:
+            self.tracer = FrameTracer(sample_every)
+            self.dispatcher.tracer = self.tracer
+        return self.tracer
+    
+    def disable_tracing(self):
+        self.tracer = self.dispatcher.tracer = None
+    
+    def _port_fileno(self) -> Optional[int]:
+        """File descriptor of the port, or None where select() can't be used on it"""
+        if os.name == 'nt':
+            return None
+        try:
+            return self.serial.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+        
+    def start(self):
+        self.running = True
+        self.rx_stats = RxStats()
+        self.dispatcher.start()
+        if self.tx_scheduler:
+            self.tx_scheduler.start()
+        self.rx_thread = threading.Thread(target=self._receive_loop, name='ev-rx', daemon=True)
+        self.rx_thread.start()
+        
+    def stop(self):
+        self.running = False
+        if self._wake_w is not None:
+            os.write(self._wake_w, b'x')
+        if self.rx_thread:
+            self.rx_thread.join(timeout=1.0)
+        self.dispatcher.stop()
+        if self.tx_scheduler:
+            self.tx_scheduler.stop()
+        self.serial.close()
+        if self.capture is not None:
+            self.capture.close()
+        if self._wake_r is not None:
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            self._wake_r = self._wake_w = None
+    
+    def _read_available(self) -> bytes:
+        """Block until bytes arrive (or stop() is called) and return them"""
+        if self.rx_mode == 'poll':
+            if self.serial.in_waiting > 0:
+                self.rx_stats.wakeups += 1
+                return self.serial.read(self.serial.in_waiting)
+            time.sleep(self.POLL_INTERVAL)
+            self.rx_stats.wakeups += 1
+            self.rx_stats.idle_wakeups += 1
+            return b''
+        
+        if self._rx_fd is not None:
+            ready, _, _ = select.select([self._rx_fd, self._wake_r], [], [])
+            self.rx_stats.wakeups += 1
+            if self._rx_fd not in ready:
+                self.rx_stats.idle_wakeups += 1
+                return b''
+            return self.serial.read(self.serial.in_waiting or 1)
+        
+        # No selectable descriptor: blocking read of the first byte (bounded by the
+        # port timeout), then drain whatever else has arrived, in one call if the
+        # transport can
+        if self._read_any is not None:
+            data = self._read_any()
+            self.rx_stats.wakeups += 1
+            if not data:
+                self.rx_stats.idle_wakeups += 1
+            return data
+        data = self.serial.read(1)
+        self.rx_stats.wakeups += 1
+        if not data:
+            self.rx_stats.idle_wakeups += 1
+            return b''
+        waiting = self.serial.in_waiting
+        if waiting:
+            data += self.serial.read(waiting)
+        return data
+        
+    def _receive_loop(self):
+        self.decoder.reset()
+        while self.running:
+            try:
+                raw = self._read_available()
+                if not raw:
+                    continue
+                read_ns = time.perf_counter_ns()
+                if self.capture is not None:
+                    self.capture.record(WireCapture.RX, raw)
+                
+                frames = self.decoder.feed(raw)
+                tracer = self.tracer
+                if tracer is not None:
+                    framed_ns = time.perf_counter_ns()
+                for frame in frames:
+                    estop_sent = False
+                    if self.estop_on_fault and self._is_fault_frame(frame):
+                        estop_sent = self._fast_estop(read_ns)
+                    parsed = self._parse_frame(frame)
+                    if parsed:
+                        if estop_sent:
+                            parsed['estop_sent'] = True
+                        if tracer is not None:
+                            tracer.begin(parsed, read_ns, framed_ns)
+                        if parsed['type'] == 'ACK' or parsed['type'] == 'NACK':
+                            self._complete_request(parsed)
+                        if self.rx_queue is not None:
+                            self._enqueue(parsed)
+                        self._trigger_callback(parsed)
+                        self.rx_stats.frames += 1
+                        self.rx_stats.delivery_latency.record(time.perf_counter_ns() - read_ns)
+                    else:
+                        self.rx_stats.parse_errors += 1
+                # Counted once its frames are handed on, so bytes == bytes sent means caught up
+                self.rx_stats.bytes += len(raw)
+                if self.on_idle is not None:
+                    self.on_idle()
+            except Exception as e:
+                if not self.running:
+                    break
+                print(f"Protocol RX Error: {e}")
+                time.sleep(0.1)
+    
+    def _fast_estop(self, read_ns: int) -> bool:
+        """Write ESTOP straight from the receive thread (FAULT fast path)
+        
+        Returns True when an ESTOP is on the wire for this fault: written now,
+        or by a successful write within ESTOP_HOLDOFF. A failed write is not
+        held off, so the next FAULT frame tries again
+        """
+        now = time.monotonic()
+        if now - self._last_fast_estop < self.ESTOP_HOLDOFF:
+            return True
+        try:
+            with self._tx_lock:
+                data = self.codec.encode_text(self._estop_message) if self.tx_binary else self._estop_bytes
+                self.serial.write(data)
+        except Exception as e:
+            print(f"Protocol TX Error (fault ESTOP): {e}")
+            return False
+        self._last_fast_estop = now
+        self.fault_latency.record(time.perf_counter_ns() - read_ns)
+        self.fast_estops += 1
+        if self.capture is not None:
+            self.capture.record(WireCapture.TX, data)
+        return True
+    
+    def get_rx_stats(self) -> Dict[str, Any]:
+        """Receive engine statistics (wake-ups, throughput, delivery latency)"""
+        stats = self.rx_stats.summary()
+        stats['decoder'] = self.decoder.stats()
+        stats['codec'] = self.codec.stats()
+        stats['tx_binary'] = self.tx_binary
+        stats['rx_queue_drops'] = self.rx_queue_drops
+        stats['pending_requests'] = len(self._pending)
+        stats['ack_latency'] = self.ack_latency.summary()
+        stats['dispatch'] = self.dispatcher.stats()
+        stats['fast_estops'] = self.fast_estops
+        stats['fault_latency'] = self.fault_latency.summary()
+        if self.rx_mode == 'event' and self._rx_fd is None:
+            stats['rx_mode'] = 'blocking-read'
+        else:
+            stats['rx_mode'] = self.rx_mode
+        return stats
+    
+    def send_message(self, msg_type: MessageType, params: Optional[Dict[str, Any]] = None) -> bool:
+        """Queue a message for the writer thread ('direct' tx_mode: write it now)
+        
+        True once the message is queued, or coalesced into an identical query
+        that is already waiting.
+        """
+        if self.tx_scheduler:
+            self.tx_scheduler.submit(msg_type.value, params)
+            return True
+        try:
+            with self._tx_lock:
+                data = self._encode_message(msg_type.value, params)
+                self.serial.write(data)
+                self.serial.flush()
+            if self.capture is not None:
+                self.capture.record(WireCapture.TX, data)
+            return True
+        except Exception as e:
+            print(f"Protocol TX Error: {e}")
+            return False
+    
+    def _write_messages(self, messages: List[Tuple[str, Optional[Dict[str, Any]]]]):
+        """TxScheduler writer: encode in wire order and write the lot at once"""
+        with self._tx_lock:
+            data = b''.join(self._encode_message(msg_type, params) for msg_type, params in messages)
+            self.serial.write(data)
+        if self.capture is not None:
+            self.capture.record(WireCapture.TX, data)
+    
+    def get_tx_stats(self) -> Dict[str, Any]:
+        """Writer thread statistics (per-priority queue latency, coalesced queries)"""
+        if self.tx_scheduler is None:
+            return {'tx_mode': self.tx_mode}
+        stats = self.tx_scheduler.stats()
+        stats['tx_mode'] = self.tx_mode
+        return stats
+    
+    def negotiate_framing(self, binary: bool, timeout: float = 0.5) -> bool:
+        """Ask the STM32 to switch framing; TX switches only once it ACKs
+        
+        Firmware without binary support NACKs the command and the link stays ASCII.
+        """
+        mode = 'BIN' if binary else 'ASCII'
+        was_binary = self.decoder.binary
+        self.decoder.binary = was_binary or binary  # the STM32 may switch before its ACK arrives
+        if self.request(MessageType.SET_MODE, {'MODE': mode}, timeout=timeout):
+            self.tx_binary = self.decoder.binary = binary
+            return True
+        self.decoder.binary = was_binary
+        return False
+    
+    def subscribe_telemetry(self, rate_hz: float, timeout: float = 0.5) -> Optional[bool]:
+        """Ask the STM32 to push DATA frames at rate_hz instead of answering GET_TELEM polls
+        
+        True once ACKed, False if NACKed, None if no answer came back in time.
+        """
+        pending = self.send_request(MessageType.SUBSCRIBE, {'RATE': rate_hz})
+        if pending.wait(timeout):
+            return True
+        if not pending.done():
+            self._discard_request(pending)
+            return None
+        return False if pending.response is not None else None  # None: expired unanswered
+    
+    def unsubscribe_telemetry(self, timeout: float = 0.5) -> bool:
+        return self.request(MessageType.UNSUBSCRIBE, timeout=timeout)
+    
+    def register_callback(self, msg_type: str, callback):
+        self.callbacks[msg_type] = callback
+    
+    def _trigger_callback(self, parsed_msg: Dict[str, Any]):
+        self.dispatcher.submit(parsed_msg)
+    
+    def _enqueue(self, parsed_msg: Dict[str, Any]):
+        try:
+            self.rx_queue.put_nowait(parsed_msg)
+        except queue.Full:
+            try:
+                self.rx_queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.rx_queue_drops += 1
+            self.rx_queue.put_nowait(parsed_msg)
+    
+    def get_message(self, timeout: float = 0.1) -> Optional[Dict[str, Any]]:
+        """Next received message; queueing starts with the first call, callbacks need none"""
+        if self.rx_queue is None:
+            self.rx_queue = queue.Queue(maxsize=self.RX_QUEUE_SIZE)
+        try:
+            return self.rx_queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+    
+    def send_request(self, msg_type: MessageType, params: Optional[Dict[str, Any]] = None) -> PendingRequest:
+        """Send a command tagged with a request ID and return its completion handle
+        
+        Any number of requests can be in flight; each handle is completed by the
+        receive thread when the ACK/NACK carrying its ID arrives.
+        """
+        with self._pending_lock:
+            request_id = self._next_request_id
+            self._next_request_id = request_id % 0xFFFF + 1
+            pending = PendingRequest(request_id, msg_type.value)
+            self._pending[request_id] = pending
+            while len(self._pending) > self.MAX_PENDING:
+                stale = self._pending.pop(next(iter(self._pending)))
+                stale.complete(None, False)
+        
+        params = dict(params) if params else {}
+        params['ID'] = request_id
+        if not self.send_message(msg_type, params):
+            self._discard_request(pending)
+            pending.complete(None, False)
+        return pending
+    
+    def request(self, msg_type: MessageType, params: Optional[Dict[str, Any]] = None,
+                timeout: float = 0.5) -> bool:
+        """Send a command and block until it is ACKed (True) or NACKed/timed out (False)"""
+        pending = self.send_request(msg_type, params)
+        acked = pending.wait(timeout)
+        if not pending.done():
+            self._discard_request(pending)
+        return acked
+    
+    def _discard_request(self, pending: PendingRequest):
+        with self._pending_lock:
+            self._pending.pop(pending.id, None)
+    
+    def _complete_request(self, parsed_msg: Dict[str, Any]):
+        """Match an ACK/NACK to its outstanding request (called on the receive thread)"""
+        with self._pending_lock:
+            pending = self._pop_pending(parsed_msg)
+        if pending is not None:
+            self.ack_latency.record(time.perf_counter_ns() - pending.sent_ns)
+            pending.complete(parsed_msg, parsed_msg['type'] == 'ACK')
+
+
+class SetpointHandle:
+    """Completion handle for a setpoint update submitted to SetpointCommander
+    
+    A value that was superseded before it went out completes together with
+    the newer value that replaced it: sent_value is what the STM32 actually
+    ACKed (or NACKed), coalesced is True when that differs from value.
+    """
+    
+    def __init__(self, key: str, value: Any):
+        self.key = key
+        self.value = value
+        self.sent_value = None
+        self.coalesced = False
+        self.acked = False
+        self.response = None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+    
+    def complete(self, sent_value: Any, response: Optional[Dict[str, Any]], acked: bool):
+        self.sent_value = sent_value
+        self.coalesced = sent_value != self.value
+        self.response = response
+        self.acked = acked
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+    
+    def add_done_callback(self, callback: Callable[['SetpointHandle'], None]):
+        """Call callback(handle) once complete (immediately if it already is)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+    
+    def done(self) -> bool:
+        return self._event.is_set()
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """True once ACKed; False on NACK, timeout or shutdown"""
+        return self._event.wait(timeout) and self.acked
+
+
+class SetpointChannel:
+    """One rate-limited setpoint (e.g. the current limit) and its queued update"""
+    
+    def __init__(self, key: str, msg_type: MessageType, param: str, min_interval: float,
+                 on_ack: Optional[Callable[[Any], None]] = None):
+        self.key = key
+        self.msg_type = msg_type
+        self.param = param
+        self.min_interval = min_interval
+        self.on_ack = on_ack
+        self.next_send = 0.0
+        # Latest value not yet sent, and every handle waiting on it
+        self.queued_value = None
+        self.queued_handles = []
+        # Sent and waiting for its ACK
+        self.in_flight = None
+        self.in_flight_value = None
+        self.in_flight_handles = []
+        self.in_flight_deadline = 0.0
+        self.submitted = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.acked = 0
+        self.failed = 0
+
+
+class SetpointCommander:
+    """Coalescing, rate-limited sender for setpoint commands
+    
+    submit() never blocks: it queues the value and returns a SetpointHandle.
+    Per channel at most one command is in flight and sends are at least
+    min_interval apart; anything submitted meanwhile replaces the queued
+    value, so a UI slider or a script sweeping the limit costs one command
+    per interval instead of one per call plus a blocking ACK wait.
+    """
+    
+    def __init__(self, protocol: EVProtocol, ack_timeout: float = 0.5):
+        self.protocol = protocol
+        self.ack_timeout = ack_timeout
+        self.channels: Dict[str, SetpointChannel] = {}
+        self._cond = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='ev-setpoints', daemon=True)
+        self.thread.start()
+    
+    def add_channel(self, key: str, msg_type: MessageType, param: str, rate_hz: float,
+                    on_ack: Optional[Callable[[Any], None]] = None):
+        """Register a setpoint; on_ack(value) runs on the commander thread when one is ACKed"""
+        min_interval = 1.0 / rate_hz if rate_hz else 0.0
+        self.channels[key] = SetpointChannel(key, msg_type, param, min_interval, on_ack)
+    
+    def submit(self, key: str, value: Any) -> SetpointHandle:
+        """Queue a new value for a setpoint, replacing any value not yet sent"""
+        handle = SetpointHandle(key, value)
+        with self._cond:
+            if not self.running:
+                handle.complete(None, None, False)
+                return handle
+            channel = self.channels[key]
+            channel.submitted += 1
+            if channel.queued_handles:
+                channel.coalesced += 1
+            channel.queued_value = value
+            channel.queued_handles.append(handle)
+            self._cond.notify()
+        return handle
+    
+    def max_wait(self, key: str) -> float:
+        """Longest a handle for this setpoint can take: the command already in
+        flight, the rate limit, then its own ACK"""
+        return 2 * self.ack_timeout + self.channels[key].min_interval
+    
+    def stop(self):
+        """Stop sending; anything queued or unacknowledged completes as failed"""
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+        self.thread.join(timeout=1.0)
+        self._fail_outstanding()
+    
+    def _fail_outstanding(self):
+        for channel in self.channels.values():
+            if channel.in_flight is not None:
+                self.protocol._discard_request(channel.in_flight)
+            handles = channel.in_flight_handles + channel.queued_handles
+            channel.in_flight = None
+            channel.in_flight_handles = []
+            channel.queued_handles = []
+            for handle in handles:
+                handle.complete(None, None, False)
+    
+    def _notify(self, pending: PendingRequest):
+        with self._cond:
+            self._cond.notify()
+    
+    def _run(self):
+        with self._cond:
+            while self.running:
+                wake = None
+                try:
+                    now = time.monotonic()
+                    for channel in self.channels.values():
+                        due = self._service(channel, now)
+                        if due is not None:
+                            wake = due if wake is None else min(wake, due)
+                except Exception as e:
+                    # Keep the thread alive, but nobody may be left waiting on a lost command
+                    print(f"Setpoint sender error: {e}")
+                    self._fail_outstanding()
+                    wake = None
+                self._cond.wait(None if wake is None else max(0.0, wake - time.monotonic()))
+    
+    def _service(self, channel: SetpointChannel, now: float) -> Optional[float]:
+        """Finish and start this channel's commands; returns when it next needs attention"""
+        pending = channel.in_flight
+        if pending is not None:
+            if pending.done() or now >= channel.in_flight_deadline:
+                if not pending.done():
+                    self.protocol._discard_request(pending)
+                self._finish(channel, pending.response, pending.done() and pending.acked)
+            else:
+                return channel.in_flight_deadline
+        
+        if not channel.queued_handles:
+            return None
+        if now < channel.next_send:
+            return channel.next_send
+        
+        value, handles = channel.queued_value, channel.queued_handles
+        pending = self.protocol.send_request(channel.msg_type, {channel.param: value})
+        channel.queued_value, channel.queued_handles = None, []
+        pending.add_done_callback(self._notify)
+        channel.sent += 1
+        channel.next_send = now + channel.min_interval
+        channel.in_flight = pending
+        channel.in_flight_value = value
+        channel.in_flight_handles = handles
+        channel.in_flight_deadline = now + self.ack_timeout
+        return channel.in_flight_deadline
+    
+    def _finish(self, channel: SetpointChannel, response: Optional[Dict[str, Any]], acked: bool):
+        value, handles = channel.in_flight_value, channel.in_flight_handles
+        channel.in_flight = None
+        if acked:
+            channel.acked += 1
+            if channel.on_ack:
+                channel.on_ack(value)  # if this raises, _run fails the handles
+        else:
+            channel.failed += 1
+        channel.in_flight_handles = []
+        for handle in handles:
+            handle.complete(value, response, acked)
+    
+    def register_metrics(self, metrics: MetricsRegistry):
+        for key, channel in self.channels.items():
+            labels = {'setpoint': key}
+            for field in ('submitted', 'sent', 'coalesced', 'acked', 'failed'):
+                metrics.counter(f'ev_setpoint_{field}_total', f"Setpoint updates {field}", labels,
+                                fn=lambda c=channel, f=field: getattr(c, f))
+    
+    def stats(self) -> Dict[str, Any]:
+        return {key: {'submitted': c.submitted, 'sent': c.sent, 'coalesced': c.coalesced,
+                      'acked': c.acked, 'failed': c.failed}
+                for key, c in self.channels.items()}
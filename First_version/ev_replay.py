@@ -0,0 +1,237 @@
+"""
+EV Controller - Session Replay
+ReplaySource plays a recorded log or capture back in place of a serial port
+"""
+
+import time
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Any, Sequence, Tuple
+
+from ev_transport import WireCapture
+from ev_protocol import BinaryCodec, MessageFraming, TELEMETRY_KEYS
+from ev_logging import ColumnarLogBackend, ColumnarLogReader, CsvLogBackend, LogCompressor
+
+
+# ============================================================================
+# SESSION REPLAY
+# ============================================================================
+
+class ReplaySource(MessageFraming):
+    """Serial-port stand-in that plays a recorded session back as wire bytes
+    
+    Implements the part of serial.Serial that EVProtocol uses (read, in_waiting,
+    write, flush, close, timeout), so `EVProtocol(ReplaySource(...))` or
+    `EVController(ReplaySource(...))` runs the real receive, parse, dispatch
+    and safety path against a recorded drive. frames is a list of
+    (seconds, wire bytes); from_file() builds it from a DataLogger CSV or
+    columnar log (telemetry re-encoded as DATA frames), the RX side of a
+    WireCapture (exact bytes and chunking) or a raw frame dump (.txt / .frames).
+    
+    speed=1.0 is real time, N plays N times faster and None releases frames
+    as fast as they are read. At max speed set `hold` to a callable that
+    returns True while the consumer is saturated (e.g. dispatcher backlog) so
+    no frames are lost to ring overflow. Commands written by the controller
+    are parsed and counted; with auto_ack every non-GET command is answered
+    with an ACK echoing its ID, so request() calls don't time out.
+    
+    Parsed messages are stamped with the replay's own clock, not the
+    original recording time. binary_rx tells the protocol reading this
+    source to accept binary frames from the start, as if BIN had been
+    negotiated (from_file sets it for --binary and for binary captures).
+    """
+    
+    def __init__(self, frames: Sequence[Tuple[float, bytes]], speed: Optional[float] = 1.0,
+                 timeout: Optional[float] = 0.1, auto_ack: bool = True, chunk_size: int = 4096,
+                 binary_rx: bool = False):
+        self._init_framing()
+        self.decoder.binary = True  # commands arrive in whatever framing the controller negotiated
+        self.binary_rx = binary_rx
+        t0 = frames[0][0] if frames else 0.0
+        self._frames = [(t - t0, data) for t, data in frames]
+        self.speed = speed
+        self.timeout = timeout
+        self.auto_ack = auto_ack
+        self.chunk_size = chunk_size
+        self.hold: Optional[Callable[[], bool]] = None
+        self.is_open = True
+        
+        self._index = 0
+        self._start = None
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+        self.finished = threading.Event()
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.commands: Dict[str, int] = {}
+    
+    # One '<...>' frame per line (see load_frames)
+    FRAME_DUMP_EXTENSIONS = ('.txt', '.frames')
+    
+    @classmethod
+    def from_file(cls, path: str, binary: bool = False, **kwargs) -> 'ReplaySource':
+        """Replay a .csv / .evlog (each optionally .gz|.zst) DataLogger log, a .evcap wire
+        capture or a .txt / .frames frame dump"""
+        codec = BinaryCodec() if binary else None
+        name = os.path.basename(path)
+        compressed = tuple(LogCompressor.EXTENSIONS.values())
+        if name.endswith(WireCapture.EXTENSION):
+            frames, binary = cls.load_capture(path)
+        elif name.endswith(CsvLogBackend.EXTENSION) or \
+                name.endswith(tuple(CsvLogBackend.EXTENSION + ext for ext in compressed)):
+            frames = cls.load_csv(path, codec)
+        elif ColumnarLogBackend.EXTENSION in name:
+            frames = cls.load_columnar(path, codec)
+        elif name.endswith(cls.FRAME_DUMP_EXTENSIONS):
+            frames = cls.load_frames(path)
+        else:
+            raise ValueError(f"Don't know how to replay {name}: expected a .csv(.gz|.zst), "
+                             f".evlog(.gz|.zst), {WireCapture.EXTENSION} or "
+                             f"{' / '.join(cls.FRAME_DUMP_EXTENSIONS)} file")
+        kwargs.setdefault('binary_rx', binary)
+        return cls(frames, **kwargs)
+    
+    @staticmethod
+    def telemetry_frame(values: Sequence[Any], codec: Optional[BinaryCodec] = None) -> bytes:
+        """DATA frame for (rpm, temp, current, voltage, soc, throttle); None values are omitted"""
+        if codec is not None and None not in values[:5]:
+            return codec.encode_telemetry(*values)
+        params = ';'.join(f"{key}={value}" for key, value in zip(TELEMETRY_KEYS, values)
+                          if value is not None)
+        return f"<DATA:{params}>".encode('utf-8')
+    
+    @classmethod
+    def load_csv(cls, path: str, codec: Optional[BinaryCodec] = None) -> List[Tuple[float, bytes]]:
+        frames = []
+        if path.endswith(tuple(LogCompressor.EXTENSIONS.values())):
+            lines = LogCompressor.read(path).decode('utf-8').splitlines()
+        else:
+            with open(path) as f:
+                lines = f.read().splitlines()
+        for line in lines[1:]:  # after the header
+            fields = line.split(',')
+            if len(fields) != 7:
+                continue
+            t = datetime.strptime(fields[0], "%Y-%m-%d %H:%M:%S.%f").timestamp()
+            values = [None if v in ('', 'None') else float(v) for v in fields[1:6]]
+            throttle = None if fields[6] in ('', 'None') else int(float(fields[6]))
+            frames.append((t, cls.telemetry_frame(values + [throttle], codec)))
+        return frames
+    
+    @classmethod
+    def load_columnar(cls, path: str, codec: Optional[BinaryCodec] = None) -> List[Tuple[float, bytes]]:
+        frames = []
+        with ColumnarLogReader(path) as reader:
+            for t_ns, *floats, throttle in reader.rows():
+                values = [None if v != v else round(v, 4) for v in floats]
+                frames.append((t_ns / 1e9, cls.telemetry_frame(values + [None if throttle < 0 else throttle],
+                                                                codec)))
+        return frames
+    
+    @staticmethod
+    def load_capture(path: str) -> Tuple[List[Tuple[float, bytes]], bool]:
+        """RX chunks of a WireCapture, byte-for-byte with their original timing, and
+        whether the session asked for binary framing"""
+        _, records = WireCapture.load(path)
+        frames = [(t_ns / 1e9, data) for direction, t_ns, data in records if direction == WireCapture.RX]
+        binary = any(b'MODE=BIN' in data for direction, _, data in records if direction == WireCapture.TX)
+        return frames, binary
+    
+    @staticmethod
+    def load_frames(path: str) -> List[Tuple[float, bytes]]:
+        """One '<...>' frame per line, optionally prefixed by a time in seconds"""
+        frames = []
+        with open(path) as f:
+            for n, line in enumerate(f):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                stamp, _, frame = line.partition(' ') if not line.startswith('<') else ('', '', line)
+                frames.append((float(stamp) if stamp else n * 0.1, frame.encode('utf-8')))
+        return frames
+    
+    def __len__(self) -> int:
+        return len(self._frames)
+    
+    def _pump(self):
+        """Move frames that are due into the read buffer (lock held)"""
+        if self._start is None:
+            self._start = time.monotonic()
+        if self.hold is not None and self.hold():
+            return
+        elapsed = None if self.speed is None else (time.monotonic() - self._start) * self.speed
+        frames = self._frames
+        while (self._index < len(frames) and len(self._buffer) < self.chunk_size and
+               (elapsed is None or frames[self._index][0] <= elapsed)):
+            data = frames[self._index][1]
+            self._buffer += data
+            self._index += 1
+            self.frames_sent += 1
+            self.bytes_sent += len(data)
+        if self._index == len(frames) and not self._buffer:
+            self.finished.set()
+    
+    def _next_due(self) -> Optional[float]:
+        """Seconds until the next frame is due, None when nothing is scheduled"""
+        if self._index >= len(self._frames):
+            return None
+        if self.speed is None or self.hold is not None:
+            return 0.001 if self.hold is not None else 0.0
+        due = self._start + self._frames[self._index][0] / self.speed
+        return max(0.0, due - time.monotonic())
+    
+    @property
+    def in_waiting(self) -> int:
+        with self._cond:
+            self._pump()
+            return len(self._buffer)
+    
+    def read(self, size: int = 1) -> bytes:
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                self._pump()
+                if self._buffer:
+                    data = bytes(self._buffer[:size])
+                    del self._buffer[:size]
+                    return data
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return b''
+                wait = self._next_due()
+                if remaining is not None:
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(wait)
+    
+    def write(self, data: bytes) -> int:
+        with self._cond:
+            for frame in self.decoder.feed(data):
+                parsed = self._parse_frame(frame)
+                if not parsed:
+                    continue
+                msg_type = parsed['type']
+                self.commands[msg_type] = self.commands.get(msg_type, 0) + 1
+                if self.auto_ack and not msg_type.startswith('GET_'):
+                    params = {'ACK': msg_type}
+                    if 'ID' in parsed['data']:
+                        params['ID'] = parsed['data']['ID']
+                    self._buffer += self._build_message('ACK', params).encode('utf-8')
+                    self._cond.notify()
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def reset_input_buffer(self):
+        with self._cond:
+            self._buffer.clear()
+    
+    def close(self):
+        self.is_open = False
+        with self._cond:
+            self._cond.notify_all()
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every recorded frame has been read"""
+        return self.finished.wait(timeout)
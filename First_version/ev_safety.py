@@ -0,0 +1,232 @@
+"""
+EV Controller - Safety Rules
+Declarative safety rules and the engine that evaluates them per sample
+or over whole logs
+"""
+
+from typing import Dict, List, Optional, Any, Sequence, Tuple
+
+try:
+    import numpy  # optional, for SafetyEngine.scan() over whole logs
+except ImportError:
+    numpy = None
+
+from ev_protocol import TELEMETRY_KEYS, TelemetrySample
+
+
+# ============================================================================
+# SAFETY RULES
+# ============================================================================
+
+class SafetyRule:
+    """One declarative safety condition from the `safety_rules` config list
+    
+    {"name": "OVERHEAT", "field": "TEMP", "op": ">", "threshold": 80,
+     "hysteresis": 2, "sustain_ms": 0, "message": "...{value}...", "estop": false}
+    
+    kind "threshold" compares the field itself; kind "rate" compares its rate
+    of change (units per second, either direction). A rule trips once the
+    condition has held for sustain_ms and re-arms only after the value is back
+    past threshold -/+ hysteresis.
+    """
+    
+    KINDS = ('threshold', 'rate')
+    OPS = {'>': '<', '<': '>'}  # trip op -> clear op
+    
+    def __init__(self, name: str, field: str, threshold: float, op: str = '>', kind: str = 'threshold',
+                 hysteresis: float = 0.0, sustain_ms: float = 0.0, message: Optional[str] = None,
+                 estop: bool = False):
+        if kind not in self.KINDS:
+            raise ValueError(f"Safety rule {name}: unknown kind {kind!r}")
+        if op not in self.OPS:
+            raise ValueError(f"Safety rule {name}: unknown op {op!r}")
+        index = TELEMETRY_KEYS.get(field.upper())
+        if index is None:
+            raise ValueError(f"Safety rule {name}: unknown field {field!r}")
+        if kind == 'rate':
+            op = '>'  # magnitude of change
+        self.name = name
+        self.field = field
+        self.index = index
+        self.kind = kind
+        self.op = op
+        self.threshold = float(threshold)
+        self.clear = self.threshold - hysteresis if op == '>' else self.threshold + hysteresis
+        self.sustain = sustain_ms / 1000.0
+        self.message = message or f"{name} ({field} {{value:g}})"
+        self.estop = estop
+    
+    @classmethod
+    def from_dict(cls, spec: Dict[str, Any]) -> 'SafetyRule':
+        return cls(**spec)
+    
+    def over(self, value):
+        """Value is past threshold (also works elementwise on NumPy arrays)"""
+        return value > self.threshold if self.op == '>' else value < self.threshold
+    
+    def cleared(self, value):
+        """Value is back past threshold -/+ hysteresis, so a tripped rule re-arms"""
+        return value < self.clear if self.op == '>' else value > self.clear
+
+
+class SafetyEngine:
+    """Evaluates all safety rules against each telemetry sample
+    
+    Each rule is checked with its own over()/cleared() predicates. Rule state
+    is a bitmask (bit i = rule i currently tripped) plus per-rule sustain/rate
+    slots. evaluate() returns the bitmask of rules that tripped on this sample.
+    
+    scan() runs the same rules over whole columns (e.g. a columnar log) and
+    uses NumPy when it is installed.
+    """
+    
+    def __init__(self, rules: Sequence[SafetyRule]):
+        self.rules = list(rules)
+        self.trip_values = [None] * len(self.rules)
+        self.reset()
+    
+    @classmethod
+    def from_config(cls, config) -> 'SafetyEngine':
+        """Rules from `safety_rules`, or the two classic checks built from their thresholds"""
+        specs = config.get('safety_rules')
+        if not specs:
+            specs = [
+                {'name': 'OVERHEAT', 'field': 'TEMP', 'op': '>',
+                 'threshold': config.get('overheat_threshold', 80),
+                 'message': "Temperature critical ({value}°C)"},
+                {'name': 'LOW_BATTERY', 'field': 'SOC', 'op': '<',
+                 'threshold': config.get('low_battery_threshold', 15),
+                 'message': "Battery low ({value}%)"},
+            ]
+        return cls([SafetyRule.from_dict(spec) for spec in specs])
+    
+    def reset(self):
+        """Re-arm every rule (conditions still present trip again on the next sample)"""
+        self.active = 0
+        self._since = [None] * len(self.rules)
+        self._prev = [None] * len(self.rules)
+        self._prev_t = [0.0] * len(self.rules)
+    
+    def evaluate(self, sample: TelemetrySample) -> int:
+        """Update rule state with one sample; bitmask of rules that just tripped"""
+        t = sample.timestamp
+        active, tripped = self.active, 0
+        since, prev, prev_t = self._since, self._prev, self._prev_t
+        for i, rule in enumerate(self.rules):
+            value = sample[rule.index]
+            if value is None:
+                continue
+            if rule.kind == 'rate':
+                last, last_t = prev[i], prev_t[i]
+                prev[i], prev_t[i] = value, t
+                if last is None or t <= last_t:
+                    continue
+                value = abs(value - last) / (t - last_t)
+            bit = 1 << i
+            if active & bit:
+                if rule.cleared(value):
+                    active &= ~bit
+            elif rule.over(value):
+                if rule.sustain > 0:
+                    if since[i] is None:
+                        since[i] = t
+                    if t - since[i] < rule.sustain:
+                        continue
+                    since[i] = None
+                active |= bit
+                tripped |= bit
+                self.trip_values[i] = value
+            else:
+                since[i] = None
+        self.active = active
+        return tripped
+    
+    def tripped_rules(self, mask: int) -> List[SafetyRule]:
+        return [rule for i, rule in enumerate(self.rules) if mask >> i & 1]
+    
+    def active_rules(self) -> List[str]:
+        return [rule.name for rule in self.tripped_rules(self.active)]
+    
+    def describe(self, rule: SafetyRule) -> str:
+        """Warning text for a rule that just tripped"""
+        value = self.trip_values[self.rules.index(rule)]
+        return rule.message.format(value=value)
+    
+    def scan(self, times: Sequence[float], columns: Dict[str, Sequence[float]]) -> List[Tuple[str, int]]:
+        """(rule name, sample index) for every trip over a batch of samples, from fresh state
+        
+        columns are keyed by TelemetrySample field name ('temp', 'soc', ...);
+        missing values are NaN/None. Without NumPy the samples go through
+        evaluate() one by one.
+        """
+        if numpy is None:
+            return self._scan_samples(times, columns)
+        t = numpy.asarray(times, dtype=numpy.float64)
+        events = []
+        for rule in self.rules:
+            name = TelemetrySample._fields[rule.index]
+            if name not in columns:
+                continue
+            values = numpy.asarray(columns[name], dtype=numpy.float64)
+            rows = numpy.flatnonzero(~numpy.isnan(values))
+            v, tv = values[rows], t[rows]
+            if rule.kind == 'rate':
+                dt = numpy.diff(tv)
+                ok = dt > 0
+                v = numpy.abs(numpy.diff(v))[ok] / dt[ok]
+                rows, tv = rows[1:][ok], tv[1:][ok]
+            events += [(rule.name, int(rows[i])) for i in self._scan_threshold(rule, v, tv)]
+        events.sort(key=lambda event: event[1])
+        return events
+    
+    @staticmethod
+    def _scan_threshold(rule: SafetyRule, v, t) -> List[int]:
+        """Trip indexes of one rule over a NaN-free window (same state machine as evaluate)"""
+        over = rule.over(v)
+        cleared = rule.cleared(v)
+        # Index lists + searchsorted: each trip/clear transition is O(log n)
+        over_at = numpy.flatnonzero(over)
+        gap_at = numpy.flatnonzero(~over)
+        clear_at = numpy.flatnonzero(cleared)
+        n = len(v)
+        
+        def next_at(indexes, start: int) -> int:
+            pos = numpy.searchsorted(indexes, start)
+            return int(indexes[pos]) if pos < len(indexes) else n
+        
+        trips = []
+        i = 0
+        while i < n:
+            j = next_at(over_at, i)
+            if j >= n:
+                break
+            if rule.sustain > 0:
+                run_end = next_at(gap_at, j)
+                k = j + int(numpy.searchsorted(t[j:run_end], t[j] + rule.sustain))
+                if k >= run_end:
+                    i = run_end + 1
+                    continue
+                j = k
+            trips.append(j)
+            i = next_at(clear_at, j + 1) + 1
+        return trips
+    
+    def _scan_samples(self, times, columns) -> List[Tuple[str, int]]:
+        fields = TelemetrySample._fields
+        rule_columns = {rule.index: columns.get(fields[rule.index]) for rule in self.rules}
+        saved = (self.active, self._since, self._prev, self._prev_t)
+        self.reset()
+        events = []
+        try:
+            for n, t in enumerate(times):
+                values = [None] * len(fields)
+                for index, column in rule_columns.items():
+                    if column is not None:
+                        value = column[n]
+                        values[index] = None if value is None or value != value else value
+                values[-1] = t
+                tripped = self.evaluate(TelemetrySample(*values))
+                events += [(rule.name, n) for rule in self.tripped_rules(tripped)]
+        finally:
+            self.active, self._since, self._prev, self._prev_t = saved
+        return events
@@ -0,0 +1,220 @@
+"""
+EV Controller - Terminal Interface
+Interactive terminal UI for the threaded controller
+"""
+
+import time
+import os
+
+from ev_controller import EVController
+
+
+# ============================================================================
+# TERMINAL INTERFACE
+# ============================================================================
+
+class TerminalInterface:
+    """Terminal-based user interface"""
+    
+    def __init__(self, controller: EVController):
+        self.controller = controller
+        self.running = True
+    
+    def clear_screen(self):
+        """Clear terminal screen"""
+        os.system('clear' if os.name != 'nt' else 'cls')
+    
+    def print_header(self):
+        """Print application header"""
+        print("=" * 70)
+        print("  🚗 PORSCHE EV CONTROLLER - SVGS EV Team")
+        print("=" * 70)
+    
+    def print_status(self):
+        """Print current status dashboard"""
+        status = self.controller.get_status()
+        telemetry = status['telemetry']
+        
+        # Connection status
+        conn_status = "🟢 CONNECTED" if status['connected'] else "🔴 DISCONNECTED"
+        print(f"\nStatus: {conn_status}")
+        
+        # Telemetry
+        print(f"\n📊 TELEMETRY:")
+        print(f"  Throttle:    {telemetry.get('THROTTLE', 0):3d}% (from pedal)")
+        print(f"  RPM:         {telemetry.get('RPM', 0):7.1f}")
+        print(f"  Current:     {telemetry.get('CURRENT', 0):6.1f} A")
+        print(f"  Voltage:     {telemetry.get('VOLTAGE', 0):6.2f} V")
+        print(f"  Temperature: {telemetry.get('TEMP', 0):6.1f} °C")
+        print(f"  Battery SOC: {telemetry.get('SOC', 0):6.1f} %")
+        
+        # Power calculation
+        power = telemetry.get('CURRENT', 0) * telemetry.get('VOLTAGE', 0)
+        print(f"  Power:       {power:6.1f} W ({power/1000:.2f} kW)")
+        
+        # Faults
+        if status['faults']:
+            print(f"\n⚠️  FAULTS: {', '.join(status['faults'])}")
+        else:
+            print(f"\n✅ NO FAULTS")
+        
+        # Configuration
+        config = status['config']
+        print(f"\n⚙️  CONFIGURATION:")
+        print(f"  Current Limit:   {config.get('current_limit', 0):.1f} A")
+        print(f"  Max Throttle:    {config.get('max_throttle', 100)} %")
+        print(f"  Logging:         {'ON' if self.controller.logger.logging_enabled else 'OFF'}")
+    
+    def print_menu(self):
+        """Print command menu"""
+        print("\n" + "-" * 70)
+        print("COMMANDS:")
+        print("  c [amps]   - Set current limit (e.g., 'c 40' for 40A)")
+        print("  m [0-100]  - Set max throttle limit (safety override)")
+        print("  e          - Emergency stop")
+        print("  f          - Reset faults")
+        print("  l          - Toggle data logging")
+        print("  t          - Frame latency trace (starts tracing if off)")
+        print("  s          - Save configuration")
+        print("  h          - Show this help")
+        print("  q          - Quit")
+        print("\nNOTE: Throttle is controlled by gas pedal (displayed above)")
+        print("-" * 70)
+    
+    def run(self):
+        """Main interface loop"""
+        self.clear_screen()
+        self.print_header()
+        self.print_menu()
+        
+        print("\n💡 Waiting for STM32 connection...")
+        
+        # Wait for initial connection
+        timeout = 10
+        start = time.time()
+        while not self.controller.connected and time.time() - start < timeout:
+            time.sleep(0.1)
+        
+        if not self.controller.connected:
+            print("⚠️  Warning: STM32 not responding. Check connection.")
+            print("   Continuing anyway - commands will be sent but may not be confirmed.")
+        else:
+            print("✅ Connected to STM32!")
+        
+        time.sleep(1)
+        
+        # Display initial status
+        self.clear_screen()
+        self.print_header()
+        self.print_status()
+        self.print_menu()
+        
+        # Main loop - simple input mode (no auto-refresh while typing)
+        try:
+            while self.running:
+                # Get user input (blocking)
+                try:
+                    command = input("\n> ").strip().lower()
+                    
+                    # Handle command
+                    self.handle_command(command)
+                    
+                    # Refresh display after command
+                    if self.running:  # Don't refresh if quitting
+                        time.sleep(0.5)  # Brief pause to see result
+                        self.clear_screen()
+                        self.print_header()
+                        self.print_status()
+                        self.print_menu()
+                    
+                except EOFError:
+                    break
+                    
+        except KeyboardInterrupt:
+            print("\n\n⏹️  Interrupted by user")
+        finally:
+            self.controller.shutdown()
+    
+    def handle_command(self, command: str):
+        """Handle user command"""
+        parts = command.split()
+        if not parts:
+            return
+        
+        cmd = parts[0]
+        
+        try:
+            if cmd == 'q':
+                self.running = False
+                return  # Don't show message
+            
+            elif cmd == 'm':
+                if len(parts) < 2:
+                    print("❌ Usage: m [0-100]")
+                else:
+                    max_throttle = int(parts[1])
+                    handle = self.controller.set_max_throttle(max_throttle)
+                    if handle.wait(self.controller.setpoints.max_wait(handle.key)):
+                        print(f"✅ Max throttle limit set to {max_throttle}%")
+                    else:
+                        print("❌ Failed to set max throttle")
+            
+            elif cmd == 'c':
+                if len(parts) < 2:
+                    print("❌ Usage: c [amps]")
+                else:
+                    current = float(parts[1])
+                    handle = self.controller.set_current_limit(current)
+                    if handle.wait(self.controller.setpoints.max_wait(handle.key)):
+                        print(f"✅ Current limit set to {current}A")
+                    else:
+                        print("❌ Failed to set current limit")
+            
+            elif cmd == 'e':
+                if self.controller.emergency_stop():
+                    print("🛑 EMERGENCY STOP ACTIVATED")
+                else:
+                    print("❌ Failed to send emergency stop")
+            
+            elif cmd == 'f':
+                if self.controller.reset_faults():
+                    print("✅ Faults reset")
+                else:
+                    print("❌ Failed to reset faults")
+            
+            elif cmd == 'l':
+                if self.controller.logger.logging_enabled:
+                    self.controller.logger.stop_logging()
+                else:
+                    self.controller.logger.start_logging()
+            
+            elif cmd == 't':
+                self.toggle_tracing()
+                input("\nPress Enter to continue...")
+            
+            elif cmd == 's':
+                self.controller.config.save_config()
+            
+            elif cmd == 'h':
+                # Don't clear on help, just print
+                pass
+            
+            elif cmd == '':
+                # Empty command, just refresh
+                pass
+            
+            else:
+                print(f"❌ Unknown command: {cmd}. Type 'h' for help")
+        
+        except ValueError:
+            print(f"❌ Invalid value. Check your input.")
+        except Exception as e:
+            print(f"❌ Error: {e}")
+    
+    def toggle_tracing(self):
+        """'t': turn frame tracing on, or show the latency breakdown once it is on"""
+        if self.controller.tracer is None:
+            self.controller.enable_tracing(self.controller.config.get('trace_sample_every', 1))
+            print("🔬 Frame tracing ON - press 't' again for the latency breakdown")
+        else:
+            print(self.controller.tracer.dump())
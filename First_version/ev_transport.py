@@ -0,0 +1,525 @@
+"""
+EV Controller - Transports
+Byte links the protocol runs over (serial port, pty, in-memory pipe, TCP),
+the virtual clock for simulated time and the raw wire capture
+"""
+
+import abc
+import serial
+import time
+import os
+import select
+import threading
+import struct
+import socket
+from typing import Callable, Dict, List, Optional, Tuple
+from collections import deque
+
+try:
+    import fcntl
+    import termios
+    import tty
+except ImportError:  # Windows: no pty transport, TCP in_waiting reads as 0
+    fcntl = termios = tty = None
+
+
+# ============================================================================
+# TRANSPORTS
+# ============================================================================
+
+class Transport(abc.ABC):
+    """Byte link with the part of the serial.Serial API the protocol stack uses
+    
+    read(size) waits up to `timeout` and returns b'' if nothing arrived,
+    in_waiting counts buffered bytes and write() sends all of its argument.
+    Transports with a selectable descriptor return it from fileno(); the
+    others raise and readers fall back to blocking reads. A real UART is
+    just serial.Serial, which already has this API (see open_transport()).
+    """
+    
+    name = 'transport'
+    timeout: Optional[float] = 0.1
+    is_open = True
+    
+    @abc.abstractmethod
+    def read(self, size: int = 1) -> bytes:
+        """Up to size bytes; waits up to timeout for the first, b'' if none came"""
+    
+    @property
+    @abc.abstractmethod
+    def in_waiting(self) -> int:
+        """Bytes that read() can return without waiting"""
+    
+    @abc.abstractmethod
+    def write(self, data: bytes) -> int:
+        """Send all of data; returns len(data)"""
+    
+    def read_available(self) -> bytes:
+        """Wait for the first byte (bounded by timeout), then return everything buffered"""
+        data = self.read(1)
+        if data:
+            waiting = self.in_waiting
+            if waiting:
+                data += self.read(waiting)
+        return data
+    
+    def flush(self):
+        pass
+    
+    def fileno(self) -> int:
+        raise OSError(f"{type(self).__name__} has no file descriptor")
+    
+    def reset_input_buffer(self):
+        while self.in_waiting:
+            self.read(self.in_waiting)
+    
+    def close(self):
+        self.is_open = False
+    
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name}>"
+
+
+class PipeTransport(Transport):
+    """One end of an in-memory byte pipe; pair() returns two connected ends
+    
+    write() queues the bytes object itself on the peer and a read that takes
+    whole chunks returns them unchanged, so frames cross without a copy (a
+    bytearray or memoryview is copied once, since the caller may reuse it).
+    There is no baud rate: writes never block and the reader wakes as soon
+    as bytes are queued. A closed peer just goes quiet, like an unplugged
+    cable. An unpaired pipe is a loopback. open_transport('pipe://name')
+    hands out the two ends of a named pair to the first two callers, so the
+    controller and the simulator can be wired up in one process by name.
+    """
+    
+    _unclaimed: Dict[str, 'PipeTransport'] = {}
+    _unclaimed_lock = threading.Lock()
+    
+    def __init__(self, name: str = 'pipe', timeout: Optional[float] = 0.1):
+        self.name = name
+        self.timeout = timeout
+        self.is_open = True
+        self.peer = self
+        self.bytes_written = 0
+        self._chunks = deque()
+        self._offset = 0  # bytes of _chunks[0] already read
+        self._buffered = 0
+        self._cond = threading.Condition()
+    
+    @classmethod
+    def pair(cls, name: str = 'pipe', timeout: Optional[float] = 0.1) -> Tuple['PipeTransport', 'PipeTransport']:
+        a, b = cls(f"{name}:a", timeout), cls(f"{name}:b", timeout)
+        a.peer, b.peer = b, a
+        return a, b
+    
+    @classmethod
+    def open(cls, name: str, timeout: Optional[float] = 0.1) -> 'PipeTransport':
+        """First call for a name returns one end of a new pair, the second call the other"""
+        with cls._unclaimed_lock:
+            other = cls._unclaimed.pop(name, None)
+            if other is None:
+                end, cls._unclaimed[name] = cls.pair(name, timeout)
+                return end
+        other.timeout = timeout
+        return other
+    
+    def write(self, data: bytes) -> int:
+        if not self.is_open:
+            raise OSError(f"{self.name} is closed")
+        if type(data) is not bytes:
+            data = bytes(data)
+        if data:
+            peer = self.peer
+            with peer._cond:
+                if peer.is_open:
+                    peer._chunks.append(data)
+                    peer._buffered += len(data)
+                    peer._cond.notify()
+                self.bytes_written += len(data)
+        return len(data)
+    
+    def read(self, size: int = 1) -> bytes:
+        with self._cond:
+            if not self._wait():
+                return b''
+            return self._take(size)
+    
+    def read_available(self) -> bytes:
+        with self._cond:
+            if not self._wait():
+                return b''
+            return self._take(self._buffered)
+    
+    @property
+    def in_waiting(self) -> int:
+        return self._buffered
+    
+    def reset_input_buffer(self):
+        with self._cond:
+            self._chunks.clear()
+            self._offset = self._buffered = 0
+    
+    def close(self):
+        with self._cond:
+            self.is_open = False
+            self._chunks.clear()
+            self._offset = self._buffered = 0
+            self._cond.notify_all()
+    
+    def _wait(self) -> bool:
+        """With _cond held: wait until bytes are buffered or the timeout expires"""
+        if not self.is_open:
+            raise OSError(f"{self.name} is closed")
+        if not self._buffered and self.timeout != 0:
+            self._cond.wait_for(lambda: self._buffered or not self.is_open, self.timeout)
+            if not self.is_open:
+                raise OSError(f"{self.name} is closed")
+        return self._buffered > 0
+    
+    def _take(self, size: int) -> bytes:
+        """With _cond held: remove up to size bytes, slicing only a partly read chunk"""
+        if size <= 0 or not self._buffered:
+            return b''
+        chunks = self._chunks
+        parts = []
+        remaining = size
+        while remaining and chunks:
+            head = chunks[0]
+            start = self._offset
+            end = min(len(head), start + remaining)
+            parts.append(head if start == 0 and end == len(head) else head[start:end])
+            if end == len(head):
+                chunks.popleft()
+                self._offset = 0
+            else:
+                self._offset = end
+            remaining -= end - start
+        self._buffered -= size - remaining
+        return parts[0] if len(parts) == 1 else b''.join(parts)
+
+
+class PtyTransport(Transport):
+    """Master end of a pseudo-terminal whose slave opens like any serial port
+    
+    open_pair() returns the master transport and the slave's path, so the
+    simulator can run on the master while EVProtocol opens the slave with
+    pyserial, going through the real tty read path without an adapter or
+    socat. The slave is put in raw mode and held open here as well, since
+    the master reads EIO while no process has the slave open. POSIX only.
+    """
+    
+    def __init__(self, master_fd: int, slave_fd: Optional[int] = None, timeout: Optional[float] = 0.1):
+        self.fd = master_fd
+        self._slave_fd = slave_fd
+        self.timeout = timeout
+        self.is_open = True
+        self.slave_path = os.ttyname(slave_fd) if slave_fd is not None else None
+        self.name = self.slave_path or f"pty:{master_fd}"
+    
+    @classmethod
+    def open_pair(cls, timeout: Optional[float] = 0.1) -> Tuple['PtyTransport', str]:
+        if termios is None:
+            raise OSError("pty transport needs a POSIX system")
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        transport = cls(master, slave, timeout)
+        return transport, transport.slave_path
+    
+    def _fileno(self) -> int:
+        if self.fd is None:
+            raise OSError(f"{self.name} is closed")
+        return self.fd
+    
+    def read(self, size: int = 1) -> bytes:
+        fd = self._fileno()
+        ready, _, _ = select.select([fd], [], [], self.timeout)
+        return os.read(fd, size) if ready else b''
+    
+    @property
+    def in_waiting(self) -> int:
+        return struct.unpack('i', fcntl.ioctl(self._fileno(), termios.FIONREAD, b'\0\0\0\0'))[0]
+    
+    def write(self, data: bytes) -> int:
+        fd = self._fileno()
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        return len(data)
+    
+    def fileno(self) -> int:
+        return self._fileno()
+    
+    def reset_input_buffer(self):
+        termios.tcflush(self._fileno(), termios.TCIFLUSH)
+    
+    def close(self):
+        self.is_open = False
+        for fd in (self.fd, self._slave_fd):
+            if fd is not None:
+                os.close(fd)
+        self.fd = self._slave_fd = None
+
+
+class TcpTransport(Transport):
+    """TCP byte stream: a simulator in another process or machine, or a serial server
+    
+    connect() dials host:port and listen() waits for one peer to connect
+    (the simulator side of tcp-listen://). Nagle is off so a lone frame
+    goes out at once. Once the peer hangs up the link goes quiet, like an
+    unplugged UART: reads time out empty, writes are dropped and
+    peer_closed is set.
+    """
+    
+    def __init__(self, sock: socket.socket, timeout: Optional[float] = 0.1):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setblocking(True)
+        self.sock = sock
+        self.timeout = timeout
+        self.is_open = True
+        self.peer_closed = False
+        host, port = sock.getpeername()[:2]
+        self.name = f"tcp://{host}:{port}"
+    
+    @classmethod
+    def connect(cls, host: str, port: int, timeout: Optional[float] = 0.1,
+                connect_timeout: float = 5.0) -> 'TcpTransport':
+        return cls(socket.create_connection((host, port), connect_timeout), timeout)
+    
+    @classmethod
+    def listen(cls, host: str, port: int, timeout: Optional[float] = 0.1) -> 'TcpTransport':
+        """Wait for one incoming connection on host:port"""
+        with socket.create_server((host, port)) as server:
+            sock, _ = server.accept()
+        return cls(sock, timeout)
+    
+    def _socket(self) -> socket.socket:
+        if not self.is_open:
+            raise OSError(f"{self.name} is closed")
+        return self.sock
+    
+    def read(self, size: int = 1) -> bytes:
+        sock = self._socket()
+        if self.peer_closed:
+            time.sleep(self.timeout or 0)
+            return b''
+        ready, _, _ = select.select([sock], [], [], self.timeout)
+        if not ready:
+            return b''
+        try:
+            data = sock.recv(size)
+        except ConnectionError:
+            data = b''
+        self.peer_closed = not data
+        return data
+    
+    def read_available(self) -> bytes:
+        return self.read(65536)
+    
+    @property
+    def in_waiting(self) -> int:
+        if fcntl is None:
+            return 0
+        return struct.unpack('i', fcntl.ioctl(self._socket().fileno(), termios.FIONREAD, b'\0\0\0\0'))[0]
+    
+    def write(self, data: bytes) -> int:
+        sock = self._socket()
+        if not self.peer_closed:
+            try:
+                sock.sendall(data)
+            except ConnectionError:
+                self.peer_closed = True
+        return len(data)
+    
+    def fileno(self) -> int:
+        return self._socket().fileno()
+    
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+
+
+def _host_port(address: str, default_host: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(':')
+    return host.strip('[]') or default_host, int(port)
+
+
+def open_transport(spec: str, baudrate: int = 115200, timeout: Optional[float] = 0.1):
+    """Open a link from a port string:
+    
+        /dev/ttyUSB0, COM3          serial.Serial at baudrate
+        tcp://host:port             TcpTransport.connect
+        tcp-listen://[host:]port    TcpTransport.listen (blocks until a peer connects)
+        pipe://name                 PipeTransport.open, one process only
+        pty                         PtyTransport.open_pair (its name is the slave path)
+        loop://, socket://, ...     any other pyserial URL handler
+    """
+    scheme, sep, rest = spec.partition('://')
+    if not sep:
+        if spec == 'pty':
+            return PtyTransport.open_pair(timeout)[0]
+        return serial.Serial(spec, baudrate, timeout=timeout)
+    if scheme == 'tcp':
+        return TcpTransport.connect(*_host_port(rest, 'localhost'), timeout=timeout)
+    if scheme == 'tcp-listen':
+        return TcpTransport.listen(*_host_port(rest, ''), timeout=timeout)
+    if scheme == 'pipe':
+        return PipeTransport.open(rest or 'default', timeout)
+    return serial.serial_for_url(spec, baudrate, timeout=timeout)
+
+
+class VirtualClock:
+    """Simulated monotonic time shared by an in-process simulator and the controller
+    
+    Called like time.monotonic(), but only moves when the simulation calls
+    advance_to(), so message timestamps (and with them SafetyEngine sustain
+    and rate rules) follow simulated time however fast the host steps
+    through it. wait_until() blocks a real thread until simulated time gets
+    there, for loops that should pace themselves in simulated time.
+    
+    wait_for() blocks on anything else the simulation depends on (the Pi
+    having handled a step, run_for() moving the horizon); whoever changes
+    such state calls notify(). With nobody waiting, notify() is a no-op.
+    """
+    
+    def __init__(self, start: float = 0.0):
+        self._now = start
+        self._cond = threading.Condition()
+        self._waiters = 0
+    
+    def __call__(self) -> float:
+        return self._now
+    
+    def advance_to(self, t: float):
+        if t > self._now:
+            self._now = t
+            self.notify()
+    
+    def notify(self):
+        """Wake every wait_until() / wait_for() caller to re-check its condition"""
+        if self._waiters:
+            with self._cond:
+                self._cond.notify_all()
+    
+    def wait_for(self, predicate: Callable[[], bool], timeout: Optional[float] = None) -> bool:
+        """Block until predicate() is true (re-checked on every notify); False on timeout"""
+        with self._cond:
+            self._waiters += 1
+            try:
+                return self._cond.wait_for(predicate, timeout)
+            finally:
+                self._waiters -= 1
+    
+    def wait_until(self, t: float, timeout: Optional[float] = None) -> bool:
+        """Block until the clock reaches t; False if timeout (real seconds) expired first"""
+        return self.wait_for(lambda: self._now >= t, timeout)
+
+
+class WireCapture:
+    """Raw capture of every chunk read from / written to the serial port
+    
+    File: HEADER (magic, version, start wall/monotonic ns), then one RECORD
+    (direction, monotonic ns, length) plus the bytes per chunk, exactly as
+    read or written. record() is called on the rx/tx paths and only appends a
+    tuple to a deque (atomic under the GIL, no lock); an 'ev-capture' thread
+    packs and writes everything pending every flush_interval seconds. If the
+    writer can't keep up, chunks beyond max_pending are dropped and counted.
+    """
+    
+    RX = 0
+    TX = 1
+    DIRECTIONS = ('RX', 'TX')
+    EXTENSION = '.evcap'
+    MAGIC = b'EVCP'
+    VERSION = 2
+    HEADER = struct.Struct('<4sHxxqq')
+    RECORD = struct.Struct('<BqI')  # a chunk can exceed 64 KiB (TCP / pipe reads)
+    RECORD_V1 = struct.Struct('<BqH')  # still readable
+    
+    def __init__(self, path: str, flush_interval: float = 0.1, max_pending: int = 65536):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.records = 0
+        self.bytes = 0
+        self.dropped = 0
+        self._stop = threading.Event()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'wb')
+        self.file.write(self.HEADER.pack(self.MAGIC, self.VERSION, time.time_ns(), time.monotonic_ns()))
+        self.thread = threading.Thread(target=self._writer_loop, name='ev-capture', daemon=True)
+        self.thread.start()
+        print(f"🎙️  Wire capture: {path}")
+    
+    def record(self, direction: int, data: bytes):
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self.pending.append((direction, time.monotonic_ns(), data))
+    
+    def _drain(self):
+        pending = self.pending
+        pack = self.RECORD.pack
+        out = []
+        while pending:
+            direction, t_ns, data = pending.popleft()
+            out.append(pack(direction, t_ns, len(data)))
+            out.append(data)
+            self.records += 1
+            self.bytes += len(data)
+        if out:
+            self.file.write(b''.join(out))
+            self.file.flush()
+    
+    def _writer_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self._drain()
+            except (OSError, struct.error) as e:
+                print(f"⚠️  Capture write error: {e}")
+                return
+    
+    def close(self):
+        if self.file is None:
+            return
+        self._stop.set()
+        self.thread.join()
+        try:
+            self._drain()
+        except (OSError, struct.error) as e:
+            print(f"⚠️  Capture write error: {e}")
+        self.file.close()
+        self.file = None
+    
+    def stats(self) -> Dict[str, int]:
+        return {'records': self.records, 'bytes': self.bytes, 'dropped': self.dropped,
+                'pending': len(self.pending)}
+    
+    @classmethod
+    def load(cls, path: str) -> Tuple[Dict[str, int], List[Tuple[int, int, bytes]]]:
+        """Read a capture: (header info, [(direction, monotonic ns, bytes), ...])"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, wall_ns, mono_ns = cls.HEADER.unpack_from(data, 0)
+        if magic != cls.MAGIC or version not in (1, cls.VERSION):
+            raise ValueError(f"{path}: not a wire capture (v1-v{cls.VERSION})")
+        record = cls.RECORD if version == cls.VERSION else cls.RECORD_V1
+        records = []
+        offset = cls.HEADER.size
+        while offset + record.size <= len(data):
+            direction, t_ns, length = record.unpack_from(data, offset)
+            offset += record.size
+            if offset + length > len(data):
+                break  # truncated tail (capture cut short)
+            records.append((direction, t_ns, data[offset:offset + length]))
+            offset += length
+        return {'start_wall_ns': wall_ns, 'start_mono_ns': mono_ns}, records
@@ -0,0 +1,326 @@
+"""
+Protocol Stack Benchmark Suite
+Runs EVProtocol against the STM32 simulator in the same process, linked by a
+pty pair (pyserial on the slave end, the simulator on the master end), an
+in-memory pipe or loopback TCP, so no adapter or socat is needed. Measures:
+
+    parse          decoder + parser frames/s on pre-built ASCII and binary streams (no port)
+    rx_throughput  simulator BURST -> frames/s delivered by the receive thread
+    tx_rate        send_message() build + write rate, scheduled and direct TX
+    ack_rtt        command -> ACK round trip percentiles, ASCII and binary framing
+    burst_recovery 50 Hz stream + slow DATA handler hit by a burst: drops,
+                   time to drain, ACK round trip before / after
+
+With --output the results also go to a JSON file, so runs can be compared
+between commits; nothing is written to disk otherwise.
+
+Usage:
+    python3 benchmark_suite.py [--output results.json] [--compare baseline.json]
+                               [--only parse,ack_rtt] [--scale 1.0] [--link pty|pipe|tcp]
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'First_version'))
+
+from porsche_main_application import (BinaryCodec, EVProtocol, LatencyHistogram, MessageFraming,
+                                      MessageType, PipeTransport, PtyTransport, TcpTransport)
+from stm32_simulator import STM32Simulator
+
+
+LINKS = ('pty', 'pipe', 'tcp')
+
+
+class Link:
+    """The simulator and EVProtocol connected in this process over one of LINKS:
+
+        pty   simulator on a pty master, EVProtocol on the slave through pyserial
+        pipe  in-memory PipeTransport pair, no kernel and no copies
+        tcp   loopback TCP connection
+    """
+
+    def __init__(self, kind: str = 'pty', tx_mode: str = 'scheduled'):
+        if kind == 'pty':
+            sim_port, pi_port = PtyTransport.open_pair()
+        elif kind == 'pipe':
+            sim_port, pi_port = PipeTransport.pair('bench')
+        elif kind == 'tcp':
+            with socket.create_server(('127.0.0.1', 0)) as server:
+                pi_port = TcpTransport.connect('127.0.0.1', server.getsockname()[1])
+                sim_port = TcpTransport(server.accept()[0])
+        else:
+            raise ValueError(f"Unknown link: {kind}")
+        self.simulator = STM32Simulator(sim_port, verbose=False)
+        self.simulator.start()
+        self.protocol = EVProtocol(pi_port, tx_mode=tx_mode)
+        self.protocol.start()
+        # Quiet the 1 s power-on heartbeat so only the benchmark's traffic is on the link
+        self.protocol.unsubscribe_telemetry()
+
+    def close(self):
+        self.protocol.stop()
+        self.simulator.stop()
+
+
+def bench_parse(scale: float, link: str = 'pty'):
+    """Frames/s through FrameDecoder + parse, no port involved"""
+    count = int(100000 * scale)
+    framing = MessageFraming()
+    framing._init_framing()
+    codec = BinaryCodec()
+    ascii_frame = framing._build_message('DATA', {'RPM': 3456.7, 'TEMP': 54.3, 'CURRENT': 28.9,
+                                                  'VOLTAGE': 45.11, 'SOC': 87.6}).encode('utf-8')
+    streams = {
+        'ascii': ascii_frame * count,
+        'binary': b''.join(codec.encode_telemetry(3456.7, 54.3, 28.9, 45.11, 87.6) for _ in range(count)),
+    }
+    results = {}
+    for name, stream in streams.items():
+        framing.decoder.reset()
+        framing.decoder.binary = name == 'binary'
+        parsed = 0
+        start = time.perf_counter()
+        for offset in range(0, len(stream), 4096):
+            for frame in framing.decoder.feed(stream[offset:offset + 4096]):
+                if framing._parse_frame(frame):
+                    parsed += 1
+        elapsed = time.perf_counter() - start
+        assert parsed == count, (name, parsed)
+        results[name] = {'frames': count, 'frames_per_s': count / elapsed,
+                         'us_per_frame': elapsed / count * 1e6}
+    return results
+
+
+def bench_rx_throughput(scale: float, link: str = 'pty'):
+    """Frames/s the receive thread delivers while the simulator bursts telemetry"""
+    count = int(20000 * scale)
+    results = {}
+    for binary in (False, True):
+        pair = Link(link)
+        protocol = pair.protocol
+        try:
+            if binary and not protocol.negotiate_framing(binary=True):
+                raise RuntimeError("simulator declined binary framing")
+            received = [0]
+            protocol.register_callback('DATA', lambda msg: received.__setitem__(0, received[0] + 1))
+            frames_before = protocol.rx_stats.frames
+            start = time.perf_counter()
+            if not protocol.request(MessageType.BURST, {'COUNT': count}, timeout=60.0):
+                raise RuntimeError("BURST not acknowledged")
+            elapsed = time.perf_counter() - start
+            frames = protocol.rx_stats.frames - frames_before - 1  # minus the ACK
+            while protocol.dispatcher.backlog():
+                time.sleep(0.001)
+            stats = protocol.get_rx_stats()
+            results['binary' if binary else 'ascii'] = {
+                'frames': frames,
+                'frames_per_s': frames / elapsed,
+                'bytes_per_s': stats['bytes'] / elapsed,
+                'delivered_to_callback': received[0],
+                'dispatch_overflows': stats['dispatch']['telemetry']['overflows'],
+                'wakeups': stats['wakeups'],
+                'delivery_latency': stats['delivery_latency'],
+            }
+        finally:
+            pair.close()
+    return results
+
+
+def bench_tx_rate(scale: float, link: str = 'pty'):
+    """send_message() rate until the bytes are written, for each TX mode
+
+    Uses a parameterised command (the simulator ACKs each one) so the
+    scheduler cannot coalesce anything.
+    """
+    count = int(20000 * scale)
+    results = {}
+    for tx_mode in EVProtocol.TX_MODES:
+        pair = Link(link, tx_mode)
+        protocol = pair.protocol
+        try:
+            start = time.perf_counter()
+            for i in range(count):
+                protocol.send_message(MessageType.SET_MAX_CURRENT, {'CURRENT': 40 + i % 20})
+            submitted = time.perf_counter() - start
+            scheduler = protocol.tx_scheduler
+            if scheduler is not None:
+                while scheduler.backlog():
+                    time.sleep(0.0005)
+            elapsed = time.perf_counter() - start
+            stats = protocol.get_tx_stats()
+            result = {
+                'messages': count,
+                'submit_per_s': count / submitted,
+                'written_per_s': count / elapsed,
+            }
+            if scheduler is not None:
+                result.update({'writes': stats['batches'],
+                               'queue_latency': stats['command']['queue_latency']})
+            results[tx_mode] = result
+        finally:
+            pair.close()
+    return results
+
+
+def bench_ack_rtt(scale: float, link: str = 'pty'):
+    """Command -> ACK round trips (RESET_FAULT) through the full request path"""
+    count = int(2000 * scale)
+    results = {}
+    for binary in (False, True):
+        pair = Link(link)
+        protocol = pair.protocol
+        try:
+            if binary and not protocol.negotiate_framing(binary=True):
+                raise RuntimeError("simulator declined binary framing")
+            rtt = LatencyHistogram()
+            timeouts = 0
+            for _ in range(count):
+                sent = time.perf_counter_ns()
+                if protocol.request(MessageType.RESET_FAULT, timeout=1.0):
+                    rtt.record(time.perf_counter_ns() - sent)
+                else:
+                    timeouts += 1
+            result = rtt.summary()
+            result['timeouts'] = timeouts
+            results['binary' if binary else 'ascii'] = result
+        finally:
+            pair.close()
+    return results
+
+
+def bench_burst_recovery(scale: float, link: str = 'pty', handler_ms: float = 1.0):
+    """Steady 50 Hz stream with a slow DATA handler, then a burst well beyond the dispatch ring"""
+    burst = int(5000 * scale)
+    pair = Link(link)
+    protocol = pair.protocol
+    try:
+        protocol.register_callback('DATA', lambda msg: time.sleep(handler_ms / 1000))
+        protocol.subscribe_telemetry(50)
+        time.sleep(1.0)
+
+        def rtt_sample(n=50):
+            hist = LatencyHistogram()
+            for _ in range(n):
+                sent = time.perf_counter_ns()
+                if protocol.request(MessageType.RESET_FAULT, timeout=1.0):
+                    hist.record(time.perf_counter_ns() - sent)
+            return hist.summary()
+
+        before = rtt_sample()
+        telemetry = protocol.dispatcher.stats()['telemetry']
+        overflows_before = telemetry['overflows']
+        start = time.perf_counter()
+        if not protocol.request(MessageType.BURST, {'COUNT': burst}, timeout=60.0):
+            raise RuntimeError("BURST not acknowledged")
+        burst_received = time.perf_counter() - start
+        peak_backlog = protocol.dispatcher.backlog()
+        while protocol.dispatcher.backlog() > 1:
+            time.sleep(0.001)
+        drained = time.perf_counter() - start
+        after = rtt_sample()
+        telemetry = protocol.dispatcher.stats()['telemetry']
+        protocol.unsubscribe_telemetry()
+        return {
+            'burst_frames': burst,
+            'handler_ms': handler_ms,
+            'burst_received_s': burst_received,
+            'drained_s': drained,
+            'peak_dispatch_backlog': peak_backlog,
+            'dropped_frames': telemetry['overflows'] - overflows_before,
+            'ack_rtt_before': before,
+            'ack_rtt_after': after,
+        }
+    finally:
+        pair.close()
+
+
+BENCHMARKS = {
+    'parse': bench_parse,
+    'rx_throughput': bench_rx_throughput,
+    'tx_rate': bench_tx_rate,
+    'ack_rtt': bench_ack_rtt,
+    'burst_recovery': bench_burst_recovery,
+}
+
+
+def run_metadata(link: str):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit or None,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'link': link,
+    }
+
+
+def flatten(results, prefix=''):
+    """{'a': {'b': 1}} -> {'a.b': 1} for numeric leaves"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline: dict, current: dict):
+    old, new = flatten(baseline['results']), flatten(current['results'])
+    print(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('time')}):")
+    for name in sorted(set(old) & set(new)):
+        if old[name] == 0:
+            continue
+        change = (new[name] - old[name]) / abs(old[name]) * 100
+        if abs(change) >= 5:
+            print(f"  {name:<60}{old[name]:>14.1f} -> {new[name]:>14.1f} ({change:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EVProtocol benchmark suite (STM32 simulator in-process)")
+    parser.add_argument('--output', metavar='JSON', help="also write the results to this file")
+    parser.add_argument('--compare', metavar='JSON', help="print changes against a previous results file")
+    parser.add_argument('--only', help="comma-separated benchmarks: " + ','.join(BENCHMARKS))
+    parser.add_argument('--scale', type=float, default=1.0, help="multiply message counts (e.g. 0.1 for a quick run)")
+    parser.add_argument('--link', choices=LINKS, default='pty', help="how the simulator is connected")
+    args = parser.parse_args()
+
+    selected = args.only.split(',') if args.only else list(BENCHMARKS)
+    report = {'meta': run_metadata(args.link), 'results': {}}
+    report['meta']['scale'] = args.scale
+
+    print("=" * 64)
+    print(f"🏁 EV Protocol Benchmark Suite ({report['meta']['commit'] or 'no git'}, scale {args.scale:g}, {args.link} link)")
+    print("=" * 64)
+    for name in selected:
+        start = time.perf_counter()
+        report['results'][name] = BENCHMARKS[name](args.scale, args.link)
+        print(f"\n[{name}] ({time.perf_counter() - start:.1f}s)")
+        for key, value in flatten(report['results'][name]).items():
+            print(f"  {key:<44}{value:>16.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📝 Results: {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Fault -> ESTOP Latency Benchmark
+Injects faults in the STM32 simulator (INJECT_FAULT) and measures how long
+the Pi takes to answer with ESTOP, with the receive-thread fast path against
+the old route through the callback dispatcher. A deliberately slow DATA
+handler and 100 Hz telemetry keep the dispatcher busy, like a loaded app.
+
+Usage:
+    python3 fault_latency_bench.py [port] [faults] [data_handler_ms]
+
+Without a port the STM32 simulator runs in this process on a pty pair.
+To benchmark another link, run the simulator in another terminal first:
+    python3 stm32_simulator.py [other end of the port pair]
+"""
+
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'First_version'))
+
+from porsche_main_application import EVProtocol, MessageType, LatencyHistogram, PtyTransport
+from stm32_simulator import STM32Simulator
+
+
+def measure(port: str, fast_path: bool, faults: int, handler_ms: float):
+    """Simulator-observed fault -> ESTOP latency for one ESTOP route"""
+    protocol = EVProtocol(port)
+    protocol.estop_on_fault = fast_path
+    sim_latency = LatencyHistogram()
+    estop_acked = threading.Event()
+
+    def on_fault(msg):
+        if not fast_path:
+            protocol.send_message(MessageType.EMERGENCY_STOP)
+
+    def on_ack(msg):
+        if msg['data'].get('ACK') == 'ESTOP' and 'LATENCY_US' in msg['data']:
+            sim_latency.record(int(msg['data']['LATENCY_US'] * 1000))
+            estop_acked.set()
+
+    protocol.register_callback('FAULT', on_fault)
+    protocol.register_callback('ACK', on_ack)
+    protocol.register_callback('DATA', lambda msg: time.sleep(handler_ms / 1000))
+    protocol.start()
+
+    timeouts = 0
+    try:
+        protocol.subscribe_telemetry(100)
+        time.sleep(0.5)  # let a DATA backlog build up
+        for i in range(faults):
+            estop_acked.clear()
+            protocol.send_message(MessageType.INJECT_FAULT, {'FAULT': f'BENCH{i}'})
+            if not estop_acked.wait(timeout=2.0):
+                timeouts += 1
+            time.sleep(ESTOP_GAP)
+        protocol.unsubscribe_telemetry()
+        return sim_latency.summary(), protocol.fault_latency.summary(), timeouts
+    finally:
+        protocol.stop()
+
+
+# Keep injections further apart than EVProtocol.ESTOP_HOLDOFF
+ESTOP_GAP = 0.1
+
+
+def start_simulator():
+    """STM32 simulator in this process on a pty pair; returns it and the port for EVProtocol"""
+    sim_port, port = PtyTransport.open_pair()
+    simulator = STM32Simulator(sim_port, verbose=False)
+    simulator.start()
+    return simulator, port
+
+
+def main():
+    port = sys.argv[1] if len(sys.argv) > 1 else None
+    faults = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    handler_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 5.0
+
+    simulator = None
+    if port is None:
+        simulator, port = start_simulator()
+
+    print("=" * 64)
+    print("🛑 Fault -> ESTOP Latency Benchmark")
+    print("=" * 64)
+    print(f"Port: {port}  Faults: {faults}  DATA handler: {handler_ms} ms @ 100 Hz")
+
+    for name, fast_path in (('dispatcher callback', False), ('receive-thread fast path', True)):
+        sim, pi, timeouts = measure(port, fast_path, faults, handler_ms)
+        print(f"\n[{name}]")
+        if sim['count']:
+            print(f"  Sim fault->ESTOP:   p50 {sim['p50_us']:.0f} us | p90 {sim['p90_us']:.0f} us | "
+                  f"p99 {sim['p99_us']:.0f} us | max {sim['max_us']:.0f} us")
+        if pi['count']:
+            print(f"  Pi read->ESTOP:     p50 {pi['p50_us']:.0f} us | p99 {pi['p99_us']:.0f} us")
+        print(f"  Timeouts:           {timeouts}")
+
+    print("\n" + "=" * 64)
+    if simulator is not None:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Framing Benchmark
+Bytes per telemetry sample, link-limited frames/sec and CPU encode/decode
+cost for the ASCII protocol against binary framing. No serial port needed.
+
+Usage:
+    python3 framing_benchmark.py [baudrate] [iterations]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'First_version'))
+
+from porsche_main_application import BinaryCodec, FrameDecoder, MessageParser
+
+
+SAMPLE = {'RPM': 3456.7, 'TEMP': 54.3, 'CURRENT': 28.9, 'VOLTAGE': 45.11, 'SOC': 87.6}
+
+
+def build_ascii(params) -> bytes:
+    """Same formatting as STM32Simulator._build_message"""
+    body = ';'.join(f"{k}={v}" for k, v in params.items())
+    return f"<DATA:{body}>".encode('utf-8')
+
+
+def main():
+    baudrate = int(sys.argv[1]) if len(sys.argv) > 1 else 115200
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    bytes_per_s = baudrate / 10  # 8N1: start + 8 data + stop bits
+
+    codec = BinaryCodec()
+    parser = MessageParser()
+    values = tuple(SAMPLE.values())
+
+    ascii_frame = build_ascii(SAMPLE)
+    binary_frame = codec.encode_telemetry(*values)
+
+    def ascii_roundtrip():
+        frame = decoder_ascii.feed(build_ascii(SAMPLE))[0]
+        return parser.parse(frame.decode('utf-8'))
+
+    def binary_roundtrip():
+        frame = decoder_binary.feed(codec.encode_telemetry(*values))[0]
+        return codec.decode(frame, parser.parse)
+
+    decoder_ascii = FrameDecoder()
+    decoder_binary = FrameDecoder(binary=True)
+    assert ascii_roundtrip()['data'].get('SOC') == SAMPLE['SOC']
+    assert abs(binary_roundtrip()['data'].soc - SAMPLE['SOC']) < 1e-4
+
+    ascii_cpu = min(timeit.repeat(ascii_roundtrip, number=iterations, repeat=3)) / iterations
+    binary_cpu = min(timeit.repeat(binary_roundtrip, number=iterations, repeat=3)) / iterations
+
+    print("=" * 64)
+    print(f"📦 Telemetry Framing Comparison @ {baudrate} baud (8N1)")
+    print("=" * 64)
+    print(f"{'':<28}{'ASCII':>16}{'Binary':>16}")
+    print(f"{'Bytes per sample':<28}{len(ascii_frame):>16}{len(binary_frame):>16}")
+    print(f"{'Max samples/s on link':<28}{bytes_per_s / len(ascii_frame):>16.0f}"
+          f"{bytes_per_s / len(binary_frame):>16.0f}")
+    print(f"{'Encode+frame+parse (us)':<28}{ascii_cpu * 1e6:>16.1f}{binary_cpu * 1e6:>16.1f}")
+    print(f"{'CPU-limited samples/s':<28}{1 / ascii_cpu:>16.0f}{1 / binary_cpu:>16.0f}")
+    print("=" * 64)
+    print(f"Binary frames are {len(ascii_frame) / len(binary_frame):.2f}x smaller "
+          f"(integrity: CRC16 + sequence number vs none)")
+
+
+if __name__ == "__main__":
+    main()
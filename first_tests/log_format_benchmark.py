@@ -0,0 +1,81 @@
+"""
+Log Format Benchmark
+Writer CPU per row, file size and reload time for the CSV log backend against
+the columnar one. No serial port needed; writes into a temporary directory.
+
+Usage:
+    python3 log_format_benchmark.py [rows]
+"""
+
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'First_version'))
+
+from porsche_main_application import (ColumnarLogBackend, ColumnarLogReader, CsvLogBackend,
+                                      TelemetrySample, export_csv)
+
+
+def make_rows(count: int):
+    start_ns = time.monotonic_ns()
+    return [(start_ns + i * 100_000_000,
+             TelemetrySample(3000.0 + i % 500, 50.0 + (i % 40) * 0.1, 28.9, 45.11, 87.6 - i * 1e-4, 42),
+             42)
+            for i in range(count)]
+
+
+def write_log(backend, path: str, rows, batch_size: int = 64) -> float:
+    """Seconds spent in the backend, fed the way DataLogger's writer thread feeds it"""
+    start = time.perf_counter()
+    backend.open(path, time.time_ns(), rows[0][0])
+    for i in range(0, len(rows), batch_size):
+        backend.write(rows[i:i + batch_size])
+        backend.flush()
+    backend.close()
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rows = make_rows(count)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'session' + CsvLogBackend.EXTENSION)
+        col_path = os.path.join(tmp, 'session' + ColumnarLogBackend.EXTENSION)
+        csv_write = write_log(CsvLogBackend(), csv_path, rows)
+        col_write = write_log(ColumnarLogBackend(), col_path, rows)
+
+        start = time.perf_counter()
+        with open(csv_path, newline='') as f:
+            csv_temps = [float(row['temperature']) for row in csv.DictReader(f)]
+        csv_load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ColumnarLogReader(col_path) as reader:
+            col_temps = reader.column('temperature')
+        col_load = time.perf_counter() - start
+        assert len(csv_temps) == len(col_temps) == count
+
+        start = time.perf_counter()
+        export_csv(col_path, os.path.join(tmp, 'export.csv'))
+        export = time.perf_counter() - start
+
+        csv_size = os.path.getsize(csv_path)
+        col_size = os.path.getsize(col_path)
+
+    print("=" * 64)
+    print(f"🗄️  Log Format Comparison ({count} rows)")
+    print("=" * 64)
+    print(f"{'':<28}{'CSV':>16}{'Columnar':>16}")
+    print(f"{'Write (us/row)':<28}{csv_write / count * 1e6:>16.2f}{col_write / count * 1e6:>16.2f}")
+    print(f"{'File size (bytes/row)':<28}{csv_size / count:>16.1f}{col_size / count:>16.1f}")
+    print(f"{'Reload one column (ms)':<28}{csv_load * 1e3:>16.1f}{col_load * 1e3:>16.1f}")
+    print("=" * 64)
+    print(f"Columnar -> CSV export: {export * 1e3:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
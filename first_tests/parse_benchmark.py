@@ -0,0 +1,56 @@
+"""
+Parser Microbenchmark
+Per-frame parse cost of the schema-compiled DATA parser against the
+generic key/value parser. No serial port needed.
+
+Usage:
+    python3 parse_benchmark.py [iterations]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'First_version'))
+
+from porsche_main_application import MessageParser
+
+
+FRAMES = {
+    'DATA (full)': '<DATA:RPM=3456.7;TEMP=54.3;CURRENT=28.9;VOLTAGE=45.11;SOC=87.6>',
+    'DATA (+THROTTLE)': '<DATA:RPM=3456.7;TEMP=54.3;CURRENT=28.9;VOLTAGE=45.11;SOC=87.6;THROTTLE=42>',
+    'DATA (partial)': '<DATA:TEMP=54.3>',
+    'ACK': '<ACK:ACK=SET_CURRENT_LIMIT>',
+}
+REPEAT = 15
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    parser = MessageParser()
+
+    print("=" * 72)
+    print("🧪 Telemetry Parser Microbenchmark")
+    print("=" * 72)
+    print(f"{'Frame':<20}{'generic ns/frame':>18}{'schema ns/frame':>18}{'speedup':>10}")
+
+    for name, frame in FRAMES.items():
+        # Both paths must agree on the decoded values
+        generic_data = parser.parse_generic(frame)['data']
+        schema_data = parser.parse(frame)['data']
+        assert all(schema_data.get(key) == value for key, value in generic_data.items()), name
+
+        # Alternate the two paths and keep each one's best run, so load spikes don't favour either
+        generic = schema = float('inf')
+        for _ in range(REPEAT):
+            generic = min(generic, timeit.timeit(lambda: parser.parse_generic(frame), number=iterations))
+            schema = min(schema, timeit.timeit(lambda: parser.parse(frame), number=iterations))
+        generic_ns = generic / iterations * 1e9
+        schema_ns = schema / iterations * 1e9
+        print(f"{name:<20}{generic_ns:>18.0f}{schema_ns:>18.0f}{generic_ns / schema_ns:>9.2f}x")
+
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Replay Regression Runner
+Plays a recorded session through the full EVController pipeline (receive,
+parse, dispatch, safety checks) using ReplaySource instead of a serial port,
+then reports throughput and at which sample each fault fired and each
+ESTOP went out.
+
+Usage:
+    python3 replay_regression.py LOG [--speed N|max] [--binary]
+                                     [--save expected.json] [--expect expected.json]
+                                     [--out DIR] [--blackbox]
+
+LOG is a DataLogger .csv / .evlog segment (plain, .gz or .zst), a .evcap
+wire capture (main --capture) or a .txt / .frames raw frame dump.
+With --expect the run exits non-zero if the timeline differs from a previous --save.
+Compare baselines at max speed, which is lossless; at 1x/Nx a recording
+denser than the pipeline can keep up with drops samples exactly as it would live.
+The controller runs on the default config, with its config file and logs in a
+temporary directory unless --out is given; the black box ring is only
+recorded with --blackbox.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'First_version'))
+
+from porsche_main_application import ConfigManager, EVController, ReplaySource
+
+
+class ReplayController(EVController):
+    """EVController that notes the sample index of each fault and ESTOP
+
+    The timeline holds [event, sample] pairs: a safety rule name, "STM32:<fault>"
+    for a latched STM32 FAULT frame, or "ESTOP" for an emergency stop sent
+    (including one already written by the protocol's FAULT fast path).
+    """
+
+    def __init__(self, source: ReplaySource, config: ConfigManager, log_dir: str):
+        self.samples = 0
+        self.received = 0  # DATA frames off the wire, to place FAULT frames
+        self.timeline = []
+        self.estops = 0
+        super().__init__(source, config=config, log_dir=log_dir)
+        # FAULT frames jump the DATA backlog in the dispatcher, so stamp each
+        # with its position in the stream before it is queued
+        submit = self.protocol.dispatcher.submit
+
+        def stamped(msg):
+            if msg['type'] == 'DATA':
+                self.received += 1
+            elif msg['type'] == 'FAULT':
+                msg['sample'] = self.received
+            submit(msg)
+        self.protocol.dispatcher.submit = stamped
+
+    def _check_safety_conditions(self):
+        self.samples += 1
+        before, estops = set(self.faults), self.estops
+        super()._check_safety_conditions()
+        self._note(self.faults - before, self.estops != estops, self.samples)
+
+    def _handle_fault(self, msg):
+        before, estops = set(self.faults), self.estops
+        super()._handle_fault(msg)
+        latched = {f"STM32:{fault}" for fault in self.faults - before}
+        fast_path = bool(latched and msg.get('estop_sent') and self.config.get('emergency_stop_on_fault'))
+        self._note(latched, fast_path or self.estops != estops, msg.get('sample', self.samples))
+
+    def _note(self, faults, estop: bool, sample: int):
+        for fault in sorted(faults):
+            self.timeline.append([fault, sample])
+        if estop:
+            self.timeline.append(['ESTOP', sample])
+
+    def emergency_stop(self) -> bool:
+        self.estops += 1
+        return super().emergency_stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded session through EVController")
+    parser.add_argument('log')
+    parser.add_argument('--speed', default='max', help="playback speed multiplier or 'max'")
+    parser.add_argument('--binary', action='store_true', help="re-encode telemetry as binary frames")
+    parser.add_argument('--save', metavar='JSON', help="write the results as the expected baseline")
+    parser.add_argument('--expect', metavar='JSON', help="compare the timeline against a saved baseline")
+    parser.add_argument('--out', metavar='DIR', help="keep the controller's config and logs here (default: a temp dir)")
+    parser.add_argument('--blackbox', action='store_true', help="also record the black box ring")
+    args = parser.parse_args()
+
+    speed = None if args.speed == 'max' else float(args.speed)
+    source = ReplaySource.from_file(args.log, binary=args.binary, speed=speed)
+    total = len(source)
+
+    controller = None
+    if speed is None:
+        # Lossless max speed: hold frames back until the controller is up and
+        # whenever its dispatcher is backed up
+        source.hold = lambda: controller is None or controller.protocol.dispatcher.backlog() > 128
+
+    with contextlib.nullcontext(args.out) if args.out else tempfile.TemporaryDirectory() as out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+        config = ConfigManager(os.path.join(out_dir, 'ev_config.json'))
+        config.set('blackbox_enabled', args.blackbox)
+
+        start = time.perf_counter()
+        controller = ReplayController(source, config, os.path.join(out_dir, 'logs'))
+        source.wait()
+        while controller.protocol.dispatcher.backlog():
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - start
+
+        dispatch = controller.protocol.dispatcher.stats()['telemetry']
+        rx = controller.protocol.get_rx_stats()
+        controller.shutdown()
+
+    results = {
+        'log': os.path.basename(args.log),
+        'frames': total,
+        'samples': controller.samples,
+        'timeline': controller.timeline,
+    }
+
+    print("=" * 64)
+    print(f"🔁 Replay: {args.log} @ {args.speed if speed is None else f'{speed:g}x'}")
+    print("=" * 64)
+    print(f"Frames replayed:   {total} in {elapsed:.2f}s ({total / elapsed:.0f} frames/s)")
+    print(f"Samples checked:   {controller.samples}  (dispatch overflows: {dispatch['overflows']})")
+    print(f"Read->delivery:    p50 {rx['delivery_latency']['p50_us']:.0f} us | "
+          f"p99 {rx['delivery_latency']['p99_us']:.0f} us")
+    print(f"Dispatch queue:    p50 {dispatch['queue_latency']['p50_us']:.0f} us | "
+          f"p99 {dispatch['queue_latency']['p99_us']:.0f} us")
+    print(f"Commands sent:     {source.commands}")
+    for event, sample in controller.timeline:
+        print(f"  {'🛑' if event == 'ESTOP' else '⚠️ '} {event} at sample {sample}")
+    print("=" * 64)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline saved: {args.save}")
+
+    if args.expect:
+        with open(args.expect) as f:
+            expected = json.load(f)
+        if expected['timeline'] != results['timeline'] or expected['samples'] != results['samples']:
+            print(f"❌ REGRESSION: expected {expected['timeline']} over {expected['samples']} samples")
+            sys.exit(1)
+        print("✅ Matches baseline")
+
+
+if __name__ == "__main__":
+    main()
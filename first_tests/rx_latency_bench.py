@@ -0,0 +1,94 @@
+"""
+Receive Engine Benchmark
+Compares the original sleep-poll receive loop against the event-driven one
+using the STM32 simulator on the other end of the link.
+
+Usage:
+    python3 rx_latency_bench.py [port] [round_trips] [idle_seconds]
+
+Without a port the STM32 simulator runs in this process on a pty pair.
+To benchmark another link, run the simulator in another terminal first:
+    python3 stm32_simulator.py [other end of the port pair]
+"""
+
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'First_version'))
+
+from porsche_main_application import EVProtocol, MessageType, LatencyHistogram, PtyTransport
+from stm32_simulator import STM32Simulator
+
+
+def measure(port: str, rx_mode: str, round_trips: int, idle_seconds: float):
+    """Measure idle wake-ups and command->ACK round trips for one receive mode"""
+    protocol = EVProtocol(port, rx_mode=rx_mode)
+    ack_event = threading.Event()
+    protocol.register_callback('ACK', lambda msg: ack_event.set())
+    protocol.start()
+
+    try:
+        # Idle wake-ups (the simulator still pushes one DATA frame per second)
+        time.sleep(idle_seconds)
+        idle = protocol.get_rx_stats()
+
+        rtt = LatencyHistogram()
+        timeouts = 0
+        for _ in range(round_trips):
+            ack_event.clear()
+            sent = time.perf_counter_ns()
+            protocol.send_message(MessageType.RESET_FAULT)
+            if ack_event.wait(timeout=1.0):
+                rtt.record(time.perf_counter_ns() - sent)
+            else:
+                timeouts += 1
+
+        return idle, rtt.summary(), timeouts, protocol.get_rx_stats()
+    finally:
+        protocol.stop()
+
+
+def start_simulator():
+    """STM32 simulator in this process on a pty pair; returns it and the port for EVProtocol"""
+    sim_port, port = PtyTransport.open_pair()
+    simulator = STM32Simulator(sim_port, verbose=False)
+    simulator.start()
+    return simulator, port
+
+
+def main():
+    port = sys.argv[1] if len(sys.argv) > 1 else None
+    round_trips = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    idle_seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5.0
+
+    simulator = None
+    if port is None:
+        simulator, port = start_simulator()
+
+    print("=" * 60)
+    print("⏱️  EV Protocol Receive Engine Benchmark")
+    print("=" * 60)
+    print(f"Port: {port}  Round trips: {round_trips}  Idle window: {idle_seconds}s")
+
+    for rx_mode in EVProtocol.RX_MODES:
+        idle, rtt, timeouts, final = measure(port, rx_mode, round_trips, idle_seconds)
+        delivery = final['delivery_latency']
+        print(f"\n[{final['rx_mode']}]")
+        print(f"  Idle wake-ups:      {idle['wakeups']} ({idle['wakeups_per_s']:.1f}/s)")
+        if rtt['count']:
+            print(f"  ACK round trip:     p50 {rtt['p50_us']:.0f} us | p90 {rtt['p90_us']:.0f} us | "
+                  f"p99 {rtt['p99_us']:.0f} us | max {rtt['max_us']:.0f} us")
+        print(f"  ACK timeouts:       {timeouts}")
+        if delivery['count']:
+            print(f"  Read->delivery:     p50 {delivery['p50_us']:.0f} us | p99 {delivery['p99_us']:.0f} us")
+        print(f"  Frames / bytes:     {final['frames']} / {final['bytes']}")
+
+    print("\n" + "=" * 60)
+    if simulator is not None:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
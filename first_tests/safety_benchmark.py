@@ -0,0 +1,101 @@
+"""
+Safety Engine Benchmark
+Per-sample cost of the compiled safety rule set, and whole-log scan time
+with and without NumPy. Checks that every path reports the same trips.
+No serial port needed.
+
+Usage:
+    python3 safety_benchmark.py [samples]
+"""
+
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'First_version'))
+
+import ev_safety
+from porsche_main_application import SafetyEngine, SafetyRule, TelemetrySample
+
+
+RULES = [
+    {'name': 'OVERHEAT', 'field': 'TEMP', 'op': '>', 'threshold': 80, 'hysteresis': 2},
+    {'name': 'LOW_BATTERY', 'field': 'SOC', 'op': '<', 'threshold': 15, 'hysteresis': 1},
+    {'name': 'OVERCURRENT', 'field': 'CURRENT', 'op': '>', 'threshold': 120, 'sustain_ms': 200},
+    {'name': 'UNDERVOLTAGE', 'field': 'VOLTAGE', 'op': '<', 'threshold': 40, 'sustain_ms': 500, 'hysteresis': 0.5},
+    {'name': 'CURRENT_SLEW', 'field': 'CURRENT', 'kind': 'rate', 'threshold': 2000, 'hysteresis': 500},
+]
+
+
+def make_drive(count: int, rate_hz: float = 100.0):
+    """Synthetic drive: heating, draining battery, current spikes, voltage sag, dropouts"""
+    rng = random.Random(42)
+    times, columns = [], {name: [] for name in ('rpm', 'temp', 'current', 'voltage', 'soc')}
+    for i in range(count):
+        t = i / rate_hz
+        current = 60 + 40 * math.sin(t / 3) + rng.gauss(0, 5) + (90 if rng.random() < 0.01 else 0)
+        times.append(t)
+        columns['rpm'].append(3000 + current * 10)
+        columns['temp'].append(40 + 45 * i / count + rng.gauss(0, 1.5))
+        columns['current'].append(math.nan if rng.random() < 0.002 else current)
+        columns['voltage'].append(48 - current * 0.06 + rng.gauss(0, 0.3))
+        columns['soc'].append(100 - 90 * i / count)
+    return times, columns
+
+
+def to_samples(times, columns):
+    fields = ('rpm', 'temp', 'current', 'voltage', 'soc')
+    samples = []
+    for n, t in enumerate(times):
+        values = [columns[name][n] for name in fields]
+        samples.append(TelemetrySample(*[None if v != v else v for v in values], None, t))
+    return samples
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    engine = SafetyEngine([SafetyRule.from_dict(spec) for spec in RULES])
+    times, columns = make_drive(count)
+    samples = to_samples(times, columns)
+
+    # Live path: one evaluate() per sample
+    engine.reset()
+    live = []
+    start = time.perf_counter()
+    for n, sample in enumerate(samples):
+        tripped = engine.evaluate(sample)
+        if tripped:
+            live += [(rule.name, n) for rule in engine.tripped_rules(tripped)]
+    per_sample = (time.perf_counter() - start) / count
+
+    numpy_module = ev_safety.numpy
+    ev_safety.numpy = None
+    start = time.perf_counter()
+    python_scan = engine.scan(times, columns)
+    python_time = time.perf_counter() - start
+    ev_safety.numpy = numpy_module
+
+    print("=" * 64)
+    print(f"🛡️  Safety Engine Benchmark ({count} samples, {len(RULES)} rules)")
+    print("=" * 64)
+    print(f"Trips:                   {len(live)}")
+    print(f"evaluate() per sample:   {per_sample * 1e9:.0f} ns")
+    print(f"scan() pure Python:      {python_time * 1e3:.1f} ms")
+    assert sorted(python_scan, key=lambda e: (e[1], e[0])) == sorted(live, key=lambda e: (e[1], e[0]))
+
+    if numpy_module is not None:
+        start = time.perf_counter()
+        numpy_scan = engine.scan(times, columns)
+        numpy_time = time.perf_counter() - start
+        print(f"scan() NumPy:            {numpy_time * 1e3:.1f} ms ({python_time / numpy_time:.1f}x)")
+        assert sorted(numpy_scan, key=lambda e: (e[1], e[0])) == sorted(live, key=lambda e: (e[1], e[0]))
+    else:
+        print("scan() NumPy:            (numpy not installed)")
+    print("=" * 64)
+    print("✅ All paths agree")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,17 @@ Simulates the STM32 side so you can test the Raspberry Pi code
 Run this in one terminal and your Pi code in another
 """
 
-import serial
+import os
+import sys
 import time
 import random
 import threading
-from typing import Dict, Any
+from typing import Callable, Dict, Any, Optional, Union
+
+# Frame with the same decoder and binary codec as the Pi application
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'First_version'))
+from porsche_main_application import (BinaryCodec, EVProtocol, FrameDecoder, PipeTransport, PtyTransport,
+                                      VirtualClock, open_transport)
 
 
 class STM32Simulator:
@@ -20,16 +26,49 @@ class STM32Simulator:
     PARAM_SEP = ';'
     VALUE_SEP = '='
     
-    def __init__(self, port: str, baudrate: int = 115200):
+    # Virtual time: re-check hold() at least this often (real seconds), in case
+    # something the Pi finished didn't notify the clock
+    HOLD_RECHECK = 0.05
+    
+    def __init__(self, port: Union[str, Any], baudrate: int = 115200, verbose: bool = True,
+                 clock: Optional[VirtualClock] = None, seed: Optional[int] = None):
         """
         Initialize the simulator
         
         Args:
-            port: Serial port (e.g., '/dev/ttyUSB0')
+            port: Serial port (e.g., '/dev/ttyUSB0'), transport URL (tcp-listen://5555,
+                  pipe://name, pty; see open_transport) or an already-open port object
             baudrate: Communication speed
+            verbose: Print every message sent and received (off for benchmarks)
+            clock: Run in virtual time on this clock instead of real time: physics
+                   and telemetry are stepped back to back with a fixed dt, and only
+                   as far as run_for() allows (see _virtual_loop)
+            seed: Seed for the sensor noise, for reproducible runs
         """
-        self.serial = serial.Serial(port, baudrate, timeout=0.1)
+        if isinstance(port, str):
+            self.serial = open_transport(port, baudrate, timeout=0.1)
+        else:
+            self.serial = port  # already-open serial.Serial, Transport or stand-in with read/write/in_waiting
+        port = getattr(self.serial, 'name', None) or getattr(self.serial, 'port', None) or type(self.serial).__name__
+        if isinstance(self.serial, PtyTransport):
+            port = f"pty, connect the Pi to {self.serial.slave_path}"
+        self._read_any = getattr(self.serial, 'read_available', None)
+        self.verbose = verbose
         self.running = False
+        self.rx_thread = self.sim_thread = None
+        self.rng = random.Random(seed)
+        self.clock = clock
+        self._now: Callable[[], float] = clock if clock is not None else time.time
+        # Virtual time: simulated time stops here until run_for() moves it on, and
+        # no step is taken while hold() is True (see sync_with())
+        self.run_until = self.paused_at = clock() if clock is not None else None
+        self.hold: Optional[Callable[[], bool]] = None
+        self.rx_bytes = 0  # received bytes whose commands have been handled
+        self.decoder = FrameDecoder()
+        self.codec = BinaryCodec()
+        self.binary_mode = False  # switched by SET_MODE from the Pi
+        self.request_id = None  # ID of the command being handled, echoed in ACK/NACK
+        self.fault_injected_at = None  # INJECT_FAULT time, to measure fault -> ESTOP latency
         
         # Simulated vehicle state
         self.state = {
@@ -45,12 +84,20 @@ class STM32Simulator:
             'faults': []
         }
         
-        self.telemetry_interval = 1.0  # Send telemetry every N seconds
-        self.last_telemetry_time = time.time()
+        # Pushed telemetry: 1 s heartbeat at power-on, SUBSCRIBE sets the rate,
+        # UNSUBSCRIBE stops pushing (None)
+        self.telemetry_interval = 1.0
+        self.last_telemetry_time = self._now()
+        self.physics_interval = 0.1
+        self.last_physics_time = self._now()
         
-        print("🔧 STM32 Simulator Started")
-        print(f"📡 Port: {port} @ {baudrate} baud")
-        print("=" * 50)
+        self._log("🔧 STM32 Simulator Started")
+        self._log(f"📡 Port: {port} @ {baudrate} baud")
+        self._log("=" * 50)
+    
+    def _log(self, text: str):
+        if self.verbose:
+            print(text)
     
     def _parse_message(self, message: str) -> Dict[str, Any]:
         """Parse incoming message"""
@@ -96,20 +143,39 @@ class STM32Simulator:
     def _send_message(self, msg_type: str, params: Dict[str, Any] = None):
         """Send message to Raspberry Pi"""
         message = self._build_message(msg_type, params)
-        self.serial.write(message.encode('utf-8'))
+        if self.binary_mode:
+            self.serial.write(self.codec.encode_text(message))
+        else:
+            self.serial.write(message.encode('utf-8'))
         self.serial.flush()
-        print(f"📤 Sent: {message}")
+        self._log(f"📤 Sent: {message}")
     
-    def _send_ack(self, command: str):
-        """Send ACK response"""
-        self._send_message('ACK', {'ACK': command})
+    def _send_ack(self, command: str, extra: Dict[str, Any] = None):
+        """Send ACK response (echoing the request ID if the command had one)"""
+        params = {'ACK': command}
+        if extra:
+            params.update(extra)
+        if self.request_id is not None:
+            params['ID'] = self.request_id
+        self._send_message('ACK', params)
     
     def _send_nack(self, command: str, reason: str):
-        """Send NACK response"""
-        self._send_message('NACK', {'CMD': command, 'REASON': reason})
+        """Send NACK response (echoing the request ID if the command had one)"""
+        params = {'CMD': command, 'REASON': reason}
+        if self.request_id is not None:
+            params['ID'] = self.request_id
+        self._send_message('NACK', params)
     
     def _send_telemetry(self):
         """Send telemetry data"""
+        if self.binary_mode:
+            self.serial.write(self.codec.encode_telemetry(
+                self.state['rpm'], self.state['temperature'], self.state['current'],
+                self.state['voltage'], self.state['battery_soc']))
+            self.serial.flush()
+            self._log(f"📤 Sent: [BIN] telemetry #{(self.codec.tx_seq - 1) & 0xFF}")
+            return
+        
         params = {
             'RPM': round(self.state['rpm'], 1),
             'TEMP': round(self.state['temperature'], 1),
@@ -140,9 +206,9 @@ class STM32Simulator:
         self.state['temperature'] += heat_generation - cooling
         
         # Add some noise
-        self.state['temperature'] += random.uniform(-0.2, 0.2)
-        self.state['rpm'] += random.uniform(-10, 10)
-        self.state['current'] += random.uniform(-0.5, 0.5)
+        self.state['temperature'] += self.rng.uniform(-0.2, 0.2)
+        self.state['rpm'] += self.rng.uniform(-10, 10)
+        self.state['current'] += self.rng.uniform(-0.5, 0.5)
         
         # Discharge battery
         if self.state['current'] > 0:
@@ -169,14 +235,15 @@ class STM32Simulator:
         
         msg_type = msg['type']
         data = msg['data']
+        self.request_id = data.get('ID')
         
-        print(f"📥 Received: {msg_type} {data}")
+        self._log(f"📥 Received: {msg_type} {data}")
         
         if msg_type == 'SET_SPEED':
             if 'SPEED' in data:
                 self.state['speed'] = data['SPEED']
                 self._send_ack('SET_SPEED')
-                print(f"   ✓ Speed set to {self.state['speed']}%")
+                self._log(f"   ✓ Speed set to {self.state['speed']}%")
             else:
                 self._send_nack('SET_SPEED', 'MISSING_PARAM')
         
@@ -184,7 +251,7 @@ class STM32Simulator:
             if 'TORQUE' in data:
                 self.state['torque'] = data['TORQUE']
                 self._send_ack('SET_TORQUE')
-                print(f"   ✓ Torque set to {self.state['torque']}%")
+                self._log(f"   ✓ Torque set to {self.state['torque']}%")
             else:
                 self._send_nack('SET_TORQUE', 'MISSING_PARAM')
         
@@ -192,7 +259,7 @@ class STM32Simulator:
             if 'CURRENT' in data:
                 self.state['max_current'] = data['CURRENT']
                 self._send_ack('SET_MAX_CURRENT')
-                print(f"   ✓ Max current set to {self.state['max_current']}A")
+                self._log(f"   ✓ Max current set to {self.state['max_current']}A")
             else:
                 self._send_nack('SET_MAX_CURRENT', 'MISSING_PARAM')
         
@@ -200,7 +267,7 @@ class STM32Simulator:
             if 'REGEN' in data:
                 self.state['regen_brake'] = data['REGEN']
                 self._send_ack('SET_REGEN_BRAKE')
-                print(f"   ✓ Regen brake set to {self.state['regen_brake']}%")
+                self._log(f"   ✓ Regen brake set to {self.state['regen_brake']}%")
             else:
                 self._send_nack('SET_REGEN_BRAKE', 'MISSING_PARAM')
         
@@ -209,13 +276,57 @@ class STM32Simulator:
             self.state['torque'] = 0
             self.state['rpm'] = 0
             self.state['current'] = 0
-            self._send_ack('ESTOP')
-            print("   🛑 EMERGENCY STOP!")
+            extra = None
+            if self.fault_injected_at is not None:
+                latency_us = (time.perf_counter() - self.fault_injected_at) * 1e6
+                self.fault_injected_at = None
+                extra = {'LATENCY_US': round(latency_us, 1)}
+            self._send_ack('ESTOP', extra)
+            self._log("   🛑 EMERGENCY STOP!")
+        
+        elif msg_type == 'INJECT_FAULT':
+            # Test hook: raise a fault now and time how long the Pi takes to ESTOP
+            self.fault_injected_at = time.perf_counter()
+            self._send_fault(data.get('FAULT', 'INJECTED'))
+        
+        elif msg_type == 'BURST':
+            # Test hook: COUNT telemetry frames back to back, then the ACK
+            count = data.get('COUNT', 100)
+            for _ in range(count):
+                self._send_telemetry()
+            self._send_ack('BURST', {'COUNT': count})
         
         elif msg_type == 'RESET_FAULT':
             self.state['faults'].clear()
             self._send_ack('RESET_FAULT')
-            print("   ✓ Faults cleared")
+            self._log("   ✓ Faults cleared")
+        
+        elif msg_type == 'SET_MODE':
+            mode = data.get('MODE')
+            if mode in ('BIN', 'ASCII'):
+                # ACK in the current framing, then switch; accept binary commands
+                # as soon as BIN is ACKed (the Pi may answer before we return)
+                self.decoder.binary = True
+                self._send_ack('SET_MODE')
+                self.binary_mode = self.decoder.binary = mode == 'BIN'
+                self._log(f"   ✓ Framing set to {mode}")
+            else:
+                self._send_nack('SET_MODE', 'INVALID_MODE')
+        
+        elif msg_type == 'SUBSCRIBE':
+            rate = data.get('RATE')
+            if isinstance(rate, (int, float)) and 0 < rate <= 200:
+                self.telemetry_interval = 1.0 / rate
+                self.last_telemetry_time = self._now()
+                self._send_ack('SUBSCRIBE')
+                self._log(f"   ✓ Streaming telemetry at {rate} Hz")
+            else:
+                self._send_nack('SUBSCRIBE', 'INVALID_RATE')
+        
+        elif msg_type == 'UNSUBSCRIBE':
+            self.telemetry_interval = None
+            self._send_ack('UNSUBSCRIBE')
+            self._log("   ✓ Telemetry streaming stopped")
         
         elif msg_type == 'GET_TELEM':
             self._send_telemetry()
@@ -236,47 +347,125 @@ class STM32Simulator:
         
         else:
             self._send_nack('UNKNOWN', 'INVALID_COMMAND')
-            print(f"   ❌ Unknown command: {msg_type}")
+            self._log(f"   ❌ Unknown command: {msg_type}")
     
     def _receive_loop(self):
         """Background thread to receive messages"""
-        buffer = ""
         while self.running:
             try:
-                if self.serial.in_waiting > 0:
-                    data = self.serial.read(self.serial.in_waiting).decode('utf-8', errors='ignore')
-                    buffer += data
-                    
-                    # Process complete messages
-                    while self.START_CHAR in buffer and self.END_CHAR in buffer:
-                        start = buffer.find(self.START_CHAR)
-                        end = buffer.find(self.END_CHAR, start)
-                        
-                        if end > start:
-                            message = buffer[start:end+1]
-                            buffer = buffer[end+1:]
-                            
-                            parsed = self._parse_message(message)
-                            self._handle_command(parsed)
-                        else:
-                            break
+                # Block for the first byte (bounded by the port timeout), then drain
+                if self._read_any is not None:
+                    data = self._read_any()
                 else:
-                    time.sleep(0.01)
+                    data = self.serial.read(1)
+                    if data and self.serial.in_waiting > 0:
+                        data += self.serial.read(self.serial.in_waiting)
+                if not data:
+                    continue
+                
+                # Process complete messages
+                for frame in self.decoder.feed(data):
+                    if frame[0] == BinaryCodec.SYNC:
+                        parsed = self.codec.decode(frame, self._parse_message)
+                    else:
+                        parsed = self._parse_message(frame.decode('utf-8', errors='ignore'))
+                    self._handle_command(parsed)
+                self.rx_bytes += len(data)
+                if self.clock is not None:
+                    self.clock.notify()  # _virtual_loop may be holding for these
             except Exception as e:
+                if not self.running:
+                    break
                 print(f"❌ Receive error: {e}")
                 time.sleep(0.1)
     
     def _simulation_loop(self):
         """Background thread for physics simulation"""
+        if self.clock is not None:
+            self._virtual_loop()
+            return
         while self.running:
-            self._update_physics()
+            now = time.time()
+            if now - self.last_physics_time >= self.physics_interval:
+                self._update_physics()
+                self.last_physics_time += self.physics_interval
+                if now - self.last_physics_time > self.physics_interval:
+                    self.last_physics_time = now  # fell behind, don't try to catch up
             
-            # Send periodic telemetry
-            if time.time() - self.last_telemetry_time > self.telemetry_interval:
+            # Send periodic (or subscribed) telemetry on its own schedule
+            interval = self.telemetry_interval
+            if interval is not None and now - self.last_telemetry_time >= interval:
                 self._send_telemetry()
-                self.last_telemetry_time = time.time()
+                self.last_telemetry_time += interval
+                if now - self.last_telemetry_time > interval:
+                    self.last_telemetry_time = now
             
-            time.sleep(0.1)
+            next_due = self.last_physics_time + self.physics_interval
+            if self.telemetry_interval is not None:
+                next_due = min(next_due, self.last_telemetry_time + self.telemetry_interval)
+            time.sleep(max(0.0, next_due - time.time()))
+    
+    def _virtual_loop(self):
+        """Virtual time: the next physics tick or telemetry frame is taken as soon as
+        the last one has been handled, and the shared clock jumps to its due time"""
+        clock = self.clock
+        while self.running:
+            hold = self.hold
+            if hold is not None and hold():
+                # Woken through the clock by our receive loop and by the Pi's protocol going idle
+                clock.wait_for(lambda: not self.running or not hold(), self.HOLD_RECHECK)
+                continue
+            physics_due = self.last_physics_time + self.physics_interval
+            interval = self.telemetry_interval
+            telemetry_due = None if interval is None else self.last_telemetry_time + interval
+            due = physics_due if telemetry_due is None else min(physics_due, telemetry_due)
+            until = self.run_until
+            if due > until:
+                clock.advance_to(until)
+                self.paused_at = until
+                clock.notify()  # for run_for()
+                clock.wait_for(lambda: not self.running or self.run_until != until)
+                continue
+            clock.advance_to(due)
+            if due == physics_due:
+                self._update_physics()
+                self.last_physics_time = due
+            else:
+                self._send_telemetry()
+                self.last_telemetry_time = due
+    
+    def run_for(self, seconds: float, timeout: Optional[float] = None) -> bool:
+        """Virtual time: simulate the next `seconds` and wait until the Pi has caught up
+        
+        Returns False if timeout (real seconds) expired first.
+        """
+        if self.clock is None:
+            raise RuntimeError("run_for() needs a virtual clock")
+        target = self.run_until = self.run_until + seconds
+        self.clock.notify()
+        # The loop only pauses after hold() has let it go, i.e. with the Pi caught up
+        self.clock.wait_for(lambda: not self.running or self.paused_at == target, timeout)
+        return self.running and self.paused_at == target
+    
+    def sync_with(self, protocol: EVProtocol):
+        """Virtual time in lockstep with an in-process EVProtocol on the other end of a pipe
+        
+        Each step waits until the Pi has handled every byte sent so far (frames
+        parsed, callbacks run, replies written) and every command it wrote has
+        been handled here, so a run with the same seed trips the same safety
+        rules at the same simulated times. Commands from other Pi threads (e.g.
+        setpoints) are handled at whichever step they arrive.
+        """
+        if not (isinstance(self.serial, PipeTransport) and isinstance(protocol.serial, PipeTransport)):
+            raise ValueError("lockstep needs both ends on a PipeTransport")
+        sim_end, pi_end, scheduler = self.serial, protocol.serial, protocol.tx_scheduler
+        
+        def caught_up():
+            return (protocol.rx_stats.bytes == sim_end.bytes_written and protocol.dispatcher.idle() and
+                    (scheduler is None or scheduler.idle()) and self.rx_bytes == pi_end.bytes_written)
+        
+        # Twice: a reply written while the first pass was looking further down shows up in the second
+        self.hold = lambda: not (caught_up() and caught_up())
     
     def start(self):
         """Start the simulator"""
@@ -290,14 +479,20 @@ class STM32Simulator:
         self.sim_thread = threading.Thread(target=self._simulation_loop, daemon=True)
         self.sim_thread.start()
         
-        print("✅ Simulator running. Press Ctrl+C to stop.")
-        print("=" * 50)
+        self._log("✅ Simulator running. Press Ctrl+C to stop.")
+        self._log("=" * 50)
     
     def stop(self):
         """Stop the simulator"""
         self.running = False
+        if self.clock is not None:
+            self.clock.notify()  # wake _virtual_loop / run_for()
+        # Let both threads finish their current read / tick before the port goes away
+        for thread in (self.rx_thread, self.sim_thread):
+            if thread is not None:
+                thread.join(timeout=1.0)
         self.serial.close()
-        print("\n👋 Simulator stopped")
+        self._log("\n👋 Simulator stopped")
     
     def print_status(self):
         """Print current state"""
@@ -334,3 +529,5 @@ if __name__ == "__main__":
         print(f"❌ Error: {e}")
         print("\nUsage: python3 stm32_simulator.py [port]")
         print("Example: python3 stm32_simulator.py /dev/ttyUSB0")
+        print("         python3 stm32_simulator.py pty                    (no socat needed)")
+        print("         python3 stm32_simulator.py tcp-listen://5555      (Pi: tcp://host:5555)")
@@ -0,0 +1,141 @@
+"""
+TX Scheduler Benchmark
+ESTOP latency while other threads flood the port with GET_TELEM polls and
+configuration commands, for the TxScheduler writer thread against the old
+direct write + flush from the calling thread. Uses a simulated UART that
+drains at the configured baud rate, so no serial port is needed.
+
+Usage:
+    python3 tx_scheduler_bench.py [baudrate] [estops]
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'First_version'))
+
+from porsche_main_application import EVProtocol, LatencyHistogram, MessageType
+
+
+class SimulatedUart:
+    """Serial stand-in that transmits at baudrate (8N1) from a driver buffer
+    
+    write() only blocks when the driver buffer is full, flush() blocks until
+    everything written has left the wire, out_waiting reports what's left.
+    Reads never return data.
+    """
+
+    def __init__(self, baudrate: int, buffer_size: int = 4096):
+        self.byte_time = 10 / baudrate
+        self.buffer_size = buffer_size
+        self.lock = threading.Lock()
+        self.busy_until = time.perf_counter()
+        self.estop_on_wire = []  # perf_counter() at which each ESTOP finished transmitting
+        self.bytes = 0
+        self.in_waiting = 0
+
+    @property
+    def out_waiting(self) -> int:
+        return max(0, int((self.busy_until - time.perf_counter()) / self.byte_time))
+
+    def write(self, data: bytes) -> int:
+        with self.lock:
+            now = time.perf_counter()
+            start = max(now, self.busy_until)
+            queued = (start - now) / self.byte_time
+            if queued > self.buffer_size:
+                time.sleep((queued - self.buffer_size) * self.byte_time)
+            offset = 0
+            while True:
+                index = data.find(b'ESTOP', offset)
+                if index < 0:
+                    break
+                self.estop_on_wire.append(start + (index + 6) * self.byte_time)
+                offset = index + 1
+            self.busy_until = start + len(data) * self.byte_time
+            self.bytes += len(data)
+        return len(data)
+
+    def flush(self):
+        delay = self.busy_until - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def read(self, size: int = 1) -> bytes:
+        time.sleep(0.05)
+        return b''
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def flood(protocol: EVProtocol, stop: threading.Event, msg_type: MessageType, params, interval: float):
+    while not stop.is_set():
+        protocol.send_message(msg_type, params)
+        time.sleep(interval)
+
+
+def measure(tx_mode: str, baudrate: int, estops: int):
+    uart = SimulatedUart(baudrate)
+    protocol = EVProtocol(uart, rx_mode='poll', tx_mode=tx_mode)
+    protocol.start()
+    stop = threading.Event()
+    flooders = [
+        threading.Thread(target=flood, args=(protocol, stop, MessageType.GET_TELEMETRY, None, 0.001)),
+        threading.Thread(target=flood, args=(protocol, stop, MessageType.GET_TELEMETRY, None, 0.001)),
+        threading.Thread(target=flood, args=(protocol, stop, MessageType.SET_MAX_CURRENT, {'MAX_THROTTLE': 80}, 0.02)),
+        threading.Thread(target=flood, args=(protocol, stop, MessageType.SET_CURRENT_LIMIT, {'LIMIT': 100}, 0.02)),
+    ]
+    for thread in flooders:
+        thread.start()
+
+    latency = LatencyHistogram()
+    try:
+        time.sleep(0.3)  # let the link saturate
+        for _ in range(estops):
+            seen = len(uart.estop_on_wire)
+            submitted = time.perf_counter()
+            protocol.send_message(MessageType.EMERGENCY_STOP)
+            deadline = submitted + 2.0
+            while len(uart.estop_on_wire) == seen and time.perf_counter() < deadline:
+                time.sleep(0.0002)
+            if len(uart.estop_on_wire) > seen:
+                latency.record(int((uart.estop_on_wire[seen] - submitted) * 1e9))
+            time.sleep(0.02)
+    finally:
+        stop.set()
+        for thread in flooders:
+            thread.join()
+        protocol.stop()
+    return latency.summary(), protocol.get_tx_stats(), uart.bytes
+
+
+def main():
+    baudrate = int(sys.argv[1]) if len(sys.argv) > 1 else 115200
+    estops = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    print("=" * 64)
+    print(f"📤 TX Scheduler Benchmark @ {baudrate} baud, {estops} ESTOPs under load")
+    print("=" * 64)
+    for tx_mode in EVProtocol.TX_MODES:
+        summary, stats, sent = measure(tx_mode, baudrate, estops)
+        print(f"\n[{tx_mode}]")
+        print(f"  send -> ESTOP on wire: p50 {summary['p50_us']:.0f} us | p90 {summary['p90_us']:.0f} us | "
+              f"p99 {summary['p99_us']:.0f} us | max {summary['max_us']:.0f} us")
+        print(f"  Bytes written:         {sent}")
+        if tx_mode == 'scheduled':
+            print(f"  Writes (batches):      {stats['batches']}  coalesced GET_TELEM: {stats['coalesced']}")
+            for name in ('estop', 'command', 'query'):
+                q = stats[name]['queue_latency']
+                print(f"  {name:<8} queue:        p50 {q['p50_us']:.0f} us | p99 {q['p99_us']:.0f} us "
+                      f"({stats[name]['written']} written)")
+    print("\n" + "=" * 64)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Shared fixtures: the STM32 simulator and the Pi side linked in-process by
+PipeTransport, so the suite needs no serial port, pty or network.
+"""
+
+import itertools
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'First_version'))
+sys.path.insert(0, os.path.join(ROOT, 'first_tests'))
+
+from porsche_main_application import (ConfigManager, EVController, EVProtocol, MessageFraming,
+                                      PipeTransport, VirtualClock)
+from stm32_simulator import STM32Simulator
+
+
+class RecordingSimulator(STM32Simulator):
+    """STM32Simulator that keeps the type of every command it handled"""
+
+    def __init__(self, *args, **kwargs):
+        self.commands = []
+        super().__init__(*args, **kwargs)
+
+    def _handle_command(self, msg):
+        self.commands.append(msg['type'])
+        super()._handle_command(msg)
+
+
+class ScriptedPeer(MessageFraming):
+    """Hand-driven STM32 end of a pipe: read what the Pi sent, answer as told"""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self._init_framing()
+        self.pending = []
+
+    def send(self, msg_type, params=None):
+        self.transport.write(self._encode_message(msg_type, params))
+
+    def expect(self, count=1, timeout=2.0):
+        """Next count messages from the Pi (fewer if the timeout runs out)"""
+        deadline = time.monotonic() + timeout
+        while len(self.pending) < count and time.monotonic() < deadline:
+            for frame in self.decoder.feed(self.transport.read_available()):
+                self.pending.append(self._parse_frame(frame))
+        taken, self.pending = self.pending[:count], self.pending[count:]
+        return taken
+
+
+_names = itertools.count()
+
+
+@pytest.fixture
+def pipe_name():
+    """Fresh pipe:// name (PipeTransport names are process-wide)"""
+    return f"test-{next(_names)}"
+
+
+@pytest.fixture
+def pipe_pair(pipe_name):
+    """(Pi end, peer end) of an in-memory link"""
+    pi_end, peer_end = PipeTransport.pair(pipe_name)
+    yield pi_end, peer_end
+    pi_end.close()
+    peer_end.close()
+
+
+@pytest.fixture
+def scripted_link(pipe_pair):
+    """Started EVProtocol on the Pi end and a ScriptedPeer on the other"""
+    pi_end, peer_end = pipe_pair
+    protocol = EVProtocol(pi_end)
+    protocol.start()
+    yield protocol, ScriptedPeer(peer_end)
+    protocol.stop()
+
+
+@pytest.fixture
+def simulator_link(pipe_name):
+    """Real-time simulator and a started EVProtocol on the other end of a pipe"""
+    simulator = RecordingSimulator(f"pipe://{pipe_name}", verbose=False, seed=1)
+    simulator.start()
+    protocol = EVProtocol(f"pipe://{pipe_name}")
+    protocol.start()
+    yield simulator, protocol
+    protocol.stop()
+    simulator.stop()
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    """ConfigManager in tmp_path with the black box off, plus any overrides"""
+    def make(**overrides):
+        config = ConfigManager(str(tmp_path / 'ev_config.json'))
+        config.set('blackbox_enabled', False)
+        for key, value in overrides.items():
+            config.set(key, value)
+        return config
+    return make
+
+
+@pytest.fixture
+def lockstep(pipe_name, make_config, tmp_path):
+    """Start an EVController and the simulator in virtual-time lockstep
+
+    Returns a factory taking config overrides; each simulator.run_for(seconds)
+    returns with every frame and command on both sides handled.
+    """
+    started = []
+
+    def start(**overrides):
+        clock = VirtualClock()
+        simulator = RecordingSimulator(f"pipe://{pipe_name}", verbose=False, clock=clock, seed=1)
+        simulator.start()
+        controller = EVController(f"pipe://{pipe_name}", clock=clock, config=make_config(**overrides),
+                                  log_dir=str(tmp_path / 'logs'))
+        simulator.sync_with(controller.protocol)
+        started.append((controller, simulator))
+        return controller, simulator
+
+    yield start
+    for controller, simulator in started:
+        controller.shutdown()
+        simulator.stop()
@@ -0,0 +1,72 @@
+"""FAULT -> ESTOP: the receive-thread fast path and the controller's fallback"""
+
+import threading
+
+from porsche_main_application import MessageType
+
+
+def _collect_faults(protocol):
+    received = []
+    arrived = threading.Event()
+
+    def on_fault(msg):
+        received.append(msg)
+        arrived.set()
+    protocol.register_callback('FAULT', on_fault)
+    return received, arrived
+
+
+def test_fast_path_writes_estop(scripted_link):
+    protocol, peer = scripted_link
+    protocol.estop_on_fault = True
+    received, arrived = _collect_faults(protocol)
+
+    peer.send('FAULT', {'FAULT': 'OVERCURRENT'})
+
+    assert [msg['type'] for msg in peer.expect()] == ['ESTOP']
+    assert arrived.wait(2.0)
+    assert received[0]['estop_sent']
+    assert protocol.get_rx_stats()['fast_estops'] == 1
+
+
+def test_failed_fast_path_write_is_not_reported_sent(scripted_link, monkeypatch):
+    protocol, peer = scripted_link
+    protocol.estop_on_fault = True
+    received, arrived = _collect_faults(protocol)
+    write = protocol.serial.write
+    failures = [OSError("write failed")]
+
+    def flaky_write(data):
+        if failures:
+            raise failures.pop()
+        return write(data)
+    monkeypatch.setattr(protocol.serial, 'write', flaky_write)
+
+    peer.send('FAULT', {'FAULT': 'OVERCURRENT'})
+
+    assert arrived.wait(2.0)
+    assert 'estop_sent' not in received[0]
+    assert protocol.get_rx_stats()['fast_estops'] == 0
+
+
+def test_controller_estops_once_on_fault(lockstep):
+    controller, simulator = lockstep(emergency_stop_on_fault=True)
+    controller.protocol.send_message(MessageType.INJECT_FAULT, {'FAULT': 'OVERTEMP'})
+    assert simulator.run_for(0.5, timeout=10.0)
+
+    assert 'OVERTEMP' in controller.faults
+    assert simulator.commands.count('ESTOP') == 1
+    assert controller.protocol.get_rx_stats()['fast_estops'] == 1
+
+
+def test_controller_falls_back_when_fast_path_write_fails(lockstep, monkeypatch):
+    controller, simulator = lockstep(emergency_stop_on_fault=True)
+    protocol = controller.protocol
+    monkeypatch.setattr(protocol, '_fast_estop', lambda read_ns: False)  # the write failed
+
+    protocol.send_message(MessageType.INJECT_FAULT, {'FAULT': 'OVERTEMP'})
+    assert simulator.run_for(0.5, timeout=10.0)
+
+    assert 'OVERTEMP' in controller.faults
+    assert simulator.commands.count('ESTOP') == 1
+    assert protocol.get_rx_stats()['fast_estops'] == 0
@@ -0,0 +1,77 @@
+"""Frame decoding and resynchronisation (FrameDecoder, binary framing, line noise on a live link)"""
+
+import time
+
+from porsche_main_application import BinaryCodec, FrameDecoder, MessageFraming, TelemetrySample
+
+
+def test_frame_split_across_reads():
+    decoder = FrameDecoder()
+    assert decoder.feed(b'<DATA:RPM=1') == []
+    assert decoder.feed(b'.0;TEMP=2>') == [b'<DATA:RPM=1.0;TEMP=2>']
+
+
+def test_garbage_between_frames_is_dropped():
+    decoder = FrameDecoder()
+    assert decoder.feed(b'xx<ACK:ACK=A>junk<ACK:ACK=B>') == [b'<ACK:ACK=A>', b'<ACK:ACK=B>']
+    assert decoder.stats()['dropped_bytes'] == 6
+
+
+def test_truncated_frame_resyncs_on_next_start():
+    decoder = FrameDecoder()
+    assert decoder.feed(b'<DATA:RPM=1<ACK:ACK=X>') == [b'<ACK:ACK=X>']
+    assert decoder.stats()['resyncs'] == 1
+
+
+def test_oversized_partial_frame_is_discarded():
+    decoder = FrameDecoder(max_frame_size=32)
+    decoder.feed(b'<' + b'A' * 20)
+    decoder.feed(b'A' * 20)
+    assert decoder.feed(b'A><ACK:ACK=X>') == [b'<ACK:ACK=X>']
+    stats = decoder.stats()
+    assert stats['overflows'] == 1
+    assert stats['buffered'] == 0
+
+
+def test_binary_crc_error_skips_only_the_bad_frame():
+    codec = BinaryCodec()
+    bad = bytearray(codec.encode_telemetry(1, 2, 3, 4, 5))
+    bad[-1] ^= 0xFF
+    good = codec.encode_telemetry(6, 7, 8, 9, 10)
+    decoder = FrameDecoder(binary=True)
+
+    frames = decoder.feed(bytes(bad) + b'<ACK:ACK=Y>' + good)
+
+    assert frames == [b'<ACK:ACK=Y>', good]
+    assert decoder.stats()['crc_errors'] == 1
+    framing = MessageFraming()
+    framing._init_framing()
+    parsed = framing._parse_frame(good)
+    assert parsed['type'] == 'DATA'
+    assert tuple(parsed['data'][:5]) == (6.0, 7.0, 8.0, 9.0, 10.0)
+
+
+def test_binary_text_frame_split_across_reads():
+    codec = BinaryCodec()
+    frame = codec.encode_text('<ACK:ACK=SET_MODE;ID=3>')
+    decoder = FrameDecoder(binary=True)
+    assert decoder.feed(frame[:6]) == []
+    assert decoder.feed(frame[6:]) == [frame]
+
+
+def test_protocol_resyncs_after_line_noise(simulator_link):
+    simulator, protocol = simulator_link
+    assert protocol.unsubscribe_telemetry()  # no pushed frames from here on
+    received = []
+    protocol.register_callback('DATA', received.append)
+
+    simulator.serial.write(b'\x00\xff<DATA:RPM=\x8012;noise')
+    simulator._send_telemetry()
+    deadline = time.monotonic() + 2.0
+    while not received and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert len(received) == 1
+    assert isinstance(received[0]['data'], TelemetrySample)
+    assert received[0]['data'].voltage is not None
+    assert protocol.get_rx_stats()['decoder']['dropped_bytes'] > 0
@@ -0,0 +1,87 @@
+"""Log round-trips: DataLogger formats, the black box ring and wire captures"""
+
+import os
+
+import pytest
+
+import ev_logging
+from porsche_main_application import BlackBoxRecorder, ReplaySource, TelemetrySample, WireCapture
+from replay_log_formats import make_samples, replay, write_session
+
+
+FORMATS = [
+    pytest.param({}, id='csv-gzip'),
+    pytest.param({'log_compression': None}, id='csv'),
+    pytest.param({'log_format': 'columnar'}, id='columnar-gzip'),
+    pytest.param({'log_format': 'columnar', 'log_compression': 'zstd'}, id='columnar-zstd',
+                 marks=pytest.mark.skipif(ev_logging.zstandard is None, reason="zstandard not installed")),
+]
+
+
+def _rounded(rows):
+    return [tuple(round(v, 4) for v in row[:5]) for row in rows]
+
+
+@pytest.mark.parametrize('overrides', FORMATS)
+def test_data_logger_replays_unchanged(tmp_path, overrides):
+    segments = write_session(str(tmp_path), overrides)
+    assert segments
+
+    received = []
+    for path in segments:
+        received += replay(path)
+
+    assert _rounded(received) == _rounded(make_samples())
+
+
+def test_unknown_log_extension_is_rejected(tmp_path):
+    path = tmp_path / 'session.bin'
+    path.write_bytes(b'')
+    with pytest.raises(ValueError):
+        ReplaySource.from_file(str(path))
+
+
+def test_blackbox_keeps_samples_stamped_at_zero(tmp_path):
+    recorder = BlackBoxRecorder(str(tmp_path), minutes=1, rate_hz=0.1)  # 6 slots
+    for i in range(3):
+        recorder.record(TelemetrySample(1000.0 + i, 40.0, 10.0, 48.0, 90.0, 20, i / 10))
+    recorder.close()
+
+    info, records = BlackBoxRecorder.load(recorder.path)
+
+    assert info['samples'] == 3
+    assert [record[0] for record in records] == [0, 100_000_000, 200_000_000]
+    assert [record[1] for record in records] == [1000.0, 1001.0, 1002.0]
+
+
+def test_blackbox_ring_wraps_and_snapshots_in_order(tmp_path):
+    recorder = BlackBoxRecorder(str(tmp_path), minutes=1, rate_hz=0.1)
+    for i in range(10):
+        recorder.record(TelemetrySample(float(i), None, None, None, None, None, float(i)))
+    snapshot = tmp_path / 'snapshot.bin'
+    snapshot.write_bytes(recorder.snapshot())
+    recorder.close()
+
+    for path in (recorder.path, str(snapshot)):
+        info, records = BlackBoxRecorder.load(path)
+        assert info['samples'] == 6
+        assert [record[1] for record in records] == [4.0, 5.0, 6.0, 7.0, 8.0, 9.0]
+        assert all(record[6] == -1 for record in records)  # no throttle
+
+
+def test_wire_capture_round_trip(tmp_path):
+    path = str(tmp_path / f"link{WireCapture.EXTENSION}")
+    capture = WireCapture(path)
+    chunks = [(WireCapture.TX, b'<GET_TELEM>'),
+              (WireCapture.RX, b'<DATA:RPM=1200.0;TEMP=41.5;CURRENT=12.0;VOLTAGE=48.0;SOC=80.0><DATA:RPM=12'),
+              (WireCapture.RX, b'50.0;TEMP=42.0;CURRENT=13.0;VOLTAGE=47.5;SOC=79.5>' + b'x' * 70000)]
+    for direction, data in chunks:
+        capture.record(direction, data)
+    capture.close()
+
+    _, records = WireCapture.load(path)
+    assert [(direction, data) for direction, _, data in records] == chunks
+    assert os.path.getsize(path) == capture.bytes + WireCapture.HEADER.size + 3 * WireCapture.RECORD.size
+
+    # One DATA frame completes per RX chunk, the second one across the chunk boundary
+    assert replay(path) == [(1200.0, 41.5, 12.0, 48.0, 80.0), (1250.0, 42.0, 13.0, 47.5, 79.5)]
@@ -0,0 +1,59 @@
+"""Replay regression: a recorded session through the full EVController pipeline"""
+
+import time
+
+from porsche_main_application import BinaryCodec, ReplaySource
+from replay_regression import ReplayController
+
+
+# Temperature crosses the OVERHEAT threshold (80) at sample 21; the STM32
+# reports a fault right after sample 10
+EXPECTED_TIMELINE = [['STM32:OVERCURRENT', 10], ['ESTOP', 10], ['OVERHEAT', 21]]
+
+
+def session_frames(codec=None):
+    """(seconds, wire bytes) of the session, binary-framed when a codec is given"""
+    frames = []
+    for i in range(30):
+        values = (3000.0 + i, 85.0 if i >= 20 else 60.0 + i, 20.0, 48.0, 90.0, None)
+        frames.append((i * 0.1, ReplaySource.telemetry_frame(values, codec)))
+        if i == 9:
+            fault = '<FAULT:FAULT=OVERCURRENT>'
+            frames.append((i * 0.1 + 0.05, codec.encode_text(fault) if codec else fault.encode('utf-8')))
+    return frames
+
+
+def run_replay(source, make_config, log_dir):
+    """What replay_regression's main() does at max speed; returns the controller"""
+    controller = None
+    source.hold = lambda: controller is None or controller.protocol.dispatcher.backlog() > 128
+    controller = ReplayController(source, make_config(), str(log_dir))
+    try:
+        source.wait()
+        deadline = time.monotonic() + 10.0
+        while controller.protocol.dispatcher.backlog() and time.monotonic() < deadline:
+            time.sleep(0.001)
+    finally:
+        controller.shutdown()
+    return controller
+
+
+def test_replay_frame_dump(tmp_path, make_config):
+    session = tmp_path / 'session.frames'
+    session.write_text(''.join(f"{t:.2f} {frame.decode('utf-8')}\n" for t, frame in session_frames()))
+
+    controller = run_replay(ReplaySource.from_file(str(session), speed=None), make_config, tmp_path / 'logs')
+
+    assert controller.samples == 30
+    assert controller.timeline == EXPECTED_TIMELINE
+    assert controller.faults == {'OVERCURRENT', 'OVERHEAT'}
+
+
+def test_binary_replay_matches_ascii(tmp_path, make_config):
+    source = ReplaySource(session_frames(BinaryCodec()), speed=None, binary_rx=True)
+
+    controller = run_replay(source, make_config, tmp_path / 'logs')
+
+    assert controller.protocol.get_rx_stats()['decoder']['binary_frames'] == 31
+    assert controller.samples == 30
+    assert controller.timeline == EXPECTED_TIMELINE
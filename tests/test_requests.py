@@ -0,0 +1,65 @@
+"""Request IDs: ACK/NACK correlation, timeouts and the telemetry subscribe answer"""
+
+from porsche_main_application import MessageType
+
+
+def test_simulator_acks_command(simulator_link):
+    simulator, protocol = simulator_link
+    assert protocol.request(MessageType.RESET_FAULT, timeout=2.0)
+    assert 'RESET_FAULT' in simulator.commands
+
+
+def test_simulator_nacks_invalid_command(simulator_link):
+    _, protocol = simulator_link
+    pending = protocol.send_request(MessageType.SET_MAX_CURRENT)
+    assert not pending.wait(2.0)
+    assert pending.response['type'] == 'NACK'
+    assert pending.response['data']['CMD'] == 'SET_MAX_CURRENT'
+
+
+def test_responses_out_of_order_complete_by_id(scripted_link):
+    protocol, peer = scripted_link
+    first = protocol.send_request(MessageType.SET_MAX_CURRENT, {'CURRENT': 100})
+    second = protocol.send_request(MessageType.SET_MAX_CURRENT, {'CURRENT': 120})
+    sent = peer.expect(2)
+    assert [msg['data']['ID'] for msg in sent] == [first.id, second.id]
+
+    peer.send('ACK', {'ACK': 'SET_MAX_CURRENT', 'ID': second.id})
+    peer.send('NACK', {'CMD': 'SET_MAX_CURRENT', 'REASON': 'LIMIT', 'ID': first.id})
+
+    assert second.wait(2.0)
+    assert not first.wait(2.0)
+    assert first.response['type'] == 'NACK'
+    assert first.response['data']['REASON'] == 'LIMIT'
+    assert protocol.get_rx_stats()['pending_requests'] == 0
+
+
+def test_response_with_unknown_id_is_ignored(scripted_link):
+    protocol, peer = scripted_link
+    pending = protocol.send_request(MessageType.RESET_FAULT)
+    peer.expect()
+
+    peer.send('ACK', {'ACK': 'GET_STATUS', 'ID': pending.id + 100})
+    assert not pending.wait(0.2)
+    assert not pending.done()
+
+    peer.send('ACK', {'ACK': 'RESET_FAULT', 'ID': pending.id})
+    assert pending.wait(2.0)
+
+
+def test_unanswered_request_times_out(scripted_link):
+    protocol, peer = scripted_link
+    assert not protocol.request(MessageType.RESET_FAULT, timeout=0.1)
+    assert len(peer.expect()) == 1
+    assert protocol.get_rx_stats()['pending_requests'] == 0
+
+
+def test_subscribe_nacked(simulator_link):
+    _, protocol = simulator_link
+    assert protocol.subscribe_telemetry(0, timeout=2.0) is False
+
+
+def test_subscribe_unanswered(scripted_link):
+    protocol, _ = scripted_link
+    assert protocol.subscribe_telemetry(10, timeout=0.1) is None
+    assert protocol.get_rx_stats()['pending_requests'] == 0